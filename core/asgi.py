@@ -12,5 +12,13 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+# desliga as conexões persistentes (CONN_MAX_AGE) em core/settings.py
+os.environ.setdefault('DJANGO_ASGI', '1')
 
 application = get_asgi_application()
+
+# no ASGI as views síncronas rodam em outra thread, então a conexão com o
+# banco aberta aqui não seria reaproveitada; aquece só URLs e models
+from core.warmup import warm_up  # noqa: E402
+
+warm_up(connect_db=False)
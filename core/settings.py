@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 '''
 import os
+from importlib.util import find_spec
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -52,11 +53,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'standard.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'standard.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -97,6 +100,12 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# no ASGI (DJANGO_ASGI=1, definido pelo core/asgi.py) as views sincronas rodam
+# em threads do executor do asgiref e o request_finished nao fecha as conexoes
+# delas; conexoes persistentes ficariam abertas para sempre, entao cada
+# requisicao abre e fecha a sua
+SERVING_ASGI = os.getenv('DJANGO_ASGI', 'false').lower() in ('1', 'true', 'yes')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.mysql',
@@ -105,6 +114,9 @@ DATABASES = {
         'PASSWORD': os.getenv('DBPASSWORD'),
         'HOST': os.getenv('HOST'),
         'PORT': os.getenv('PORT'),
+        # conexões persistentes por thread, validadas antes de reutilizar
+        'CONN_MAX_AGE': 0 if SERVING_ASGI else int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -146,3 +158,85 @@ USE_TZ = True
 STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Upload em partes (resumable) de imagens de produtos
+UPLOAD_SESSIONS_DIR = Path(os.getenv('UPLOAD_SESSIONS_DIR', BASE_DIR / 'tmp' / 'upload_sessions'))
+UPLOAD_SESSION_MAX_SIZE = int(os.getenv('UPLOAD_SESSION_MAX_SIZE', 50 * 1024 * 1024))
+# sessoes sem atividade (updated_at) ha mais que isso sao removidas por purge_upload_sessions
+UPLOAD_SESSION_EXPIRE_HOURS = int(os.getenv('UPLOAD_SESSION_EXPIRE_HOURS', 24))
+
+# Feed de alteracoes: segura as alteracoes mais recentes por alguns segundos
+# para nao pular linhas de transacoes que ainda nao confirmaram. Precisa ser
+# maior que WRITE_TRANSACTION_MAX_SECONDS, a duracao maxima das escritas no
+# catalogo (standard/transactions.py desfaz as que passarem disso).
+CHANGE_FEED_SETTLE_SECONDS = int(os.getenv('CHANGE_FEED_SETTLE_SECONDS', 30))
+WRITE_TRANSACTION_MAX_SECONDS = int(os.getenv('WRITE_TRANSACTION_MAX_SECONDS', 20))
+
+# Idempotency-Key (standard/idempotency.py)
+IDEMPOTENCY_STORE = os.getenv('IDEMPOTENCY_STORE', 'standard.idempotency.DatabaseIdempotencyStore')
+IDEMPOTENCY_CACHE_ALIAS = os.getenv('IDEMPOTENCY_CACHE_ALIAS', 'default')
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', 24 * 60 * 60))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', 60))
+IDEMPOTENCY_WAIT_SECONDS = int(os.getenv('IDEMPOTENCY_WAIT_SECONDS', 10))
+
+# Lote de operacoes (/api/v1/batch/)
+BATCH_MAX_OPERATIONS = int(os.getenv('BATCH_MAX_OPERATIONS', 5000))
+BATCH_CHUNK_SIZE = int(os.getenv('BATCH_CHUNK_SIZE', 500))
+
+# Profiling sob demanda (standard/profiling.py); desligado = zero overhead
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+PROFILING_HEADER = 'X-Profile'
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0.0))
+PROFILING_MODE = os.getenv('PROFILING_MODE', 'sample')  # 'sample' ou 'cprofile'
+PROFILING_INTERVAL_MS = float(os.getenv('PROFILING_INTERVAL_MS', 5))
+PROFILING_DIR = Path(os.getenv('PROFILING_DIR', BASE_DIR / 'tmp' / 'profiles'))
+PROFILING_MAX_FILES = int(os.getenv('PROFILING_MAX_FILES', 50))
+
+# Admin: acima deste numero de linhas a changelist sem filtros usa a
+# contagem estimada das estatisticas da tabela (standard/admin.py)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(os.getenv('ADMIN_ESTIMATED_COUNT_THRESHOLD', 100_000))
+
+# Produtos relacionados (products/related.py): tamanho da lista por produto e
+# quantos produtos de cada categoria entram como candidatos
+RELATED_PRODUCTS_TOP_K = int(os.getenv('RELATED_PRODUCTS_TOP_K', 12))
+RELATED_PRODUCTS_CANDIDATES_PER_CATEGORY = int(os.getenv('RELATED_PRODUCTS_CANDIDATES_PER_CATEGORY', 200))
+
+# Pedidos do checkout: fila write-behind (products/orders.py, standard/writebehind.py)
+ORDER_QUEUE_SPOOL_DIR = Path(os.getenv('ORDER_QUEUE_SPOOL_DIR', BASE_DIR / 'tmp' / 'order_spool'))
+ORDER_QUEUE_MAX_BATCH = int(os.getenv('ORDER_QUEUE_MAX_BATCH', 200))
+ORDER_QUEUE_FLUSH_SECONDS = float(os.getenv('ORDER_QUEUE_FLUSH_SECONDS', 1.0))
+ORDER_QUEUE_FSYNC = os.getenv('ORDER_QUEUE_FSYNC', 'true').lower() in ('1', 'true', 'yes')
+# falhas de um mesmo pedido antes de ir para o dead-letter (<spool_dir>/orders.dead)
+ORDER_QUEUE_MAX_ATTEMPTS = int(os.getenv('ORDER_QUEUE_MAX_ATTEMPTS', 5))
+
+# Limite por cliente (token bucket) e descarte de carga (standard/throttling.py);
+# renderers JSON/MessagePack (standard/renderers.py)
+REST_FRAMEWORK = {
+    'DEFAULT_THROTTLE_CLASSES': ['standard.throttling.TokenBucketThrottle'],
+    'DEFAULT_THROTTLE_RATES': {
+        'checkout': os.getenv('THROTTLE_CHECKOUT_RATE', '30/min'),
+        'product_list': os.getenv('THROTTLE_PRODUCT_LIST_RATE', '300/min'),
+    },
+    'DEFAULT_RENDERER_CLASSES': [
+        'standard.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ] + (['standard.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+    # quantos proxies confiaveis na frente da aplicacao (X-Forwarded-For)
+    'NUM_PROXIES': int(os.environ['NUM_PROXIES']) if os.getenv('NUM_PROXIES') else None,
+}
+THROTTLE_CACHE_ALIAS = os.getenv('THROTTLE_CACHE_ALIAS', 'default')
+LOAD_SHEDDING_LIMITS = {
+    'db': int(os.getenv('LOAD_SHEDDING_DB_MAX_IN_FLIGHT', 16)),
+}
+LOAD_SHEDDING_RETRY_AFTER = int(os.getenv('LOAD_SHEDDING_RETRY_AFTER', 1))
+
+# Compressao das respostas (standard/compression.py); brotli so se instalado
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 5))
+
+# Entrega de MEDIA_ROOT por standard.views.serve_media (standard/media.py).
+# MEDIA_SENDFILE_BACKEND: '' (o proprio Django entrega), 'nginx' (X-Accel-Redirect
+# para MEDIA_SENDFILE_NGINX_PREFIX, uma location internal) ou 'xsendfile'.
+MEDIA_SERVE = os.getenv('MEDIA_SERVE', 'true').lower() in ('1', 'true', 'yes')
+MEDIA_SENDFILE_BACKEND = os.getenv('MEDIA_SENDFILE_BACKEND', '')
+MEDIA_SENDFILE_NGINX_PREFIX = os.getenv('MEDIA_SENDFILE_NGINX_PREFIX', '/protected-media/')
+MEDIA_CACHE_MAX_AGE = int(os.getenv('MEDIA_CACHE_MAX_AGE', 3600))
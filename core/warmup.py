@@ -0,0 +1,87 @@
+'''
+  Aquecimento do worker na subida, chamado por core/wsgi.py e core/asgi.py.
+
+  Sem isso, a primeira requisicao de cada worker paga: import e resolucao das
+  URLs (products/urls.py + DefaultRouter), os caches de _meta dos models
+  (consultados pelos serializers do DRF a cada instancia), carga dos
+  templates/renderers e a conexao com o banco. So vale aquecer o que e
+  compartilhado pelo processo: os .fields de um serializer ficam na
+  instancia e seriam construidos de novo na requisicao.
+
+  DJANGO_WARMUP=0 desliga tudo. A conexao com o banco so e aberta com
+  DJANGO_WARMUP_DB=1: com gunicorn --preload o core.wsgi e importado no
+  master, e os workers criados por fork herdariam (e dividiriam) o mesmo
+  socket, que o CONN_MAX_AGE mantem aberto. Ligue apenas sem --preload, quando
+  cada worker importa o core.wsgi depois do fork.
+'''
+import logging
+import os
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.template.loader import get_template
+from django.urls import URLPattern, URLResolver, get_resolver
+from django.utils import translation
+from rest_framework.renderers import JSONRenderer
+
+logger = logging.getLogger(__name__)
+
+
+def _iter_patterns(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _iter_patterns(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern):
+            yield pattern
+
+
+def warm_urls():
+    resolver = get_resolver()
+    # força o _populate() (reverse_dict) e o import de todas as views
+    resolver.reverse_dict
+    return sum(1 for _ in _iter_patterns(resolver.url_patterns))
+
+
+def warm_models():
+    '''
+      Monta os caches de _meta de todos os models: campos, relacoes
+      reversas e o mapa nome -> campo usado pelo get_field().
+    '''
+    models = apps.get_models(include_auto_created=True)
+    for model in models:
+        opts = model._meta
+        opts.get_fields(include_hidden=True)
+        opts.concrete_fields
+        opts.related_objects
+        opts._forward_fields_map
+        opts.fields_map
+    return len(models)
+
+
+def warm_renderers():
+    JSONRenderer().render({'warmup': True})
+    get_template('rest_framework/api.html')
+    translation.activate(settings.LANGUAGE_CODE)
+    translation.deactivate()
+
+
+def warm_database():
+    for alias in connections:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            logger.warning('Warm-up: banco "%s" indisponível na subida do worker.', alias, exc_info=True)
+
+
+def warm_up(connect_db=True):
+    if os.getenv('DJANGO_WARMUP', '1') == '0':
+        return
+
+    urls = warm_urls()
+    models = warm_models()
+    warm_renderers()
+    if connect_db and os.getenv('DJANGO_WARMUP_DB', '0') == '1':
+        warm_database()
+
+    logger.info('Warm-up concluído: %d rotas, %d models.', urls, models)
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_wsgi_application()
+
+# constrói URLs e metadados dos models (e, com DJANGO_WARMUP_DB=1, a conexão com o banco)
+# antes da primeira requisição
+from core.warmup import warm_up  # noqa: E402
+
+warm_up()
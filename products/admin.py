@@ -1,11 +1,22 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
 
-from .models import Product, Category, ProductCategory, ProductImage
+from standard.admin import (
+    BatchedListEditableMixin,
+    BoundedTransactionAdminMixin,
+    DateHierarchyListFilter,
+    EstimatedCountPaginator,
+    SoftDeleteAdminMixin,
+    SoftDeleteInlineFormSet,
+)
+
+from .models import Product, Category, ProductCategory, ProductImage, Order, OrderItem
+from .related import mark_dirty
 
 
 class ProductImageInline(admin.TabularInline):
     model = ProductImage
+    formset = SoftDeleteInlineFormSet
     extra = 1
     fields = ('image', 'alt_text', 'image_url')
     readonly_fields = ('image_url',)
@@ -22,25 +33,88 @@ class ProductCategoryInline(admin.TabularInline):
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(BoundedTransactionAdminMixin, SoftDeleteAdminMixin, BatchedListEditableMixin, admin.ModelAdmin):
+    '''
+      Pensado para tabelas com milhoes de produtos: contagem estimada sem
+      filtros, filtros de data por intervalo nos indices de created_at e
+      updated_at, sem o COUNT(*) total ao filtrar e sem carregar a descricao
+      na changelist/autocomplete.
+    '''
     list_display = ('name', 'price', 'stock', 'is_in_stock_display', 'created_at', 'updated_at')
-    list_filter = ('created_at', 'updated_at')
+    list_filter = (('created_at', DateHierarchyListFilter), 'updated_at', ('deleted_at', admin.EmptyFieldListFilter))
     search_fields = ('name', 'description')
     ordering = ('name',)
     inlines = (ProductCategoryInline, ProductImageInline)
     list_editable = ('price', 'stock')
-
-    @admin.display(boolean=True, description=_('In stock'))
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    CHANGELIST_COLUMNS = ('id', 'name', 'price', 'stock', 'created_at', 'updated_at')
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        match = request.resolver_match
+        url_name = match.url_name if match else None
+        if url_name == 'autocomplete':
+            return queryset.only('id', 'name')
+        if url_name == f'{self.opts.app_label}_{self.opts.model_name}_changelist':
+            return queryset.only(*self.CHANGELIST_COLUMNS)
+        return queryset
+
+    @admin.display(boolean=True, description=_('In stock'), ordering='stock')
     def is_in_stock_display(self, obj):
         return obj.is_in_stock()
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        changed = set()
+        for formset in formsets:
+            if formset.model is ProductCategory:
+                for category_form in formset.forms:
+                    if category_form.has_changed() or formset._should_delete_form(category_form):
+                        changed.update(filter(None, (
+                            category_form.initial.get('category'),
+                            getattr(category_form.cleaned_data.get('category'), 'pk', None),
+                        )))
+        if changed:
+            mark_dirty([form.instance.pk], changed)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        mark_dirty(category_ids=obj.categories.values_list('category_id', flat=True))
+
+    def delete_queryset(self, request, queryset):
+        category_ids = set(ProductCategory.objects.filter(product__in=queryset).values_list('category_id', flat=True))
+        super().delete_queryset(request, queryset)
+        mark_dirty(category_ids=category_ids)
+
 
 @admin.register(Category)
-class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('name', 'description', 'created_at', 'updated_at')
+class CategoryAdmin(BoundedTransactionAdminMixin, SoftDeleteAdminMixin, admin.ModelAdmin):
+    list_display = ('name', 'parent', 'description', 'created_at', 'updated_at')
     search_fields = ('name', 'description')
     ordering = ('name',)
-    list_filter = ('created_at', 'updated_at')
+    list_filter = ('created_at', 'updated_at', ('deleted_at', admin.EmptyFieldListFilter))
+    autocomplete_fields = ('parent',)
+
+    def get_deleted_objects(self, objs, request):
+        # como na API: subcategorias vivas precisam ser movidas ou removidas antes
+        objs = list(objs)
+        deleted, model_count, perms_needed, _protected = super().get_deleted_objects(objs, request)
+        protected = [
+            str(child) for child in
+            Category.objects.alive().filter(parent__in=objs).exclude(id__in=[obj.pk for obj in objs])
+        ]
+        return deleted, model_count, perms_needed, protected
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        mark_dirty(category_ids=[obj.pk])
+
+    def delete_queryset(self, request, queryset):
+        category_ids = list(queryset.values_list('id', flat=True))
+        super().delete_queryset(request, queryset)
+        mark_dirty(category_ids=category_ids)
 
 
 @admin.register(ProductCategory)
@@ -50,12 +124,27 @@ class ProductCategoryAdmin(admin.ModelAdmin):
     list_filter = ('created_at', 'updated_at')
     autocomplete_fields = ('product', 'category')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        products = {obj.product_id, form.initial.get('product')}
+        categories = {obj.category_id, form.initial.get('category')}
+        mark_dirty(filter(None, products), filter(None, categories))
+
+    def delete_model(self, request, obj):
+        mark_dirty([obj.product_id], [obj.category_id])
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        links = list(queryset.values_list('product_id', 'category_id'))
+        mark_dirty({p for p, _ in links}, {c for _, c in links})
+        super().delete_queryset(request, queryset)
+
 
 @admin.register(ProductImage)
-class ProductImageAdmin(admin.ModelAdmin):
+class ProductImageAdmin(BoundedTransactionAdminMixin, SoftDeleteAdminMixin, admin.ModelAdmin):
     list_display = ('product', 'alt_text', 'image_url', 'created_at', 'updated_at')
     search_fields = ('product__name', 'alt_text')
-    list_filter = ('created_at', 'updated_at')
+    list_filter = ('created_at', 'updated_at', ('deleted_at', admin.EmptyFieldListFilter))
     autocomplete_fields = ('product',)
     fields = ('product', 'image', 'alt_text', 'image_url')
     readonly_fields = ('image_url',)
@@ -63,3 +152,21 @@ class ProductImageAdmin(admin.ModelAdmin):
     @admin.display(description=_('Image URL'))
     def image_url(self, obj):
         return obj.get_image_url()
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    fields = ('product', 'name', 'unit_price', 'qty', 'subtotal')
+    readonly_fields = fields
+    can_delete = False
+
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'customer_name', 'total_value', 'status', 'created_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('id', 'customer_name')
+    readonly_fields = ('customer_name', 'notes', 'total_value', 'created_at')
+    fields = ('status', 'customer_name', 'notes', 'total_value', 'created_at')
+    inlines = (OrderItemInline,)
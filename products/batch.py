@@ -0,0 +1,306 @@
+'''
+  Lote de operacoes (create/update/delete) sobre produtos e categorias.
+
+  1. carrega de uma vez os alvos de update/delete e as categorias referenciadas
+     (uma query para produtos e uma para categorias, para o lote inteiro);
+  2. valida cada item com os serializers de sempre, usando essas consultas, e
+     depois o lote em conjunto (ciclos entre itens, parent ou categoria
+     removidos por outro item);
+  3. aplica os itens validos em statements bulk, em blocos de BATCH_CHUNK_SIZE.
+
+  Tudo roda na mesma transacao e as linhas carregadas ficam travadas
+  (select_for_update) ate o fim, para que uma escrita concorrente nao seja
+  sobrescrita com valores lidos antes dela. Cada update grava so os campos
+  que o proprio item enviou.
+'''
+import uuid
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import status
+
+from standard.transactions import bounded_atomic
+
+from .models import Category, CategoryClosure, Product, ProductCategory, ProductImage
+from .related import mark_dirty
+from .serializers import ProductWriteSerializer
+from .serializers_batch import BatchCategorySerializer
+
+
+class BatchItem:
+    __slots__ = ('index', 'op', 'resource', 'id', 'data', 'instance', 'validated', 'errors')
+
+    def __init__(self, index, op, resource, id=None, data=None):
+        self.index = index
+        self.op = op
+        self.resource = resource
+        self.id = id
+        self.data = data or {}
+        self.instance = None
+        self.validated = None
+        self.errors = None
+
+    def result(self, applied):
+        if self.errors:
+            return {'index': self.index, 'status': status.HTTP_400_BAD_REQUEST, 'errors': self.errors}
+        if not applied:
+            return {
+                'index': self.index,
+                'status': status.HTTP_424_FAILED_DEPENDENCY,
+                'errors': {'detail': 'Não aplicado: outro item do lote falhou.'},
+            }
+        code = {
+            'create': status.HTTP_201_CREATED,
+            'update': status.HTTP_200_OK,
+            'delete': status.HTTP_204_NO_CONTENT,
+        }[self.op]
+        return {'index': self.index, 'status': code, 'id': str(self.instance.id)}
+
+
+def _as_uuid(value):
+    try:
+        return uuid.UUID(str(value))
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def _load_lookups(items):
+    product_ids = set()
+    category_ids = set()
+    for item in items:
+        if item.resource == 'product':
+            if item.op != 'create':
+                product_ids.add(item.id)
+            raw_ids = item.data.get('category_ids')
+            if isinstance(raw_ids, list):
+                category_ids.update(filter(None, map(_as_uuid, raw_ids)))
+        else:
+            if item.op != 'create':
+                category_ids.add(item.id)
+            parent_id = _as_uuid(item.data.get('parent'))
+            if parent_id:
+                category_ids.add(parent_id)
+
+    # ordem de pk: dois lotes concorrentes travam as linhas na mesma ordem
+    products = (
+        Product.objects.alive().select_for_update().order_by('pk').in_bulk(product_ids) if product_ids else {}
+    )
+    categories = (
+        Category.objects.alive().select_for_update().order_by('pk').in_bulk(category_ids) if category_ids else {}
+    )
+
+    delete_ids = {i.id for i in items if i.resource == 'category' and i.op == 'delete'}
+    with_children = set(
+        Category.objects.alive()
+        .filter(parent_id__in=delete_ids)
+        .exclude(id__in=delete_ids)
+        .values_list('parent_id', flat=True)
+    ) if delete_ids else set()
+
+    return {'products': products, 'categories': categories, 'categories_with_children': with_children}
+
+
+def _validate(item, lookups, context):
+    targets = lookups['products'] if item.resource == 'product' else lookups['categories']
+    if item.op != 'create':
+        item.instance = targets.get(item.id)
+        if item.instance is None:
+            item.errors = {'id': [f'Não encontrado: {item.id}']}
+            return
+
+    if item.op == 'delete':
+        if item.resource == 'category' and item.id in lookups['categories_with_children']:
+            item.errors = {'id': ['A categoria possui subcategorias; mova ou remova-as antes.']}
+        return
+
+    if item.resource == 'product':
+        if 'images' in item.data:
+            item.errors = {'images': ['Não suportado no lote; use /api/v1/products/.']}
+            return
+        serializer_class = ProductWriteSerializer
+    else:
+        serializer_class = BatchCategorySerializer
+
+    serializer = serializer_class(
+        item.instance,
+        data=item.data,
+        partial=item.op == 'update',
+        context=context,
+    )
+    if serializer.is_valid():
+        item.validated = serializer.validated_data
+    else:
+        item.errors = serializer.errors
+
+
+def _check_moves(items):
+    '''
+      validate_parent confere cada mudanca de parent contra o banco; aqui as
+      mudancas do lote sao aplicadas em sequencia sobre a hierarquia atual, e
+      o item que fecharia um ciclo (A sob B e B sob A) vira erro do proprio item.
+    '''
+    moves = [
+        item for item in items
+        if item.resource == 'category' and item.op == 'update' and not item.errors
+        and item.validated.get('parent_id') and item.validated['parent_id'] != item.instance.parent_id
+    ]
+    if len(moves) < 2:
+        return
+
+    # ancestrais (no banco) de todos os novos parents, com o parent atual de cada um
+    parents = dict(
+        Category.objects.filter(descendant_links__descendant_id__in={i.validated['parent_id'] for i in moves})
+        .values_list('id', 'parent_id')
+        .distinct()
+    )
+    for item in moves:
+        node = item.validated['parent_id']
+        while node is not None and node != item.id:
+            node = parents.get(node)
+        if node == item.id:
+            item.errors = {'parent': ['A categoria não pode ficar abaixo dela mesma ou de um descendente.']}
+        else:
+            parents[item.id] = item.validated['parent_id']
+
+
+def _check_deleted_references(items):
+    '''
+      Categoria removida por um item do lote nao pode receber, no mesmo lote,
+      subcategorias (create ou move) nem produtos.
+    '''
+    deleted = {item.id for item in items if item.resource == 'category' and item.op == 'delete' and not item.errors}
+    if not deleted:
+        return
+    for item in items:
+        if item.errors or item.op == 'delete':
+            continue
+        if item.resource == 'category':
+            if item.validated.get('parent_id') in deleted:
+                item.errors = {'parent': ['A categoria é removida neste mesmo lote.']}
+        elif deleted.intersection(item.validated.get('category_ids') or ()):
+            item.errors = {'category_ids': ['Contém categoria removida neste mesmo lote.']}
+
+
+def _set_links(products_with_links, replaced_ids, chunk_size):
+    # products_with_links: [(product, [category_id, ...])]
+    old_links = {}
+    if replaced_ids:
+        replaced = ProductCategory.objects.filter(product_id__in=replaced_ids)
+        for product_id, category_id in replaced.values_list('product_id', 'category_id'):
+            old_links.setdefault(product_id, set()).add(category_id)
+        replaced.delete()
+    ProductCategory.objects.bulk_create(
+        [ProductCategory(product=p, category_id=cid) for p, ids in products_with_links for cid in ids],
+        batch_size=chunk_size,
+        ignore_conflicts=True,
+    )
+
+    dirty_products, dirty_categories = set(), set()
+    for product, ids in products_with_links:
+        changed = old_links.get(product.id, set()) ^ set(ids)
+        if changed:
+            dirty_products.add(product.id)
+            dirty_categories |= changed
+    mark_dirty(dirty_products, dirty_categories)
+
+
+def _bulk_update(model, items, chunk_size):
+    # agrupa por conjunto de campos: cada linha recebe so o que o item enviou
+    now = timezone.now()
+    by_fields = {}
+    for item in items:
+        for attr, value in item.validated.items():
+            setattr(item.instance, attr, value)
+        item.instance.updated_at = now
+        by_fields.setdefault(tuple(sorted({'updated_at', *item.validated})), []).append(item.instance)
+    for fields, instances in by_fields.items():
+        model.objects.bulk_update(instances, fields, batch_size=chunk_size)
+
+
+def _apply(items, chunk_size):
+    groups = {}
+    for item in items:
+        groups.setdefault((item.resource, item.op), []).append(item)
+
+    # categorias
+    created = groups.get(('category', 'create'), [])
+    for item in created:
+        item.instance = Category(**item.validated)
+    Category.objects.bulk_create([i.instance for i in created], batch_size=chunk_size)
+    CategoryClosure.insert_nodes([i.instance for i in created])
+
+    plain_updates = []
+    for item in groups.get(('category', 'update'), []):
+        if 'parent_id' in item.validated and item.validated['parent_id'] != item.instance.parent_id:
+            # mudança de parent move a subárvore na closure table (Category.save)
+            for attr, value in item.validated.items():
+                setattr(item.instance, attr, value)
+            item.instance.save()
+        else:
+            plain_updates.append(item)
+    _bulk_update(Category, plain_updates, chunk_size)
+
+    # produtos
+    links = []
+    created = groups.get(('product', 'create'), [])
+    for item in created:
+        category_ids = item.validated.pop('category_ids', [])
+        item.instance = Product(**item.validated)
+        links.append((item.instance, category_ids))
+    Product.objects.bulk_create([i.instance for i in created], batch_size=chunk_size)
+
+    replaced_ids = []
+    updated = groups.get(('product', 'update'), [])
+    for item in updated:
+        if 'category_ids' in item.validated:
+            links.append((item.instance, item.validated.pop('category_ids')))
+            replaced_ids.append(item.instance.id)
+    _bulk_update(Product, updated, chunk_size)
+
+    if links:
+        _set_links(links, replaced_ids, chunk_size)
+
+    # deleções (lógicas); as categorias envolvidas entram na fila dos relacionados
+    deleted_products = [i.id for i in groups.get(('product', 'delete'), [])]
+    deleted_categories = [i.id for i in groups.get(('category', 'delete'), [])]
+    dirty_categories = set(deleted_categories)
+    if deleted_products:
+        Product.objects.filter(id__in=deleted_products).soft_delete()
+        ProductImage.objects.filter(product_id__in=deleted_products).soft_delete()
+        dirty_categories.update(
+            ProductCategory.objects.filter(product_id__in=deleted_products).values_list('category_id', flat=True)
+        )
+    if deleted_categories:
+        Category.objects.filter(id__in=deleted_categories).soft_delete()
+    mark_dirty(category_ids=dirty_categories)
+
+
+def run_batch(operations, atomic=True, context=None):
+    '''
+      Retorna (ok, results) com um resultado por operação, na ordem recebida.
+    '''
+    items = [BatchItem(index, **op) for index, op in enumerate(operations)]
+
+    seen = set()
+    for item in items:
+        if item.id is None:
+            continue
+        if (item.resource, item.id) in seen:
+            item.errors = {'id': ['Registro repetido no lote.']}
+        seen.add((item.resource, item.id))
+
+    with bounded_atomic():
+        lookups = _load_lookups(items)
+        context = {**(context or {}), 'existing_category_ids': set(lookups['categories'])}
+        for item in items:
+            if not item.errors:
+                _validate(item, lookups, context)
+        _check_deleted_references(items)
+        _check_moves(items)
+
+        failed = any(item.errors for item in items)
+        if atomic and failed:
+            return False, [item.result(applied=False) for item in items]
+
+        _apply([item for item in items if not item.errors], settings.BATCH_CHUNK_SIZE)
+    return not failed, [item.result(applied=True) for item in items]
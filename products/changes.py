@@ -0,0 +1,135 @@
+'''
+  Feed incremental de alteracoes do catalogo (produtos, categorias e imagens).
+
+  Cada tipo e lido em ordem de (updated_at, id), usando o indice composto,
+  a partir da ultima posicao entregue. O cursor guarda essa posicao por tipo
+  e e devolvido ao cliente como uma string opaca (base64 de JSON).
+  Registros com deleted_at preenchido saem como tombstones (deleted=true).
+
+  updated_at vem do relogio da aplicacao no momento do statement, nao da
+  ordem de commit: uma transacao que confirme depois que o cursor de um
+  cliente passou do seu carimbo seria pulada para sempre. Por isso o feed so
+  entrega linhas com mais de CHANGE_FEED_SETTLE_SECONDS e as escritas no
+  catalogo (API, lote e admin) usam standard.transactions.bounded_atomic, que
+  desfaz transacoes mais longas que WRITE_TRANSACTION_MAX_SECONDS
+  (< CHANGE_FEED_SETTLE_SECONDS, verificado pelo system check products.E001).
+  A folga entre os dois cobre a diferenca de relogio entre os servidores da
+  aplicacao.
+'''
+import base64
+import binascii
+import heapq
+import json
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Category, Product, ProductImage
+from .serializers import CategorySerializer, ProductImageSerializer, ProductReadSerializer
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _product_rows(queryset):
+    return ProductReadSerializer.optimize_queryset(queryset, None, extra_columns=('deleted_at',))
+
+
+def _serialize_product(obj, context):
+    return ProductReadSerializer(obj, context=context).data
+
+
+def _serialize_category(obj, context):
+    return CategorySerializer(obj, context=context).data
+
+
+def _serialize_image(obj, context):
+    data = ProductImageSerializer(obj, context=context).data
+    data['product_id'] = str(obj.product_id)
+    return data
+
+
+# (tipo, model, ajuste do queryset, serializacao)
+SOURCES = (
+    ('product', Product, _product_rows, _serialize_product),
+    ('category', Category, None, _serialize_category),
+    ('product_image', ProductImage, None, _serialize_image),
+)
+SOURCE_TYPES = tuple(kind for kind, *_rest in SOURCES)
+
+
+def encode_cursor(positions: dict) -> str:
+    raw = json.dumps(positions, separators=(',', ':'), sort_keys=True).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> dict:
+    if not cursor:
+        return {}
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        positions = {}
+        for kind, (ts, pk) in json.loads(raw).items():
+            updated_at = parse_datetime(ts)
+            if kind not in SOURCE_TYPES or updated_at is None:
+                raise ValueError(kind)
+            positions[kind] = (updated_at, uuid.UUID(pk))
+        return positions
+    except (binascii.Error, ValueError, TypeError, AttributeError):
+        raise InvalidCursor('Cursor inválido.')
+
+
+def _after(queryset, position):
+    if position is None:
+        return queryset
+    updated_at, pk = position
+    return queryset.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=pk))
+
+
+def fetch_changes(cursor: str, limit: int, types=SOURCE_TYPES, context=None):
+    '''
+      Retorna (entries, next_cursor, has_more).
+
+      Lê no maximo limit + 1 linhas de cada tipo e intercala por (updated_at, id);
+      alteracoes mais novas que CHANGE_FEED_SETTLE_SECONDS ficam para a proxima
+      chamada, dando tempo de transacoes em andamento confirmarem.
+    '''
+    positions = decode_cursor(cursor)
+    until = timezone.now() - timedelta(seconds=settings.CHANGE_FEED_SETTLE_SECONDS)
+
+    streams = []
+    for order, (kind, model, prepare, serialize) in enumerate(SOURCES):
+        if kind not in types:
+            continue
+        queryset = _after(model.objects.filter(updated_at__lte=until), positions.get(kind))
+        queryset = queryset.order_by('updated_at', 'id')
+        if prepare:
+            queryset = prepare(queryset)
+        rows = list(queryset[:limit + 1])
+        streams.append([(obj.updated_at, order, obj.id, kind, obj, serialize) for obj in rows])
+
+    merged = list(heapq.merge(*streams, key=lambda item: item[:3]))
+    page = merged[:limit]
+
+    entries = []
+    for updated_at, _order, pk, kind, obj, serialize in page:
+        deleted = obj.deleted_at is not None
+        entries.append({
+            'type': kind,
+            'id': str(pk),
+            'updated_at': updated_at.isoformat(),
+            'deleted': deleted,
+            'data': None if deleted else serialize(obj, context or {}),
+        })
+        positions[kind] = (updated_at, pk)
+
+    next_cursor = encode_cursor({
+        kind: [updated_at.isoformat(), str(pk)]
+        for kind, (updated_at, pk) in positions.items()
+    })
+    return entries, next_cursor, len(merged) > limit
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+
+@register()
+def check_change_feed_settle_window(app_configs, **kwargs):
+    '''
+      O feed de alteracoes (products/changes.py) so nao pula linhas se a janela
+      de espera for maior que a transacao de escrita mais longa permitida.
+    '''
+    if settings.CHANGE_FEED_SETTLE_SECONDS <= settings.WRITE_TRANSACTION_MAX_SECONDS:
+        return [Error(
+            'CHANGE_FEED_SETTLE_SECONDS precisa ser maior que WRITE_TRANSACTION_MAX_SECONDS.',
+            hint='Aumente CHANGE_FEED_SETTLE_SECONDS ou diminua WRITE_TRANSACTION_MAX_SECONDS.',
+            id='products.E001',
+        )]
+    return []
@@ -0,0 +1,88 @@
+'''
+  Utilitarios compartilhados pelos comandos bench_*.
+  Os dados semeados ficam dentro de uma transacao que e desfeita no final,
+  entao os benchmarks podem rodar contra o banco configurado sem sujar nada.
+'''
+import statistics
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import transaction
+
+from products.models import Category, CategoryClosure, Product, ProductCategory, ProductImage
+
+DESCRIPTION = (
+    'Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor '
+    'incididunt ut labore et dolore magna aliqua. Ut enim ad minim veniam, quis nostrud '
+    'exercitation ullamco laboris nisi ut aliquip ex ea commodo consequat.'
+)
+
+
+class _Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rolled_back():
+    try:
+        with transaction.atomic():
+            yield
+            raise _Rollback
+    except _Rollback:
+        pass
+
+
+def seed_catalog(products=1000, categories=20, categories_per_product=2, images_per_product=3, batch_size=1000):
+    cats = [Category(name=f'Bench category {i:04d}', description=DESCRIPTION) for i in range(categories)]
+    Category.objects.bulk_create(cats, batch_size=batch_size)
+    CategoryClosure.insert_nodes(cats)
+
+    prods = []
+    for start in range(0, products, batch_size):
+        chunk = [
+            Product(
+                name=f'Bench product {i:07d}',
+                description=DESCRIPTION,
+                price=Decimal(10 + i % 500) + Decimal('0.90'),
+                stock=i % 7,
+            )
+            for i in range(start, min(start + batch_size, products))
+        ]
+        Product.objects.bulk_create(chunk, batch_size=batch_size)
+        ProductCategory.objects.bulk_create(
+            [
+                ProductCategory(product=p, category=cats[(n + k) % categories])
+                for n, p in enumerate(chunk, start=start)
+                for k in range(min(categories_per_product, categories))
+            ],
+            batch_size=batch_size,
+        )
+        ProductImage.objects.bulk_create(
+            [
+                ProductImage(product=p, image=f'product_images/bench-{k}.jpg', alt_text=f'Foto {k}')
+                for p in chunk
+                for k in range(images_per_product)
+            ],
+            batch_size=batch_size,
+        )
+        prods.extend(chunk)
+    return prods, cats
+
+
+def measure(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': ordered[len(ordered) // 2] * 1000,
+        'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+    }
@@ -0,0 +1,310 @@
+import json
+import tempfile
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
+from urllib.parse import urlencode
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, reverse
+from django.utils import timezone
+
+from products import urls as products_urls
+from products.models import UploadSession
+from products.orders import build_order_record, get_order_queue, save_orders
+from products.related import rebuild_all
+from standard import queryplans
+
+from ._bench import rolled_back, seed_catalog
+
+
+def iter_patterns(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_patterns(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern):
+            yield pattern
+
+
+class Command(BaseCommand):
+    help = (
+        'Exercita todas as rotas de products/urls.py e todos os changelists do admin contra um banco '
+        'semeado (transacao desfeita no final), roda EXPLAIN em cada query e aponta full scans, '
+        'filesorts e tabelas temporarias, com sugestoes de indice. Com --format json a saida e '
+        'legivel por maquina; --fail-on (e --baseline) permitem barrar regressoes no CI.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--format', choices=('text', 'json'), default='text')
+        parser.add_argument('--app', action='append', dest='apps', help='apps auditados (padrao: products e standard)')
+        parser.add_argument(
+            '--fail-on', action='append', choices=queryplans.FLAGS, default=[],
+            help='sai com erro se houver achados deste tipo (repetivel)',
+        )
+        parser.add_argument(
+            '--baseline', type=Path,
+            help='JSON de uma execucao anterior; --fail-on so considera achados que nao estao nele',
+        )
+
+    def handle(self, *args, **options):
+        audited_apps = options['apps'] or ['products', 'standard']
+        self.tables = {
+            model._meta.db_table: model
+            for label in audited_apps
+            for model in apps.get_app_config(label).get_models()
+        }
+        self.plans = {}
+        self.routes = []
+        self.findings = []
+
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            ORDER_QUEUE_SPOOL_DIR=tempfile.mkdtemp(prefix='audit-orders-'),
+            ORDER_QUEUE_FLUSH_SECONDS=3600,
+        ):
+            # fila nova, que so grava quando o proprio comando chama flush() (dentro da transacao)
+            get_order_queue.cache_clear()
+            try:
+                with rolled_back():
+                    self.seed(options['products'])
+                    self.exercise_api()
+                    self.exercise_admin()
+            finally:
+                get_order_queue.cache_clear()
+
+        report = {
+            'vendor': connection.vendor,
+            'routes': self.routes,
+            'findings': self.findings,
+            'suggestions': self.suggestions(),
+        }
+        if options['format'] == 'json':
+            self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
+        else:
+            self.write_text(report)
+        self.gate(options['fail_on'], options['baseline'])
+
+    def seed(self, products):
+        self.products, self.categories = seed_catalog(products=products, images_per_product=2)
+        rebuild_all()
+        record = build_order_record('Auditoria', '', str(self.products[0].price), [{
+            'product_id': str(self.products[0].id), 'name': self.products[0].name,
+            'unit_price': str(self.products[0].price), 'qty': 1, 'subtotal': str(self.products[0].price),
+        }])
+        save_orders([record])
+        UploadSession.objects.create(filename='audit.jpg', content_type='image/jpeg', total_size=1024)
+        self.user = get_user_model().objects.create_superuser('audit-queries', 'audit@example.com', None)
+
+    def sample_id(self, view_class):
+        queryset = getattr(view_class, 'queryset', None)
+        if queryset is None:
+            return None
+        return queryset.model._default_manager.order_by('pk').values_list('pk', flat=True).first()
+
+    def payloads(self):
+        product = self.products[0]
+        return {
+            ('checkout-validate', 'post'): {
+                'items': [{'product_id': str(p.id), 'qty': 1} for p in self.products[1:4] if p.stock],
+                'customer_name': 'Auditoria',
+            },
+            ('batch', 'post'): {
+                'atomic': True,
+                'operations': [
+                    {'op': 'create', 'resource': 'category', 'data': {'name': 'Auditoria'}},
+                    {
+                        'op': 'update', 'resource': 'product', 'id': str(product.id),
+                        'data': {'price': '9.90', 'category_ids': [str(self.categories[0].id)]},
+                    },
+                ],
+            },
+        }
+
+    def exercise_api(self):
+        client = Client()
+        client.force_login(self.user)
+        payloads = self.payloads()
+        extra_params = {
+            'products-list': [{'category': str(self.categories[0].id)}, {'fields': 'id,name,price'}],
+            'changes': [{'limit': 100}],
+        }
+
+        for pattern in iter_patterns(products_urls.urlpatterns):
+            group_names = pattern.pattern.regex.groupindex
+            if not pattern.name or 'format' in group_names:
+                continue
+            view_class = pattern.callback.cls
+            kwargs = {}
+            if 'pk' in group_names:
+                kwargs['pk'] = self.sample_id(view_class)
+                if kwargs['pk'] is None:
+                    continue
+            path = reverse(pattern.name, kwargs=kwargs)
+
+            actions = getattr(pattern.callback, 'actions', None) or {
+                method: method for method in view_class.http_method_names if hasattr(view_class, method)
+            }
+            for method in list(actions):
+                if method == 'get':
+                    for params in [{}] + extra_params.get(pattern.name, []):
+                        self.get(client, pattern.name, path, params)
+                elif (pattern.name, method) in payloads:
+                    body = payloads[(pattern.name, method)]
+                    response = self.run(
+                        pattern.name, method.upper(), path,
+                        lambda body=body: client.post(path, body, content_type='application/json'),
+                    )
+                    if pattern.name == 'checkout-validate':
+                        self.run(pattern.name, 'FLUSH', 'write-behind', get_order_queue().flush)
+                        if response.status_code == 200 and response.json().get('order_id'):
+                            order_path = reverse('orders-detail', kwargs={'pk': response.json()['order_id']})
+                            self.get(client, 'orders-detail', order_path, {})
+
+    def exercise_admin(self):
+        client = Client()
+        client.force_login(self.user)
+        for model, model_admin in admin.site._registry.items():
+            opts = model._meta
+            path = reverse(f'admin:{opts.app_label}_{opts.model_name}_changelist')
+            route = f'admin:{opts.app_label}_{opts.model_name}_changelist'
+            variants = [{}]
+            if model_admin.search_fields:
+                variants.append({'q': 'Bench'})
+            for spec in model_admin.list_filter:
+                field_name = spec[0] if isinstance(spec, tuple) else spec
+                if not isinstance(field_name, str):
+                    continue
+                field = opts.get_field(field_name)
+                if field.get_internal_type() == 'DateTimeField':
+                    now = timezone.now()
+                    variants.append({
+                        f'{field_name}__gte': (now - timedelta(days=7)).isoformat(),
+                        f'{field_name}__lt': (now + timedelta(days=1)).isoformat(),
+                    })
+            for params in variants:
+                self.get(client, route, path, params)
+
+    def get(self, client, route, path, params):
+        full_path = f'{path}?{urlencode(params)}' if params else path
+        return self.run(route, 'GET', full_path, lambda: client.get(full_path))
+
+    def run(self, route, method, path, request):
+        with CaptureQueriesContext(connection) as captured:
+            response = request()
+        status = getattr(response, 'status_code', None)
+        explained = 0
+        for query in captured.captured_queries:
+            sql = query['sql']
+            if not queryplans.is_explainable(sql):
+                continue
+            explained += 1
+            fingerprint = queryplans.fingerprint(sql)
+            if fingerprint not in self.plans:
+                findings = queryplans.explain(connection, sql)
+                for finding in findings:
+                    # filesort/temp sem tabela no plano: atribui a tabela principal do FROM
+                    finding['table'] = finding['table'] or self.main_table(sql)
+                self.plans[fingerprint] = [f for f in findings if f['table'] in self.tables]
+            for finding in self.plans[fingerprint]:
+                self.findings.append({
+                    'route': route, 'method': method, 'path': path, **finding,
+                    'fingerprint': fingerprint, 'sql': sql,
+                })
+        self.routes.append({
+            'route': route, 'method': method, 'path': path, 'status': status,
+            'queries': len(captured.captured_queries), 'explained': explained,
+        })
+        return response
+
+    def main_table(self, sql):
+        for table in self.tables:
+            if f'FROM "{table}"' in sql or f'FROM `{table}`' in sql:
+                return table
+        return None
+
+    def suggestions(self):
+        suggested = {}
+        for finding in self.findings:
+            if finding['flag'] == queryplans.TEMP_TABLE:
+                continue
+            model = self.tables[finding['table']]
+            index = queryplans.suggest_index(model, finding['sql'], finding['flag'])
+            if index is None:
+                continue
+            key = (model._meta.label, tuple(index.fields))
+            entry = suggested.setdefault(key, {
+                'model': model._meta.label,
+                'fields': list(index.fields),
+                'index': f"models.Index(fields={list(index.fields)!r}, name={index.name!r})",
+                'routes': [],
+            })
+            route = f"{finding['method']} {finding['route']}"
+            if route not in entry['routes']:
+                entry['routes'].append(route)
+
+        # um indice que e prefixo de outro sugerido para o mesmo model ja esta coberto por ele
+        for (label, fields), entry in list(suggested.items()):
+            wider = next((
+                other for (other_label, other_fields), other in suggested.items()
+                if other_label == label and len(other_fields) > len(fields) and other_fields[:len(fields)] == fields
+            ), None)
+            if wider is not None:
+                wider['routes'] += [route for route in entry['routes'] if route not in wider['routes']]
+                del suggested[(label, fields)]
+        return list(suggested.values())
+
+    def write_text(self, report):
+        by_request = Counter((f['method'], f['path'], f['flag']) for f in report['findings'])
+        self.stdout.write(f'Banco: {report["vendor"]}')
+        self.stdout.write(f'{"route":<42}{"method":<7}{"status":>7}{"queries":>9}  achados / path')
+        for entry in report['routes']:
+            flags = ', '.join(
+                f'{flag}={by_request[(entry["method"], entry["path"], flag)]}'
+                for flag in queryplans.FLAGS if by_request[(entry['method'], entry['path'], flag)]
+            )
+            self.stdout.write(
+                f'{entry["route"]:<42}{entry["method"]:<7}{entry["status"] or "-":>7}{entry["queries"]:>9}'
+                f'  {flags or "-"} / {entry["path"]}'
+            )
+
+        seen = set()
+        if report['findings']:
+            self.stdout.write('\nAchados (um por query distinta):')
+        for finding in report['findings']:
+            key = (finding['fingerprint'], finding['flag'], finding['table'])
+            if key in seen:
+                continue
+            seen.add(key)
+            self.stdout.write(f'- [{finding["flag"]}] {finding["table"]}: {finding["detail"]}')
+            self.stdout.write(f'    {finding["method"]} {finding["route"]}: {finding["sql"][:300]}')
+
+        if report['suggestions']:
+            self.stdout.write('\nIndices sugeridos (revise e adicione ao Meta.indexes do model + makemigrations):')
+        for suggestion in report['suggestions']:
+            self.stdout.write(f'- {suggestion["model"]}: {suggestion["index"]}  <- {", ".join(suggestion["routes"])}')
+
+    def gate(self, fail_on, baseline):
+        if not fail_on:
+            return
+        known = set()
+        if baseline:
+            previous = json.loads(baseline.read_text())
+            known = {(f['route'], f['flag'], f['table'], f['fingerprint']) for f in previous['findings']}
+        failing = {
+            (f['route'], f['flag'], f['table'], f['fingerprint'])
+            for f in self.findings
+            if f['flag'] in fail_on
+        } - known
+        if failing:
+            raise CommandError(
+                f'{len(failing)} achado(s) do tipo {", ".join(sorted(fail_on))}'
+                + (' fora do baseline.' if baseline else '.')
+            )
@@ -0,0 +1,99 @@
+from datetime import timedelta
+from urllib.parse import urlencode
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+from products.admin import ProductAdmin
+from products.models import Product
+
+from ._bench import measure, rolled_back, seed_catalog, summarize
+
+
+class BaselineProductAdmin(admin.ModelAdmin):
+    '''
+      Configuracao original do ProductAdmin, para comparacao.
+    '''
+    list_display = ProductAdmin.list_display
+    list_filter = ('created_at', 'updated_at')
+    search_fields = ProductAdmin.search_fields
+    ordering = ProductAdmin.ordering
+    list_editable = ProductAdmin.list_editable
+
+    def is_in_stock_display(self, obj):
+        return obj.is_in_stock()
+
+
+class Command(BaseCommand):
+    help = 'Mede a changelist de produtos do admin (listagem, filtro por data, list_editable) com uma tabela grande.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        changelist_path = '/admin/products/product/'
+
+        with rolled_back():
+            seed_catalog(products=options['products'], categories=5, categories_per_product=1, images_per_product=0)
+            user = User.objects.create_superuser('bench-admin', 'bench@example.com', 'bench')
+            since = Product.objects.order_by('created_at').values_list('created_at', flat=True).first()
+            since = since.replace(hour=0, minute=0, second=0, microsecond=0)
+            date_query = urlencode({'created_at__gte': str(since), 'created_at__lt': str(since + timedelta(days=1))})
+
+            def build(request, path):
+                request.user = user
+                request.session = SessionStore()
+                request._messages = FallbackStorage(request)
+                request._dont_enforce_csrf_checks = True
+                request.resolver_match = resolve(path)
+                return request
+
+            def get(model_admin, query=''):
+                request = build(factory.get(f'{changelist_path}?{query}'), changelist_path)
+                return lambda: model_admin.changelist_view(request).render()
+
+            def post_edits(model_admin):
+                page = list(Product.objects.order_by('name').values_list('id', 'stock')[:100])
+                data = {
+                    'form-TOTAL_FORMS': str(len(page)),
+                    'form-INITIAL_FORMS': str(len(page)),
+                    'form-MIN_NUM_FORMS': '0',
+                    'form-MAX_NUM_FORMS': '1000',
+                    '_save': 'Save',
+                }
+                for i, (pk, stock) in enumerate(page):
+                    data.update({f'form-{i}-id': str(pk), f'form-{i}-price': '42.00', f'form-{i}-stock': str(stock + 1)})
+
+                def run():
+                    request = build(factory.post(changelist_path, data), changelist_path)
+                    model_admin.changelist_view(request)
+                return run
+
+            self.stdout.write(
+                f'{"admin":<10}{"scenario":<22}{"queries":>8}{"mean ms":>10}{"p50 ms":>10}{"p95 ms":>10}'
+            )
+            for label, model_admin in (
+                ('baseline', BaselineProductAdmin(Product, admin.site)),
+                ('current', admin.site._registry[Product]),
+            ):
+                for scenario, fn in (
+                    ('changelist', get(model_admin)),
+                    ('date filter (day)', get(model_admin, date_query)),
+                    ('list_editable 100', post_edits(model_admin)),
+                ):
+                    with CaptureQueriesContext(connection) as ctx:
+                        fn()
+                    stats = summarize(measure(fn, options['repeat']))
+                    self.stdout.write(
+                        f'{label:<10}{scenario:<22}{len(ctx.captured_queries):>8}'
+                        f'{stats["mean_ms"]:>10.1f}{stats["p50_ms"]:>10.1f}{stats["p95_ms"]:>10.1f}'
+                    )
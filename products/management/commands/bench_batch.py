@@ -0,0 +1,71 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory
+
+from products.views import ProductViewSet
+from products.views_batch import BatchAPIView
+
+from ._bench import rolled_back, seed_catalog
+
+
+class Command(BaseCommand):
+    help = 'Compara a vazão do /api/v1/batch/ com uma chamada por operação (create e update de produtos).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--operations', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = options['operations']
+        factory = APIRequestFactory()
+        create_view = ProductViewSet.as_view({'post': 'create'})
+        update_view = ProductViewSet.as_view({'patch': 'partial_update'})
+        batch_view = BatchAPIView.as_view()
+
+        def payload(i, category_ids):
+            return {
+                'name': f'Bench batch {i:07d}',
+                'description': 'Bench',
+                'price': '19.90',
+                'stock': i % 5,
+                'category_ids': category_ids,
+            }
+
+        self.stdout.write(f'{"mode":<24}{"ops":>8}{"seconds":>10}{"ops/s":>12}')
+
+        with rolled_back():
+            products, cats = seed_catalog(products=total, images_per_product=0)
+            category_ids = [str(c.id) for c in cats[:2]]
+
+            def one_per_op_create():
+                for i in range(total):
+                    create_view(factory.post('/api/v1/products/', payload(i, category_ids), format='json'))
+
+            def one_per_op_update():
+                for p in products:
+                    update_view(
+                        factory.patch(f'/api/v1/products/{p.id}/', {'price': '29.90'}, format='json'),
+                        pk=str(p.id),
+                    )
+
+            def batch_create():
+                ops = [{'op': 'create', 'resource': 'product', 'data': payload(i, category_ids)} for i in range(total)]
+                batch_view(factory.post('/api/v1/batch/', {'operations': ops}, format='json'))
+
+            def batch_update():
+                ops = [
+                    {'op': 'update', 'resource': 'product', 'id': str(p.id), 'data': {'price': '39.90'}}
+                    for p in products
+                ]
+                batch_view(factory.post('/api/v1/batch/', {'operations': ops}, format='json'))
+
+            for label, fn in (
+                ('create one-per-op', one_per_op_create),
+                ('create batch', batch_create),
+                ('update one-per-op', one_per_op_update),
+                ('update batch', batch_update),
+            ):
+                started = time.perf_counter()
+                fn()
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'{label:<24}{total:>8}{elapsed:>10.2f}{total / elapsed:>12.0f}')
@@ -0,0 +1,69 @@
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.orders import build_order_record, enqueue_order, save_orders
+from standard.writebehind import WriteBehindQueue
+
+from ._bench import rolled_back, seed_catalog, summarize
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara o custo por checkout de gravar o pedido na hora (um INSERT por pedido) '
+        'com a fila write-behind (spool + bulk), com e sem fsync.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--items', type=int, default=3)
+
+    def handle(self, *args, **options):
+        total = options['orders']
+
+        with rolled_back():
+            products, _ = seed_catalog(products=options['items'], images_per_product=0)
+            items = [
+                {'product_id': str(p.id), 'name': p.name, 'unit_price': str(p.price), 'qty': 1, 'subtotal': str(p.price)}
+                for p in products
+            ]
+
+            def records():
+                return [build_order_record('Bench', '', '99.90', items) for _ in range(total)]
+
+            self.stdout.write(f'{"mode":<24}{"req mean ms":>12}{"req p95 ms":>12}{"flush s":>10}{"orders/s":>10}')
+
+            def report(label, samples, flush_seconds):
+                stats = summarize(samples)
+                elapsed = sum(samples) + flush_seconds
+                self.stdout.write(
+                    f'{label:<24}{stats["mean_ms"]:>12.3f}{stats["p95_ms"]:>12.3f}'
+                    f'{flush_seconds:>10.2f}{total / elapsed:>10.0f}'
+                )
+
+            samples = []
+            for record in records():
+                started = time.perf_counter()
+                save_orders([record])
+                samples.append(time.perf_counter() - started)
+            report('sync insert', samples, 0)
+
+            for fsync in (True, False):
+                with tempfile.TemporaryDirectory() as spool_dir:
+                    # flush só explícito: a thread de fundo usaria outra conexão,
+                    # fora da transação desfeita do benchmark
+                    queue = WriteBehindQueue(
+                        'bench', save_orders, spool_dir, max_batch=total + 1, flush_seconds=3600, fsync=fsync,
+                    )
+                    samples = []
+                    for record in records():
+                        started = time.perf_counter()
+                        enqueue_order(record, queue)
+                        samples.append(time.perf_counter() - started)
+
+                    started = time.perf_counter()
+                    queue.flush()
+                    flush_seconds = time.perf_counter() - started
+                    report(f'write-behind fsync={fsync}', samples, flush_seconds)
+                    queue.close()
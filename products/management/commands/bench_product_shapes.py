@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+from products.views import ProductViewSet
+
+from ._bench import measure, rolled_back, seed_catalog, summarize
+
+SHAPES = (
+    ('full', {}),
+    ('slim', {'fields': 'id,name,price,is_in_stock,cover_image'}),
+    ('slim+categories', {'fields': 'id,name,price,is_in_stock,cover_image', 'expand': 'categories'}),
+)
+
+
+class Command(BaseCommand):
+    help = 'Compara tamanho do payload, queries e latência da listagem de produtos no formato completo e esparso.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        view = ProductViewSet.as_view({'get': 'list'})
+
+        def call(params):
+            response = view(factory.get('/api/v1/products/', params))
+            response.render()
+            return response
+
+        with rolled_back():
+            seed_catalog(products=options['products'])
+
+            self.stdout.write(f'{"shape":<18}{"bytes":>12}{"queries":>9}{"p50 ms":>10}{"p95 ms":>10}')
+            for label, params in SHAPES:
+                call(params)  # aquece caches
+                with CaptureQueriesContext(connection) as queries:
+                    response = call(params)
+                stats = summarize(measure(lambda: call(params), options['repeat']))
+                self.stdout.write(
+                    f'{label:<18}{len(response.content):>12}{len(queries):>9}'
+                    f'{stats["p50_ms"]:>10.1f}{stats["p95_ms"]:>10.1f}'
+                )
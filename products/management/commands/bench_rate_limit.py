@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+
+from products.models import Category, Product
+from products.views import ProductViewSet
+from standard.throttling import TokenBucketThrottle
+
+from ._bench import seed_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede o p50/p99 de um cliente bem-comportado na listagem de produtos enquanto '
+        'outro cliente martela o mesmo endpoint, com e sem limite por cliente e descarte de carga. '
+        'Os dados semeados sao gravados (as threads usam conexoes proprias) e removidos no final.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=300)
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--abusers', type=int, default=8, help='threads do cliente abusivo')
+        parser.add_argument('--abuse-rps', type=float, default=100, help='requisicoes/s de cada thread abusiva')
+        parser.add_argument('--good-rps', type=float, default=10)
+        parser.add_argument('--rate', default='20/s', help='taxa do token bucket no benchmark')
+        parser.add_argument('--max-in-flight', type=int, default=4)
+
+    def handle(self, *args, **options):
+        # um warning por 429/503 so poluiria a saida
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        products, categories = seed_catalog(products=options['products'], categories=5, images_per_product=0)
+        try:
+            self.run(options)
+        finally:
+            Product.objects.filter(id__in=[p.id for p in products]).delete()
+            Category.objects.filter(id__in=[c.id for c in categories]).delete()
+
+    def run(self, options):
+        class BenchThrottle(TokenBucketThrottle):
+            THROTTLE_RATES = {'product_list': options['rate']}
+
+        views = {
+            'unprotected': ProductViewSet.as_view({'get': 'list'}, throttle_classes=(), load_shedding_scope=None),
+            'protected': ProductViewSet.as_view(
+                {'get': 'list'}, throttle_classes=(BenchThrottle,), load_shedding_scope='bench',
+            ),
+        }
+        factory = APIRequestFactory()
+        path = '/api/v1/products/?fields=id,name,price'
+
+        self.stdout.write(
+            f'{"mode":<14}{"abusers":>8}{"good p50 ms":>13}{"good p99 ms":>13}  good statuses / abusive statuses'
+        )
+        with override_settings(LOAD_SHEDDING_LIMITS={'bench': options['max_in_flight']}):
+            for label, view in views.items():
+                for abusers in (0, options['abusers']):
+                    good, bad = self.scenario(view, factory, path, abusers, options)
+                    latencies = sorted(ms for ms, _ in good)
+                    p50 = latencies[len(latencies) // 2]
+                    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+                    self.stdout.write(
+                        f'{label:<14}{abusers:>8}{p50:>13.1f}{p99:>13.1f}  '
+                        f'{dict(Counter(s for _, s in good))} / {dict(bad)}'
+                    )
+
+    def scenario(self, view, factory, path, abusers, options):
+        stop = threading.Event()
+        bad = Counter()
+        bad_lock = threading.Lock()
+
+        def abusive():
+            interval = 1 / options['abuse_rps']
+            try:
+                while not stop.is_set():
+                    started = time.perf_counter()
+                    response = view(factory.get(path, REMOTE_ADDR='10.0.0.66'))
+                    with bad_lock:
+                        bad[response.status_code] += 1
+                    stop.wait(max(0, interval - (time.perf_counter() - started)))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=abusive, daemon=True) for _ in range(abusers)]
+        for thread in threads:
+            thread.start()
+
+        good = []
+        interval = 1 / options['good_rps']
+        deadline = time.monotonic() + options['seconds']
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            response = view(factory.get(path, REMOTE_ADDR='10.0.0.1'))
+            elapsed = time.perf_counter() - started
+            good.append((elapsed * 1000, response.status_code))
+            time.sleep(max(0, interval - elapsed))
+
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return good, bad
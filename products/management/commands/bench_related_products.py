@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from rest_framework.test import APIRequestFactory
+
+from products.models import ProductCategory
+from products.related import rebuild_all
+from products.views import ProductViewSet
+
+from ._bench import measure, rolled_back, seed_catalog, summarize
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede a reconstrucao completa de produtos relacionados e compara o endpoint '
+        '/related/ com o calculo na hora (self-join em ProductCategory).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--categories', type=int, default=200)
+        parser.add_argument('--categories-per-product', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        view = ProductViewSet.as_view({'get': 'related'})
+
+        with rolled_back():
+            products, _ = seed_catalog(
+                products=options['products'],
+                categories=options['categories'],
+                categories_per_product=options['categories_per_product'],
+                images_per_product=0,
+            )
+
+            started = time.perf_counter()
+            count, rows = rebuild_all()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'rebuild completo: {count} produtos, {rows} linhas em {elapsed:.1f}s '
+                f'({count / elapsed:.0f} produtos/s)'
+            )
+
+            sample = products[:: max(1, len(products) // 50)]
+
+            def precomputed():
+                for product in sample:
+                    view(factory.get(f'/api/v1/products/{product.id}/related/'), pk=str(product.id))
+
+            def on_the_fly():
+                for product in sample:
+                    list(
+                        ProductCategory.objects
+                        .filter(category__products__product=product, product__deleted_at__isnull=True)
+                        .exclude(product=product)
+                        .values('product_id')
+                        .annotate(score=Count('id'))
+                        .order_by('-score', '-product__stock', '-product__created_at', 'product_id')[:12]
+                    )
+
+            self.stdout.write(f'{"mode":<14}{"mean ms":>10}{"p50 ms":>10}{"p95 ms":>10}   (por lote de {len(sample)})')
+            for label, fn in (('precomputed', precomputed), ('on the fly', on_the_fly)):
+                stats = summarize(measure(fn, options['repeat']))
+                self.stdout.write(f'{label:<14}{stats["mean_ms"]:>10.1f}{stats["p50_ms"]:>10.1f}{stats["p95_ms"]:>10.1f}')
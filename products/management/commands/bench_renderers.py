@@ -0,0 +1,63 @@
+import gzip
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from products.views import ProductViewSet
+from standard import compression, renderers
+
+from ._bench import measure, rolled_back, seed_catalog, summarize
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara bytes no fio e CPU de codificacao (ms por 1.000 produtos) da listagem completa '
+        'de produtos: JSON padrao do DRF, orjson e MessagePack, sem compressao, gzip e brotli.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            seed_catalog(products=options['products'])
+            view = ProductViewSet.as_view({'get': 'list'}, throttle_classes=())
+            data = view(APIRequestFactory().get('/api/v1/products/')).data
+
+        per_thousand = 1000 / len(data)
+        reference = JSONRenderer().render(data)
+        candidates = [('drf json', JSONRenderer(), json.loads)]
+        if renderers.orjson is not None:
+            candidates.append(('orjson', renderers.ORJSONRenderer(), json.loads))
+        else:
+            self.stdout.write('orjson nao instalado: linha omitida')
+        if renderers.msgpack is not None:
+            candidates.append(('msgpack', renderers.MessagePackRenderer(), renderers.msgpack.unpackb))
+        else:
+            self.stdout.write('msgpack nao instalado: linha omitida')
+
+        encodings = [('identity', None), ('gzip', lambda body: gzip.compress(body, compresslevel=6, mtime=0))]
+        if compression.brotli is not None:
+            quality = settings.COMPRESSION_BROTLI_QUALITY
+            encodings.append(('br', lambda body: compression.brotli.compress(body, quality=quality)))
+        else:
+            self.stdout.write('brotli nao instalado: linha omitida')
+
+        self.stdout.write(f'{len(data)} produtos; ms e bytes normalizados para 1.000 produtos')
+        self.stdout.write(f'{"renderer":<10}{"encoding":<10}{"bytes":>12}{"render ms":>11}{"compress ms":>13}{"total ms":>10}')
+        for label, renderer, decode in candidates:
+            body = renderer.render(data)
+            if decode(body) != json.loads(reference):
+                self.stderr.write(f'{label}: documento diferente do JSON padrao')
+            render_ms = summarize(measure(lambda: renderer.render(data), options['repeat']))['p50_ms']
+            for encoding, compress in encodings:
+                size = len(compress(body)) if compress else len(body)
+                compress_ms = summarize(measure(lambda: compress(body), options['repeat']))['p50_ms'] if compress else 0.0
+                self.stdout.write(
+                    f'{label:<10}{encoding:<10}{size * per_thousand:>12.0f}{render_ms * per_thousand:>11.2f}'
+                    f'{compress_ms * per_thousand:>13.2f}{(render_ms + compress_ms) * per_thousand:>10.2f}'
+                )
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from products.related import rebuild_all, rebuild_dirty
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstroi a tabela de produtos relacionados (RelatedProduct). '
+        'Com --incremental, processa apenas a fila RelatedProductsRefresh; com --watch N, '
+        'continua rodando e processa a fila a cada N segundos (alternativa ao cron). '
+        'A reconstrucao completa deve rodar periodicamente (ex.: uma vez por noite).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true')
+        parser.add_argument('--watch', type=int, metavar='SECONDS', help='com --incremental: repete a cada N segundos')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if not options['watch']:
+            self.run(options)
+            return
+        if not options['incremental']:
+            raise CommandError('--watch exige --incremental.')
+        while True:
+            close_old_connections()
+            self.run(options)
+            time.sleep(options['watch'])
+
+    def run(self, options):
+        started = time.perf_counter()
+        if options['incremental']:
+            products, rows = rebuild_dirty(chunk_size=options['chunk_size'])
+        else:
+            products, rows = rebuild_all(chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{products} produto(s) recalculado(s), {rows} linha(s) gravada(s) em {elapsed:.1f}s.')
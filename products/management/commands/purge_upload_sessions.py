@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from products.uploads import purge_expired_sessions
+
+
+class Command(BaseCommand):
+    help = (
+        'Remove as sessoes de upload sem atividade ha mais de UPLOAD_SESSION_EXPIRE_HOURS e os '
+        'arquivos temporarios (.part) abandonados. Rode periodicamente (ex.: cron a cada hora).'
+    )
+
+    def handle(self, *args, **options):
+        sessions, files = purge_expired_sessions()
+        self.stdout.write(f'{sessions} sessao(oes) e {files} arquivo(s) removido(s).')
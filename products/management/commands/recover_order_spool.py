@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from products.orders import get_order_queue
+
+
+class Command(BaseCommand):
+    help = (
+        'Grava os pedidos que ficaram no spool da fila write-behind de workers '
+        'encerrados sem flush (ORDER_QUEUE_SPOOL_DIR).'
+    )
+
+    def handle(self, *args, **options):
+        recovered = get_order_queue().recover()
+        self.stdout.write(f'{recovered} pedido(s) recuperado(s).')
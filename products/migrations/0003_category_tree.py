@@ -0,0 +1,47 @@
+# Generated by Django 6.0 on 2026-10-19 07:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_self_links(apps, schema_editor):
+    Category = apps.get_model('products', 'Category')
+    CategoryClosure = apps.get_model('products', 'CategoryClosure')
+    CategoryClosure.objects.bulk_create(
+        [
+            CategoryClosure(ancestor_id=category_id, descendant_id=category_id, depth=0)
+            for category_id in Category.objects.values_list('id', flat=True)
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_upload_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='children', to='products.category', verbose_name='Parent'),
+        ),
+        migrations.CreateModel(
+            name='CategoryClosure',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='products.category')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='products.category')),
+            ],
+            options={
+                'verbose_name': 'Category Closure',
+                'verbose_name_plural': 'Category Closures',
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='category_closure_desc_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ancestor', 'descendant'), name='uniq_category_closure_pair')],
+            },
+        ),
+        migrations.RunPython(create_self_links, migrations.RunPython.noop),
+    ]
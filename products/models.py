@@ -1,5 +1,10 @@
+from pathlib import Path
+
 from standard.models import StandardModel
-from django.db import models
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import DEFERRED
 from django.utils.translation import gettext_lazy as _
 
 
@@ -16,6 +21,12 @@ class Product(StandardModel):
         verbose_name = _("Product")
         verbose_name_plural = _("Products")
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='product_updated_id_idx'),
+            models.Index(fields=['created_at'], name='product_created_idx'),
+            models.Index(fields=['deleted_at', 'name'], name='product_deleted_name_idx'),
+            models.Index(fields=['name', '-id'], name='product_name_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -23,22 +34,145 @@ class Product(StandardModel):
     def is_in_stock(self):
         return self.stock > 0
 
+    @transaction.atomic
+    def soft_delete(self):
+        '''
+          Deleta (logicamente) o produto junto com as suas imagens, que assim
+          tambem saem da API e viram tombstones no feed de alteracoes.
+        '''
+        super().soft_delete()
+        self.images.soft_delete()
+
 
 class Category(StandardModel):
     '''
       Modelo para categorizar produtos.
+      A hierarquia (parent/children) e espelhada na CategoryClosure, mantida
+      no save(), para consultar subarvores com uma unica query indexada.
     '''
     name = models.CharField(max_length=255, verbose_name=_("Name"))
     description = models.TextField(verbose_name=_("Description"), blank=True)
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='children',
+        verbose_name=_("Parent"),
+    )
 
     class Meta:
         verbose_name = _("Category")
         verbose_name_plural = _("Categories")
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='category_updated_id_idx'),
+            models.Index(fields=['created_at'], name='category_created_idx'),
+            models.Index(fields=['deleted_at', 'name'], name='category_deleted_name_idx'),
+            models.Index(fields=['name', '-id'], name='category_name_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_parent_id = instance.__dict__.get('parent_id', DEFERRED)
+        return instance
+
+    def clean(self):
+        super().clean()
+        if self.parent_id and not self._state.adding:
+            if self.parent_id == self.id or Category(id=self.parent_id).is_descendant_of(self):
+                raise ValidationError({'parent': _("A category cannot be moved under itself or its descendants.")})
+
+    @transaction.atomic
+    def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        super().save(*args, **kwargs)
+
+        if is_new:
+            CategoryClosure.insert_nodes([self])
+        elif 'parent_id' in self.__dict__ and self.parent_id != getattr(self, '_loaded_parent_id', DEFERRED):
+            CategoryClosure.move_subtree(self)
+        if 'parent_id' in self.__dict__:
+            self._loaded_parent_id = self.parent_id
+
+    def is_descendant_of(self, other):
+        return CategoryClosure.objects.filter(ancestor=other, descendant=self).exists()
+
+
+class CategoryClosure(models.Model):
+    '''
+      Closure table da hierarquia de categorias: uma linha para cada par
+      (ancestral, descendente), incluindo o proprio no com depth=0.
+    '''
+    id = models.BigAutoField(primary_key=True)
+    ancestor = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name = _("Category Closure")
+        verbose_name_plural = _("Category Closures")
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='uniq_category_closure_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['descendant', 'depth'], name='category_closure_desc_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+    @classmethod
+    def insert_nodes(cls, categories):
+        '''
+          Cria as linhas de closure para categorias recem-criadas (folhas).
+          Busca os ancestrais de todos os parents de uma vez e insere em bulk.
+        '''
+        parent_ids = {c.parent_id for c in categories if c.parent_id}
+        ancestors_by_parent = {}
+        for ancestor_id, descendant_id, depth in cls.objects.filter(descendant_id__in=parent_ids).values_list(
+            'ancestor_id', 'descendant_id', 'depth',
+        ):
+            ancestors_by_parent.setdefault(descendant_id, []).append((ancestor_id, depth))
+
+        rows = []
+        for category in categories:
+            rows.append(cls(ancestor_id=category.id, descendant_id=category.id, depth=0))
+            for ancestor_id, depth in ancestors_by_parent.get(category.parent_id, []):
+                rows.append(cls(ancestor_id=ancestor_id, descendant_id=category.id, depth=depth + 1))
+        cls.objects.bulk_create(rows, batch_size=1000)
+
+    @classmethod
+    def move_subtree(cls, category):
+        '''
+          Reposiciona a subarvore de `category` sob o seu novo parent:
+          remove os vinculos com os ancestrais antigos e cria o produto
+          cartesiano (novos ancestrais x nos da subarvore) em bulk.
+        '''
+        subtree = list(cls.objects.filter(ancestor=category).values_list('descendant_id', 'depth'))
+        subtree_ids = [descendant_id for descendant_id, _depth in subtree]
+        if category.parent_id in subtree_ids:
+            raise ValueError('A category cannot be moved under itself or its descendants.')
+
+        cls.objects.filter(descendant_id__in=subtree_ids).exclude(ancestor_id__in=subtree_ids).delete()
+
+        if category.parent_id is None:
+            return
+
+        new_ancestors = list(cls.objects.filter(descendant_id=category.parent_id).values_list('ancestor_id', 'depth'))
+        cls.objects.bulk_create(
+            [
+                cls(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=a_depth + d_depth + 1)
+                for ancestor_id, a_depth in new_ancestors
+                for descendant_id, d_depth in subtree
+            ],
+            batch_size=1000,
+        )
+
 
 class ProductCategory(StandardModel):
     '''
@@ -51,6 +185,10 @@ class ProductCategory(StandardModel):
         verbose_name = _("Product Category")
         verbose_name_plural = _("Product Categories")
         unique_together = ('product', 'category')
+        indexes = [
+            models.Index(fields=['created_at'], name='productcategory_created_idx'),
+            models.Index(fields=['updated_at', 'id'], name='productcategory_updated_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.category.name}"
@@ -67,6 +205,11 @@ class ProductImage(StandardModel):
     class Meta:
         verbose_name = _("Product Image")
         verbose_name_plural = _("Product Images")
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='productimage_updated_id_idx'),
+            models.Index(fields=['created_at'], name='productimage_created_idx'),
+            models.Index(fields=['deleted_at'], name='productimage_deleted_idx'),
+        ]
 
     def __str__(self):
         return f"Image for {self.product.name}"
@@ -76,3 +219,146 @@ class ProductImage(StandardModel):
             return self.image.url
         return ""
 
+
+class RelatedProduct(models.Model):
+    '''
+      Lista pre-calculada de produtos relacionados (por categorias em comum),
+      mantida pelo comando build_related_products. rank 0 = mais relacionado.
+    '''
+    id = models.BigAutoField(primary_key=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_from')
+    rank = models.PositiveSmallIntegerField()
+    score = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name = _("Related Product")
+        verbose_name_plural = _("Related Products")
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='uniq_related_product_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} (#{self.rank})"
+
+
+class RelatedProductsRefresh(models.Model):
+    '''
+      Fila de recalculo incremental dos produtos relacionados: produtos cujas
+      categorias mudaram e categorias que ganharam/perderam produtos.
+      Consumida por build_related_products --incremental.
+    '''
+    id = models.BigAutoField(primary_key=True)
+    product = models.ForeignKey(Product, null=True, on_delete=models.CASCADE, related_name='+')
+    category = models.ForeignKey(Category, null=True, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("Related Products Refresh")
+        verbose_name_plural = _("Related Products Refreshes")
+
+    def __str__(self):
+        return f"product={self.product_id} category={self.category_id}"
+
+
+class Order(StandardModel):
+    '''
+      Pedido gerado a partir de um checkout validado. Gravado em bulk pela
+      fila write-behind de products/orders.py.
+    '''
+    STATUS_PLACED = 'placed'
+    STATUS_CONFIRMED = 'confirmed'
+    STATUS_CANCELLED = 'cancelled'
+    STATUS_CHOICES = (
+        (STATUS_PLACED, _("Placed")),
+        (STATUS_CONFIRMED, _("Confirmed")),
+        (STATUS_CANCELLED, _("Cancelled")),
+    )
+
+    customer_name = models.CharField(max_length=255, blank=True, verbose_name=_("Customer Name"))
+    notes = models.TextField(blank=True, verbose_name=_("Notes"))
+    total_value = models.DecimalField(max_digits=12, decimal_places=2, verbose_name=_("Total Value"))
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PLACED, verbose_name=_("Status"))
+
+    class Meta:
+        verbose_name = _("Order")
+        verbose_name_plural = _("Orders")
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='order_created_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.id} ({self.total_value})"
+
+
+class OrderItem(StandardModel):
+    '''
+      Item do pedido; nome e preco sao copiados do produto no momento do checkout.
+    '''
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items', verbose_name=_("Order"))
+    product = models.ForeignKey(
+        Product,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='order_items',
+        verbose_name=_("Product"),
+    )
+    name = models.CharField(max_length=255, verbose_name=_("Name"))
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name=_("Unit Price"))
+    qty = models.PositiveIntegerField(verbose_name=_("Quantity"))
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, verbose_name=_("Subtotal"))
+
+    class Meta:
+        verbose_name = _("Order Item")
+        verbose_name_plural = _("Order Items")
+
+    def __str__(self):
+        return f"{self.name} x{self.qty}"
+
+
+class UploadSession(StandardModel):
+    '''
+      Sessao de upload em partes (chunked/resumable) de imagens de produtos.
+      Os chunks sao gravados direto em um arquivo temporario em disco; ao
+      finalizar, o arquivo vira um ProductImage ou fica disponivel para ser
+      referenciado como file_key="upload:<id>" nas operacoes de images.
+    '''
+    STATUS_OPEN = 'open'
+    STATUS_COMPLETED = 'completed'
+    STATUS_CONSUMED = 'consumed'
+    STATUS_CHOICES = (
+        (STATUS_OPEN, _("Open")),
+        (STATUS_COMPLETED, _("Completed")),
+        (STATUS_CONSUMED, _("Consumed")),
+    )
+
+    filename = models.CharField(max_length=255, verbose_name=_("File Name"))
+    content_type = models.CharField(max_length=100, blank=True, verbose_name=_("Content Type"))
+    total_size = models.PositiveBigIntegerField(verbose_name=_("Total Size"))
+    received_bytes = models.PositiveBigIntegerField(default=0, verbose_name=_("Received Bytes"))
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_OPEN, verbose_name=_("Status"))
+
+    class Meta:
+        verbose_name = _("Upload Session")
+        verbose_name_plural = _("Upload Sessions")
+
+    def __str__(self):
+        return f"{self.filename} ({self.received_bytes}/{self.total_size})"
+
+    @property
+    def file_key(self):
+        return f'upload:{self.id}'
+
+    @property
+    def temp_path(self):
+        return Path(settings.UPLOAD_SESSIONS_DIR) / f'{self.id}.part'
+
+    def is_complete(self):
+        return self.received_bytes == self.total_size
+
+    def discard_temp_file(self):
+        try:
+            self.temp_path.unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,115 @@
+'''
+  Pedidos do checkout, gravados via fila write-behind (standard/writebehind.py).
+
+  O checkout so gera o id do pedido e enfileira o registro; a gravacao
+  acontece em bulk (ORDER_QUEUE_MAX_BATCH pedidos ou a cada
+  ORDER_QUEUE_FLUSH_SECONDS). Os ids saem daqui, antes do spool, entao
+  regravar um registro recuperado nao duplica nada: replay_orders descarta os
+  pedidos que ja existem. Nao ha ignore_conflicts (INSERT IGNORE no MySQL
+  descartaria em silencio itens com FK invalida ou valores truncados); o
+  registro que falha vai para o dead-letter da fila.
+'''
+import uuid
+from decimal import Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from standard.writebehind import WriteBehindQueue
+
+from .models import Order, OrderItem
+
+QUEUE_NAME = 'orders'
+
+
+def save_orders(records):
+    orders = []
+    items = []
+    for record in records:
+        created_at = parse_datetime(record['created_at'])
+        orders.append(Order(
+            id=record['id'],
+            customer_name=record['customer_name'],
+            notes=record['notes'],
+            total_value=Decimal(record['total_value']),
+            status=record['status'],
+            created_at=created_at,
+        ))
+        items.extend(
+            OrderItem(
+                id=item['id'],
+                order_id=record['id'],
+                product_id=item['product_id'],
+                name=item['name'],
+                unit_price=Decimal(item['unit_price']),
+                qty=item['qty'],
+                subtotal=Decimal(item['subtotal']),
+                created_at=created_at,
+            )
+            for item in record['items']
+        )
+
+    with transaction.atomic():
+        Order.objects.bulk_create(orders)
+        OrderItem.objects.bulk_create(items)
+
+
+def replay_orders(records):
+    '''
+      save_orders para registros recuperados do spool, que podem ja ter sido
+      gravados antes da queda (pedido e itens sao gravados na mesma transacao).
+    '''
+    existing = {
+        str(order_id)
+        for order_id in Order.objects.filter(id__in=[r['id'] for r in records]).values_list('id', flat=True)
+    }
+    save_orders([r for r in records if r['id'] not in existing])
+
+
+@lru_cache(maxsize=None)
+def get_order_queue():
+    return WriteBehindQueue(
+        QUEUE_NAME,
+        save_orders,
+        settings.ORDER_QUEUE_SPOOL_DIR,
+        max_batch=settings.ORDER_QUEUE_MAX_BATCH,
+        flush_seconds=settings.ORDER_QUEUE_FLUSH_SECONDS,
+        fsync=settings.ORDER_QUEUE_FSYNC,
+        max_attempts=settings.ORDER_QUEUE_MAX_ATTEMPTS,
+        replay_handler=replay_orders,
+    )
+
+
+def build_order_record(customer_name, notes, total, items):
+    '''
+      items: [{'product_id', 'name', 'unit_price', 'qty', 'subtotal'}] com
+      valores ja formatados (strings), como na resposta do checkout.
+    '''
+    return {
+        'id': str(uuid.uuid4()),
+        'customer_name': customer_name,
+        'notes': notes,
+        'total_value': total,
+        'status': Order.STATUS_PLACED,
+        'created_at': timezone.now().isoformat(),
+        'items': [{'id': str(uuid.uuid4()), **item} for item in items],
+    }
+
+
+def enqueue_order(record, queue=None):
+    (queue or get_order_queue()).put(record)
+    return record['id']
+
+
+def find_pending_order(order_id):
+    '''
+      Registro ainda nao gravado por esta fila (mesmo processo), ou None.
+    '''
+    order_id = str(order_id)
+    for record in get_order_queue().pending():
+        if record['id'] == order_id:
+            return record
+    return None
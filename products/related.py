@@ -0,0 +1,233 @@
+'''
+  Produtos relacionados ("voce tambem pode gostar") por categorias em comum.
+
+  score(A, B) = numero de categorias que A e B compartilham. Cada produto
+  guarda os RELATED_PRODUCTS_TOP_K melhores em RelatedProduct; empates sao
+  decididos por estoque (maior primeiro) e depois pelo mais recente.
+
+  O calculo roda em memoria sobre um indice invertido (categoria -> produtos):
+    - os produtos sao numerados pela ordem de desempate (0 = melhor), entao
+      "menor numero" ja e o criterio de desempate e tudo vira inteiro;
+    - cada categoria contribui com no maximo RELATED_PRODUCTS_CANDIDATES_PER_CATEGORY
+      candidatos (os melhores pela ordem de desempate), o que limita o custo
+      por produto mesmo em categorias com centenas de milhares de itens;
+    - a contagem (Counter.update) e as ordenacoes rodam em C, sem chamadas
+      Python por candidato.
+
+  Alteracoes de vinculo produto/categoria entram na fila RelatedProductsRefresh
+  (mark_dirty) e sao aplicadas por build_related_products --incremental, que
+  carrega so as categorias dos produtos da fila e os candidatos dessas
+  categorias (RelatedIndex(product_ids=...)). Rode-o a cada poucos minutos
+  (cron, ou um processo com build_related_products --incremental --watch 60).
+  Estoque e data mudam o desempate de todo o catalogo: para isso, rode a
+  reconstrucao completa periodicamente (por exemplo, uma vez por noite).
+'''
+from collections import Counter
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import Product, ProductCategory, RelatedProduct, RelatedProductsRefresh
+
+
+def mark_dirty(product_ids=(), category_ids=()):
+    '''
+      Agenda o recalculo dos produtos informados e de todos os produtos das
+      categorias informadas.
+    '''
+    rows = [RelatedProductsRefresh(product_id=pid) for pid in set(product_ids)]
+    rows += [RelatedProductsRefresh(category_id=cid) for cid in set(category_ids)]
+    if rows:
+        RelatedProductsRefresh.objects.bulk_create(rows)
+
+
+class RelatedIndex:
+    '''
+      Indice invertido em memoria de todo o catalogo vivo ou, com product_ids,
+      so do necessario para recalcular esses produtos: as categorias deles e
+      os candidatos de cada uma (related() vale apenas para esses produtos).
+    '''
+    def __init__(self, candidates_per_category=None, product_ids=None):
+        self.candidates_per_category = candidates_per_category or settings.RELATED_PRODUCTS_CANDIDATES_PER_CATEGORY
+        if product_ids is None:
+            self._load_catalog()
+        else:
+            self._load_products(set(product_ids))
+
+    def _load_catalog(self):
+        self.product_ids = list(
+            Product.objects.alive()
+            .order_by('-stock', '-created_at', 'id')
+            .values_list('id', flat=True)
+            .iterator(chunk_size=10000)
+        )
+        self.position = {pid: n for n, pid in enumerate(self.product_ids)}
+
+        self.categories_of = [[] for _ in self.product_ids]
+        self.members = {}
+        links = (
+            ProductCategory.objects
+            .filter(product__deleted_at__isnull=True, category__deleted_at__isnull=True)
+            .values_list('product_id', 'category_id')
+            .iterator(chunk_size=10000)
+        )
+        for product_id, category_id in links:
+            n = self.position.get(product_id)
+            if n is None:
+                continue
+            self.categories_of[n].append(category_id)
+            self.members.setdefault(category_id, []).append(n)
+
+        self.candidates = {}
+        for category_id, members in self.members.items():
+            members.sort()
+            self.candidates[category_id] = members[:self.candidates_per_category]
+
+    def _load_products(self, product_ids):
+        links = list(
+            ProductCategory.objects
+            .filter(product_id__in=product_ids, product__deleted_at__isnull=True, category__deleted_at__isnull=True)
+            .values_list('product_id', 'category_id')
+        )
+        # os melhores candidatos de cada categoria, pela mesma ordem de desempate
+        ranked = (
+            ProductCategory.objects
+            .filter(
+                category_id__in={category_id for _, category_id in links},
+                product__deleted_at__isnull=True,
+            )
+            .annotate(rank=Window(
+                RowNumber(),
+                partition_by=F('category_id'),
+                order_by=(F('product__stock').desc(), F('product__created_at').desc(), F('product_id').asc()),
+            ))
+            .filter(rank__lte=self.candidates_per_category)
+            .values_list('category_id', 'product_id')
+        ) if links else []
+        candidates = {}
+        for category_id, product_id in ranked:
+            candidates.setdefault(category_id, []).append(product_id)
+
+        involved = {product_id for product_id, _ in links}
+        for members in candidates.values():
+            involved.update(members)
+        self.product_ids = list(
+            Product.objects.filter(id__in=involved)
+            .order_by('-stock', '-created_at', 'id')
+            .values_list('id', flat=True)
+        )
+        self.position = {pid: n for n, pid in enumerate(self.product_ids)}
+
+        self.categories_of = [[] for _ in self.product_ids]
+        # (um produto apagado de vez entre as consultas simplesmente fica de fora)
+        for product_id, category_id in links:
+            if product_id in self.position:
+                self.categories_of[self.position[product_id]].append(category_id)
+        self.candidates = {
+            category_id: sorted(self.position[pid] for pid in members if pid in self.position)
+            for category_id, members in candidates.items()
+        }
+
+    def related(self, n, k):
+        '''
+          [(posicao, score), ...] dos k produtos mais relacionados ao produto n.
+        '''
+        categories = self.categories_of[n]
+        if not categories:
+            return []
+        if len(categories) == 1:
+            # caso comum: score 1 para todos, a ordem da categoria ja e a resposta
+            return [(m, 1) for m in self.candidates[categories[0]][:k + 1] if m != n][:k]
+
+        counts = Counter()
+        for category_id in categories:
+            counts.update(self.candidates[category_id])
+        counts.pop(n, None)
+        # ordena pela posicao e depois, de forma estavel, pelo score (decrescente)
+        ranked = sorted(counts.items())
+        ranked.sort(key=itemgetter(1), reverse=True)
+        return ranked[:k]
+
+
+def write_related(index, positions, k=None, chunk_size=2000):
+    '''
+      Recalcula e grava as listas dos produtos nas posicoes informadas,
+      substituindo as anteriores, em transacoes de chunk_size produtos.
+      Retorna o numero de linhas gravadas.
+    '''
+    k = k or settings.RELATED_PRODUCTS_TOP_K
+    alias = router.db_for_write(RelatedProduct)
+    connection = connections[alias]
+    opts = RelatedProduct._meta
+    sql = 'INSERT INTO {} ({}) VALUES (%s, %s, %s, %s)'.format(
+        connection.ops.quote_name(opts.db_table),
+        ', '.join(connection.ops.quote_name(opts.get_field(name).column) for name in ('product', 'related', 'rank', 'score')),
+    )
+    # sem instanciar RelatedProduct por linha: o custo do ORM dominaria a reconstrucao
+    to_db = opts.get_field('product').target_field.get_db_prep_value
+    db_ids = {}
+
+    def db_id(n):
+        value = db_ids.get(n)
+        if value is None:
+            value = db_ids[n] = to_db(index.product_ids[n], connection)
+        return value
+
+    positions = sorted(positions)
+    written = 0
+    for start in range(0, len(positions), chunk_size):
+        chunk = positions[start:start + chunk_size]
+        rows = [
+            (db_id(n), db_id(m), rank, score)
+            for n in chunk
+            for rank, (m, score) in enumerate(index.related(n, k))
+        ]
+        with transaction.atomic(using=alias):
+            RelatedProduct.objects.using(alias).filter(product_id__in=[index.product_ids[n] for n in chunk]).delete()
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+        written += len(rows)
+    return written
+
+
+def rebuild_all(chunk_size=2000):
+    '''
+      Reconstrucao completa. Retorna (produtos, linhas gravadas).
+    '''
+    # o que ja estava na fila fica coberto por esta reconstrucao
+    last_id = RelatedProductsRefresh.objects.order_by('-id').values_list('id', flat=True).first()
+    index = RelatedIndex()
+    written = write_related(index, range(len(index.product_ids)), chunk_size=chunk_size)
+    # produtos removidos (logicamente) desde a ultima reconstrucao
+    RelatedProduct.objects.filter(product__deleted_at__isnull=False).delete()
+    if last_id is not None:
+        RelatedProductsRefresh.objects.filter(id__lte=last_id).delete()
+    return len(index.product_ids), written
+
+
+def rebuild_dirty(chunk_size=2000):
+    '''
+      Consome a fila RelatedProductsRefresh. Retorna (produtos, linhas gravadas).
+    '''
+    last_id = RelatedProductsRefresh.objects.order_by('-id').values_list('id', flat=True).first()
+    if last_id is None:
+        return 0, 0
+
+    queued = list(RelatedProductsRefresh.objects.filter(id__lte=last_id).values_list('product_id', 'category_id'))
+    product_ids = {pid for pid, _ in queued if pid}
+    category_ids = {cid for _, cid in queued if cid}
+    if category_ids:
+        # inclui categorias ja removidas: os antigos membros tambem precisam de recalculo
+        product_ids.update(
+            ProductCategory.objects.filter(category_id__in=category_ids).values_list('product_id', flat=True)
+        )
+
+    index = RelatedIndex(product_ids=product_ids)
+    positions = [index.position[pid] for pid in product_ids if pid in index.position]
+    written = write_related(index, positions, chunk_size=chunk_size)
+    RelatedProduct.objects.filter(product_id__in=[pid for pid in product_ids if pid not in index.position]).delete()
+    RelatedProductsRefresh.objects.filter(id__lte=last_id).delete()
+    return len(product_ids), written
@@ -1,15 +1,40 @@
+from functools import wraps
+
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import serializers
 
-from .models import Product, Category, ProductCategory, ProductImage
+from standard.transactions import bounded_atomic
+
+from .models import Product, Category, ProductCategory, ProductImage, UploadSession
+from .related import mark_dirty
+from .uploads import open_session_file, parse_file_key
 
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
-        fields = ('id', 'name', 'description', 'created_at', 'updated_at')
+        fields = ('id', 'name', 'description', 'parent', 'created_at', 'updated_at')
         read_only_fields = ('id', 'created_at', 'updated_at')
 
+    def validate_parent(self, value):
+        # impede ciclos: a categoria não pode ir para baixo dela mesma ou de um descendente
+        if value and self.instance and (value.id == self.instance.id or value.is_descendant_of(self.instance)):
+            raise serializers.ValidationError('A categoria não pode ficar abaixo dela mesma ou de um descendente.')
+        return value
+
+
+class CategoryTreeSerializer(serializers.Serializer):
+    id = serializers.UUIDField()
+    name = serializers.CharField()
+    description = serializers.CharField()
+    product_count = serializers.IntegerField()
+    children = serializers.SerializerMethodField()
+
+    def get_children(self, obj):
+        return CategoryTreeSerializer(obj['children'], many=True).data
+
 
 class ProductImageSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
@@ -24,9 +49,48 @@ class ProductImageSerializer(serializers.ModelSerializer):
 
 
 class ProductReadSerializer(serializers.ModelSerializer):
+    '''
+    Leitura com campos esparsos:
+    - ?fields=id,name,price,is_in_stock,cover_image  -> apenas esses campos
+    - ?expand=categories,images                      -> relações (aninhadas) incluídas
+
+    Sem ?fields o formato padrão é mantido (todos os campos de DEFAULT_FIELDS);
+    se só ?expand vier, as relações ficam restritas às informadas.
+    O conjunto efetivo chega em context['fields'] (ver resolve_fields).
+    '''
     is_in_stock = serializers.SerializerMethodField()
     categories = serializers.SerializerMethodField()
     images = ProductImageSerializer(many=True, read_only=True)
+    cover_image = serializers.SerializerMethodField()
+
+    DEFAULT_FIELDS = (
+        'id',
+        'name',
+        'description',
+        'price',
+        'stock',
+        'is_in_stock',
+        'categories',
+        'images',
+        'created_at',
+        'updated_at',
+    )
+    EXPANDABLE_FIELDS = ('categories', 'images')
+
+    # colunas de Product necessárias para cada campo (usado no .only())
+    FIELD_COLUMNS = {
+        'id': ('id',),
+        'name': ('name',),
+        'description': ('description',),
+        'price': ('price',),
+        'stock': ('stock',),
+        'is_in_stock': ('stock',),
+        'categories': (),
+        'images': (),
+        'cover_image': (),
+        'created_at': ('created_at',),
+        'updated_at': ('updated_at',),
+    }
 
     class Meta:
         model = Product
@@ -39,19 +103,109 @@ class ProductReadSerializer(serializers.ModelSerializer):
             'is_in_stock',
             'categories',
             'images',
+            'cover_image',
             'created_at',
             'updated_at',
         )
         read_only_fields = fields
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = self.context.get('fields')
+        if requested is None:
+            requested = self.DEFAULT_FIELDS
+        for name in set(self.fields) - set(requested):
+            self.fields.pop(name)
+
+    @classmethod
+    def resolve_fields(cls, fields_param, expand_param):
+        '''
+        Converte ?fields= e ?expand= no conjunto de campos a serializar.
+        Retorna None quando nenhum dos dois foi informado (formato padrão).
+        '''
+        if fields_param is None and expand_param is None:
+            return None
+
+        def split(raw):
+            return [f.strip() for f in (raw or '').split(',') if f.strip()]
+
+        expand = split(expand_param)
+        invalid = [f for f in expand if f not in cls.EXPANDABLE_FIELDS]
+        if invalid:
+            raise serializers.ValidationError({'expand': f'Expansões inválidas: {invalid}'})
+
+        if fields_param is None:
+            base = [f for f in cls.DEFAULT_FIELDS if f not in cls.EXPANDABLE_FIELDS]
+        else:
+            base = split(fields_param)
+            invalid = [f for f in base if f not in cls.Meta.fields]
+            if invalid:
+                raise serializers.ValidationError({'fields': f'Campos inválidos: {invalid}'})
+
+        return set(base) | set(expand)
+
+    @classmethod
+    def optimize_queryset(cls, queryset, fields, extra_columns=()):
+        '''
+        Restringe colunas (.only()) e prefetches ao que será serializado.
+        '''
+        if fields is None:
+            fields = set(cls.DEFAULT_FIELDS)
+
+        columns = {'id', *extra_columns}
+        for name in fields:
+            columns.update(cls.FIELD_COLUMNS[name])
+        queryset = queryset.only(*sorted(columns))
+
+        prefetches = []
+        if 'images' in fields:
+            prefetches.append(Prefetch('images', queryset=ProductImage.objects.alive()))
+        if 'categories' in fields:
+            prefetches.append(Prefetch(
+                'categories',
+                queryset=ProductCategory.objects.filter(category__deleted_at__isnull=True).select_related('category'),
+            ))
+        if 'cover_image' in fields:
+            prefetches.append(Prefetch(
+                'images',
+                queryset=ProductImage.objects.alive().order_by('created_at', 'id').only('id', 'product_id', 'image')[:1],
+                to_attr='cover_images',
+            ))
+        return queryset.prefetch_related(*prefetches)
+
     def get_is_in_stock(self, obj):
         return obj.is_in_stock()
 
     def get_categories(self, obj):
-        pcs = obj.categories.select_related('category').all()
-        cats = [pc.category for pc in pcs]
+        # usa o cache do prefetch (categories + category)
+        cats = [pc.category for pc in obj.categories.all()]
         return CategorySerializer(cats, many=True).data
 
+    def get_cover_image(self, obj):
+        images = getattr(obj, 'cover_images', None)
+        if images is None:
+            images = obj.images.alive().order_by('created_at', 'id')[:1]
+        for image in images:
+            return image.get_image_url()
+        return None
+
+
+def _discard_images_on_error(method):
+    '''
+      Se create/update falhar (e a transacao for desfeita), apaga do storage os
+      arquivos das imagens ja gravadas, que ficariam sem linha no banco.
+    '''
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self._stored_images = []
+        try:
+            return method(self, *args, **kwargs)
+        except Exception:
+            for image in self._stored_images:
+                image.image.delete(save=False)
+            raise
+    return wrapper
+
 
 class ProductWriteSerializer(serializers.ModelSerializer):
     '''
@@ -68,6 +222,10 @@ class ProductWriteSerializer(serializers.ModelSerializer):
     Multipart:
     - 'images' deve ser enviado como string JSON
     - arquivos em keys separadas (img1, img_new, etc.)
+
+    Upload em partes (/api/v1/uploads/):
+    - file_key 'upload:<uuid da sessão>' usa o arquivo de uma sessão finalizada,
+      sem precisar reenviar a imagem no multipart (o body pode ser JSON)
     '''
     category_ids = serializers.ListField(
         child=serializers.UUIDField(),
@@ -85,7 +243,10 @@ class ProductWriteSerializer(serializers.ModelSerializer):
 
     def validate_category_ids(self, value):
         # value já vem como lista de UUID (python uuid.UUID)
-        existing = set(Category.objects.filter(id__in=value).values_list('id', flat=True))
+        # no lote (/api/v1/batch/) os ids existentes já vêm carregados no context
+        existing = self.context.get('existing_category_ids')
+        if existing is None:
+            existing = set(Category.objects.alive().filter(id__in=value).values_list('id', flat=True))
         missing = [cid for cid in value if cid not in existing]
         if missing:
             # stringifica para ficar legível
@@ -127,12 +288,54 @@ class ProductWriteSerializer(serializers.ModelSerializer):
         return value
 
     def _get_uploaded_file(self, file_key: str):
+        session_id = parse_file_key(file_key)
+        if session_id:
+            return self._get_session_file(session_id)
+
         request = self.context.get('request')
         if not request:
             return None
         return request.FILES.get(file_key)
 
-    @transaction.atomic
+    def _get_session_file(self, session_id):
+        # chamado dentro do bounded_atomic de create/update
+        try:
+            session = UploadSession.objects.select_for_update().get(
+                id=session_id,
+                status=UploadSession.STATUS_COMPLETED,
+            )
+        except (UploadSession.DoesNotExist, DjangoValidationError):
+            return None
+        if not session.temp_path.exists():
+            return None
+
+        # copia em vez de mover: se a transacao for desfeita a sessao volta a
+        # completed e o arquivo temporario precisa continuar existindo
+        session.status = UploadSession.STATUS_CONSUMED
+        session.save(update_fields=['status', 'updated_at'])
+        transaction.on_commit(session.discard_temp_file)
+        return open_session_file(session, move=False)
+
+    def _create_image(self, product, file_obj, alt_text):
+        try:
+            image = ProductImage.objects.create(product=product, image=file_obj, alt_text=alt_text)
+        finally:
+            file_obj.close()
+        self._stored_images.append(image)
+        return image
+
+    def _replace_image(self, image, file_obj):
+        # o arquivo anterior continua no storage (e na linha, se a transacao
+        # for desfeita); o novo entra em _stored_images como na criacao
+        try:
+            image.image = file_obj
+            image.save()
+        finally:
+            file_obj.close()
+        self._stored_images.append(image)
+
+    @_discard_images_on_error
+    @bounded_atomic()
     def create(self, validated_data):
         category_ids = validated_data.pop('category_ids', [])
         images_ops = validated_data.pop('images', [])
@@ -144,6 +347,7 @@ class ProductWriteSerializer(serializers.ModelSerializer):
                 [ProductCategory(product=product, category_id=cid) for cid in category_ids],
                 ignore_conflicts=True,
             )
+            mark_dirty([product.id], category_ids)
 
         # create-only: não aceita id nas imagens
         for op in images_ops:
@@ -155,15 +359,12 @@ class ProductWriteSerializer(serializers.ModelSerializer):
             if not file_obj:
                 raise serializers.ValidationError(f'Arquivo não encontrado no form-data para file_key="{file_key}".')
 
-            ProductImage.objects.create(
-                product=product,
-                image=file_obj,
-                alt_text=op.get('alt_text', ''),
-            )
+            self._create_image(product, file_obj, op.get('alt_text', ''))
 
         return product
 
-    @transaction.atomic
+    @_discard_images_on_error
+    @bounded_atomic()
     def update(self, instance, validated_data):
         category_ids = validated_data.pop('category_ids', None)
         images_ops = validated_data.pop('images', None)
@@ -173,12 +374,16 @@ class ProductWriteSerializer(serializers.ModelSerializer):
         instance.save()
 
         if category_ids is not None:
-            ProductCategory.objects.filter(product=instance).delete()
+            links = ProductCategory.objects.filter(product=instance)
+            changed = set(links.values_list('category_id', flat=True)) ^ set(category_ids)
+            links.delete()
             if category_ids:
                 ProductCategory.objects.bulk_create(
                     [ProductCategory(product=instance, category_id=cid) for cid in category_ids],
                     ignore_conflicts=True,
                 )
+            if changed:
+                mark_dirty([instance.id], changed)
 
         if images_ops is not None:
             uuid_field = serializers.UUIDField()
@@ -193,12 +398,12 @@ class ProductWriteSerializer(serializers.ModelSerializer):
 
                 if img_id:
                     try:
-                        img = ProductImage.objects.get(id=img_id, product=instance)
+                        img = ProductImage.objects.alive().get(id=img_id, product=instance)
                     except ProductImage.DoesNotExist:
                         raise serializers.ValidationError(f'Imagem id={str(img_id)} não pertence a este produto.')
 
                     if to_delete:
-                        img.delete()
+                        img.soft_delete()
                         continue
 
                     if alt_text is not None:
@@ -210,9 +415,9 @@ class ProductWriteSerializer(serializers.ModelSerializer):
                             raise serializers.ValidationError(
                                 f'Arquivo não encontrado no form-data para file_key="{file_key}".'
                             )
-                        img.image = file_obj
-
-                    img.save()
+                        self._replace_image(img, file_obj)
+                    else:
+                        img.save()
 
                 else:
                     if to_delete:
@@ -224,10 +429,6 @@ class ProductWriteSerializer(serializers.ModelSerializer):
                     if not file_obj:
                         raise serializers.ValidationError(f'Arquivo não encontrado no form-data para file_key="{file_key}".')
 
-                    ProductImage.objects.create(
-                        product=instance,
-                        image=file_obj,
-                        alt_text=alt_text or '',
-                    )
+                    self._create_image(instance, file_obj, alt_text or '')
 
         return instance
\ No newline at end of file
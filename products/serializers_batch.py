@@ -0,0 +1,46 @@
+from django.conf import settings
+from rest_framework import serializers
+
+from .models import Category
+from .serializers import CategorySerializer
+
+
+class BatchOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=('create', 'update', 'delete'))
+    resource = serializers.ChoiceField(choices=('product', 'category'))
+    id = serializers.UUIDField(required=False)
+    data = serializers.DictField(required=False, default=dict)
+
+    def validate(self, attrs):
+        if attrs['op'] != 'create' and not attrs.get('id'):
+            raise serializers.ValidationError({'id': f'Obrigatório para {attrs["op"]}.'})
+        if attrs['op'] == 'create' and attrs.get('id'):
+            raise serializers.ValidationError({'id': 'Na criação, não envie "id".'})
+        return attrs
+
+
+class BatchRequestSerializer(serializers.Serializer):
+    '''
+    - atomic=true (padrão): tudo ou nada; se algum item falhar nada é aplicado
+    - atomic=false: aplica os itens válidos e devolve o erro de cada inválido
+    '''
+    atomic = serializers.BooleanField(required=False, default=True)
+    operations = BatchOperationSerializer(many=True, allow_empty=False, max_length=settings.BATCH_MAX_OPERATIONS)
+
+
+class BatchCategorySerializer(CategorySerializer):
+    '''
+    Igual ao CategorySerializer, mas valida o parent contra as categorias
+    já carregadas para o lote (context['existing_category_ids']) em vez de
+    fazer uma query por item.
+    '''
+    parent = serializers.UUIDField(source='parent_id', required=False, allow_null=True)
+
+    def validate_parent(self, value):
+        if value is None:
+            return value
+        if value not in self.context['existing_category_ids']:
+            raise serializers.ValidationError(f'Categoria não encontrada: {value}')
+        if self.instance and (value == self.instance.id or Category(id=value).is_descendant_of(self.instance)):
+            raise serializers.ValidationError('A categoria não pode ficar abaixo dela mesma ou de um descendente.')
+        return value
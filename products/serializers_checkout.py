@@ -8,5 +8,5 @@ class CheckoutItemSerializer(serializers.Serializer):
 
 class CheckoutValidateSerializer(serializers.Serializer):
     items = CheckoutItemSerializer(many=True)
-    customer_name = serializers.CharField(required=False, allow_blank=True)
+    customer_name = serializers.CharField(required=False, allow_blank=True, max_length=255)
     notes = serializers.CharField(required=False, allow_blank=True)
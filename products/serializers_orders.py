@@ -0,0 +1,25 @@
+from rest_framework import serializers
+
+from .models import Order, OrderItem
+
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    product_id = serializers.UUIDField(read_only=True, allow_null=True)
+
+    class Meta:
+        model = OrderItem
+        fields = ('id', 'product_id', 'name', 'unit_price', 'qty', 'subtotal')
+        read_only_fields = fields
+
+
+class OrderSerializer(serializers.ModelSerializer):
+    '''
+    Serve tanto para Order quanto para o registro (dict) ainda na fila
+    write-behind, que tem as mesmas chaves.
+    '''
+    items = OrderItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ('id', 'status', 'customer_name', 'notes', 'total_value', 'items', 'created_at')
+        read_only_fields = fields
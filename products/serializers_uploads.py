@@ -0,0 +1,52 @@
+import os
+
+from django.conf import settings
+from rest_framework import serializers
+
+from .models import Product, UploadSession
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    offset = serializers.IntegerField(source='received_bytes', read_only=True)
+    file_key = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ('id', 'filename', 'content_type', 'total_size', 'offset', 'status', 'file_key', 'created_at', 'updated_at')
+        read_only_fields = ('id', 'offset', 'status', 'file_key', 'created_at', 'updated_at')
+
+    def validate_filename(self, value):
+        name = os.path.basename(value.replace('\\', '/'))
+        if not name:
+            raise serializers.ValidationError('Nome de arquivo inválido.')
+        return name
+
+    def validate_total_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError('total_size deve ser maior que zero.')
+        max_size = settings.UPLOAD_SESSION_MAX_SIZE
+        if value > max_size:
+            raise serializers.ValidationError(f'total_size excede o limite de {max_size} bytes.')
+        return value
+
+
+class UploadSessionFinalizeSerializer(serializers.Serializer):
+    '''
+    - sem product_id: a sessao fica "completed" e pode ser usada como
+      file_key="upload:<id>" nas operações de images do ProductWriteSerializer
+    - com product_id: cria o ProductImage direto a partir do arquivo
+    '''
+    product_id = serializers.UUIDField(required=False)
+    alt_text = serializers.CharField(required=False, allow_blank=True, max_length=255)
+
+    def validate_product_id(self, value):
+        if not Product.objects.alive().filter(id=value).exists():
+            raise serializers.ValidationError(f'Produto não encontrado: {value}')
+        return value
+
+
+class UploadedImageSerializer(serializers.Serializer):
+    '''
+    Valida (via Pillow) que o arquivo montado a partir dos chunks é uma imagem.
+    '''
+    file = serializers.ImageField()
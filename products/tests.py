@@ -1,3 +1,723 @@
-from django.test import TestCase
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import DatabaseError, IntegrityError, OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient, APIRequestFactory
+
+from standard import throttling
+from standard.writebehind import WriteBehindQueue, read_spool
+
+from . import batch
+from .batch import run_batch
+from .checks import check_change_feed_settle_window
+from .models import Category, CategoryClosure, Order, Product, ProductCategory, ProductImage, RelatedProduct, UploadSession
+from .orders import build_order_record, get_order_queue, replay_orders, save_orders
+from .related import mark_dirty, rebuild_all, rebuild_dirty
+from .serializers import ProductWriteSerializer
+from .uploads import create_temp_file, purge_expired_sessions
+from .views import ProductViewSet
+
+
+class ListThrottle(throttling.TokenBucketThrottle):
+    THROTTLE_RATES = {'product_list': '5/s'}
+
+
+@override_settings(LOAD_SHEDDING_LIMITS={'test': 2}, LOAD_SHEDDING_RETRY_AFTER=1)
+class RateLimitTests(TransactionTestCase):
+    '''
+      Limite por cliente e descarte de carga na listagem de produtos, com o
+      balde local (standard/throttling.py).
+    '''
+    PATH = '/api/v1/products/?fields=id,name'
+
+    def setUp(self):
+        Product.objects.bulk_create(
+            Product(name=f'Produto {i}', description='', price=Decimal('9.90'), stock=1) for i in range(20)
+        )
+        buckets = throttling._shared_buckets
+        throttling._shared_buckets = throttling.LocalTokenBuckets()
+        self.addCleanup(setattr, throttling, '_shared_buckets', buckets)
+        semaphores = dict(throttling._semaphores)
+        throttling._semaphores.clear()
+        self.addCleanup(throttling._semaphores.update, semaphores)
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        self.addCleanup(request_logger.setLevel, level)
+
+        self.factory = APIRequestFactory()
+        self.view = ProductViewSet.as_view(
+            {'get': 'list'}, throttle_classes=(ListThrottle,), load_shedding_scope='test',
+        )
+
+    def get(self, ip, **headers):
+        return self.view(self.factory.get(self.PATH, REMOTE_ADDR=ip, **headers))
+
+    def test_abusive_client_is_limited_while_well_behaved_client_is_served(self):
+        stop = threading.Event()
+        abusive_statuses = []
+
+        def abusive():
+            try:
+                while not stop.is_set():
+                    abusive_statuses.append(self.get('10.0.0.66').status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=abusive) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        try:
+            latencies, statuses = [], []
+            for _ in range(12):
+                started = time.perf_counter()
+                statuses.append(self.get('10.0.0.1').status_code)
+                latencies.append(time.perf_counter() - started)
+                time.sleep(0.25)  # 4 req/s, abaixo da taxa de 5/s
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(set(statuses), {200})
+        self.assertLess(max(latencies), 1.0)
+        self.assertLessEqual(set(abusive_statuses), {200, 429, 503})
+        rejected = sum(1 for status in abusive_statuses if status in (429, 503))
+        self.assertGreater(rejected, len(abusive_statuses) // 2)
+
+    def test_throttled_response_has_retry_after(self):
+        statuses = [self.get('10.0.0.2').status_code for _ in range(6)]
+        self.assertEqual(statuses, [200] * 5 + [429])
+        self.assertIn('Retry-After', self.get('10.0.0.2'))
+
+    def test_unauthenticated_api_key_does_not_reset_the_bucket(self):
+        statuses = [self.get('10.0.0.3', HTTP_X_API_KEY=f'chave-{n}').status_code for n in range(6)]
+        self.assertEqual(statuses[-1], 429)
+
+    def test_requests_over_the_in_flight_limit_are_shed(self):
+        semaphore = throttling.get_semaphore('test')
+        for _ in range(2):
+            semaphore.acquire()
+        try:
+            response = self.get('10.0.0.4')
+        finally:
+            for _ in range(2):
+                semaphore.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.get('10.0.0.4').status_code, 200)
+
+
+class BatchCategoryMoveTests(TestCase):
+    def test_moves_that_form_a_cycle_within_the_batch_fail_per_item(self):
+        a = Category.objects.create(name='A')
+        b = Category.objects.create(name='B')
+        ok, results = run_batch([
+            {'op': 'update', 'resource': 'category', 'id': a.id, 'data': {'parent': str(b.id)}},
+            {'op': 'update', 'resource': 'category', 'id': b.id, 'data': {'parent': str(a.id)}},
+        ], atomic=False)
+
+        self.assertFalse(ok)
+        self.assertEqual([r['status'] for r in results], [200, 400])
+        self.assertIn('parent', results[1]['errors'])
+        a.refresh_from_db()
+        b.refresh_from_db()
+        self.assertEqual((a.parent_id, b.parent_id), (b.id, None))
+
+    def test_parent_deleted_in_the_same_batch_fails_per_item(self):
+        a = Category.objects.create(name='A')
+        b = Category.objects.create(name='B')
+        ok, results = run_batch([
+            {'op': 'delete', 'resource': 'category', 'id': a.id},
+            {'op': 'create', 'resource': 'category', 'data': {'name': 'C', 'parent': str(a.id)}},
+            {'op': 'update', 'resource': 'category', 'id': b.id, 'data': {'parent': str(a.id)}},
+            {'op': 'create', 'resource': 'product', 'data': {
+                'name': 'P', 'description': 'Descricao', 'price': '1.00', 'stock': 1, 'category_ids': [str(a.id)],
+            }},
+        ], atomic=False)
+
+        self.assertFalse(ok)
+        self.assertEqual([r['status'] for r in results], [204, 400, 400, 400])
+        self.assertIn('parent', results[1]['errors'])
+        self.assertIn('category_ids', results[3]['errors'])
+        b.refresh_from_db()
+        self.assertIsNone(b.parent_id)
+        self.assertFalse(Category.objects.filter(name='C').exists())
+
+
+class BatchUpdateTests(TestCase):
+    def test_update_writes_only_the_fields_sent(self):
+        first = Product.objects.create(name='Um', description='', price=Decimal('1.00'), stock=1)
+        second = Product.objects.create(name='Dois', description='', price=Decimal('2.00'), stock=2)
+        check_moves = batch._check_moves
+
+        def concurrent_write(items):
+            # escrita de outra requisicao depois da carga do lote
+            Product.objects.filter(id=first.id).update(price=Decimal('5.00'), stock=7)
+            check_moves(items)
+
+        with mock.patch.object(batch, '_check_moves', side_effect=concurrent_write):
+            ok, _results = run_batch([
+                {'op': 'update', 'resource': 'product', 'id': first.id, 'data': {'name': 'Um novo'}},
+                {'op': 'update', 'resource': 'product', 'id': second.id, 'data': {'price': '3.00', 'stock': 4}},
+            ])
+
+        self.assertTrue(ok)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.name, first.price, first.stock), ('Um novo', Decimal('5.00'), 7))
+        self.assertEqual((second.name, second.price, second.stock), ('Dois', Decimal('3.00'), 4))
+
+
+class ProductSoftDeleteTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Produto', description='', price=Decimal('9.90'), stock=1)
+        self.image = ProductImage.objects.create(product=self.product, image='product_images/produto.jpg')
+
+    def test_soft_delete_takes_the_images_along(self):
+        self.product.soft_delete()
+        self.image.refresh_from_db()
+        self.assertIsNotNone(self.image.deleted_at)
+        self.assertGreaterEqual(self.image.updated_at, self.image.deleted_at)
+
+    def test_batch_delete_takes_the_images_along(self):
+        ok, _results = run_batch([{'op': 'delete', 'resource': 'product', 'id': self.product.id}])
+        self.assertTrue(ok)
+        self.assertFalse(ProductImage.objects.alive().exists())
+
+
+class ProductExpandTests(TestCase):
+    '''
+      Formato do retrieve com ?fields= e ?expand= (ProductReadSerializer).
+    '''
+    BASE_FIELDS = {'id', 'name', 'description', 'price', 'stock', 'is_in_stock', 'created_at', 'updated_at'}
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Categoria')
+        self.product = Product.objects.create(name='Produto', description='', price=Decimal('9.90'), stock=1)
+        ProductCategory.objects.create(product=self.product, category=self.category)
+        ProductImage.objects.create(product=self.product, image='product_images/produto.jpg', alt_text='Frente')
+        self.client = APIClient()
+
+    def get(self, query=''):
+        response = self.client.get(f'/api/v1/products/{self.product.id}/{query}')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_default_shape_includes_both_relations(self):
+        data = self.get()
+        self.assertEqual(set(data), self.BASE_FIELDS | {'categories', 'images'})
+        self.assertEqual([c['name'] for c in data['categories']], ['Categoria'])
+        self.assertEqual([i['alt_text'] for i in data['images']], ['Frente'])
+
+    def test_expand_keeps_only_the_requested_relations(self):
+        data = self.get('?expand=categories')
+        self.assertEqual(set(data), self.BASE_FIELDS | {'categories'})
+        self.assertEqual([c['id'] for c in data['categories']], [str(self.category.id)])
+
+        data = self.get('?expand=images')
+        self.assertEqual(set(data), self.BASE_FIELDS | {'images'})
+
+        data = self.get('?expand=')
+        self.assertEqual(set(data), self.BASE_FIELDS)
+
+        data = self.get('?expand=images,categories')
+        self.assertEqual(set(data), self.BASE_FIELDS | {'categories', 'images'})
+
+    def test_fields_with_expand(self):
+        data = self.get('?fields=id,name,cover_image&expand=images')
+        self.assertEqual(set(data), {'id', 'name', 'cover_image', 'images'})
+        self.assertTrue(data['cover_image'].endswith('produto.jpg'))
+
+    def test_invalid_expand_is_rejected(self):
+        response = self.client.get(f'/api/v1/products/{self.product.id}/?expand=price')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('expand', response.data)
+
+
+def make_png():
+    buffer = io.BytesIO()
+    Image.new('RGB', (2, 2), 'red').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class UploadSessionImageTests(TestCase):
+    '''
+      Imagem anexada por file_key "upload:<id>" (ProductWriteSerializer) e
+      pelo finalize da sessao; a expiracao das sessoes abandonadas.
+    '''
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(
+            MEDIA_ROOT=media_root.name, UPLOAD_SESSIONS_DIR=Path(media_root.name, 'uploads'),
+        ))
+        self.media_root = media_root.name
+        self.png = make_png()
+
+        self.session = UploadSession.objects.create(
+            filename='foto.png', total_size=len(self.png), received_bytes=len(self.png),
+            status=UploadSession.STATUS_COMPLETED,
+        )
+        create_temp_file(self.session)
+        self.session.temp_path.write_bytes(self.png)
+        self.product = Product.objects.create(name='Produto', description='', price=Decimal('9.90'), stock=1)
+        self.client = APIClient()
+
+    def save(self, *file_keys, instance=None, images=None):
+        serializer = ProductWriteSerializer(instance, data={
+            'name': 'Produto', 'description': 'Descricao', 'price': '9.90', 'stock': 1,
+            'images': images or [{'file_key': key} for key in file_keys],
+        })
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def finalize(self):
+        return self.client.post(
+            f'/api/v1/uploads/{self.session.id}/finalize/', {'product_id': str(self.product.id)}, format='json',
+        )
+
+    def stored_files(self):
+        return list(Path(self.media_root, 'product_images').glob('*'))
+
+    def test_session_is_consumed_and_temp_file_discarded_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = self.save(self.session.file_key)
+
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.status, UploadSession.STATUS_CONSUMED)
+        self.assertFalse(self.session.temp_path.exists())
+        self.assertEqual(product.images.count(), 1)
+        self.assertEqual(len(self.stored_files()), 1)
+
+    def test_rollback_keeps_the_session_and_leaves_no_orphan_file(self):
+        with self.assertRaises(ValidationError), self.captureOnCommitCallbacks(execute=True):
+            self.save(self.session.file_key, 'inexistente')
+
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.status, UploadSession.STATUS_COMPLETED)
+        self.assertTrue(self.session.temp_path.exists())
+        self.assertEqual(self.stored_files(), [])
+
+    def test_rollback_of_a_replaced_image_removes_the_new_file(self):
+        image = ProductImage.objects.create(product=self.product, image='product_images/antiga.png')
+        with self.assertRaises(ValidationError), self.captureOnCommitCallbacks(execute=True):
+            self.save(instance=self.product, images=[
+                {'id': str(image.id), 'file_key': self.session.file_key},
+                {'file_key': 'inexistente'},
+            ])
+
+        image.refresh_from_db()
+        self.assertEqual(image.image.name, 'product_images/antiga.png')
+        self.assertEqual(self.stored_files(), [])
+        self.assertTrue(self.session.temp_path.exists())
+
+    def test_finalize_attaches_the_image_and_discards_the_temp_file_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.finalize()
+
+        self.assertEqual(response.status_code, 201)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.status, UploadSession.STATUS_CONSUMED)
+        self.assertFalse(self.session.temp_path.exists())
+        self.assertEqual(len(self.stored_files()), 1)
+        self.assertEqual(self.finalize().status_code, 409)
+
+    def test_failed_finalize_can_be_retried(self):
+        with mock.patch.object(UploadSession, 'save', side_effect=DatabaseError('falhou')):
+            with self.assertRaises(DatabaseError), self.captureOnCommitCallbacks(execute=True):
+                self.finalize()
+        self.assertTrue(self.session.temp_path.exists())
+        self.assertEqual(self.stored_files(), [])
+        self.assertFalse(ProductImage.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.finalize().status_code, 201)
+
+    def test_finalize_without_the_temp_file_is_gone(self):
+        self.session.discard_temp_file()
+        self.assertEqual(self.finalize().status_code, 410)
+
+    def test_chunk_bumps_updated_at(self):
+        session = UploadSession.objects.create(filename='foto.png', total_size=len(self.png))
+        create_temp_file(session)
+        before = session.updated_at
+        response = self.client.put(
+            f'/api/v1/uploads/{session.id}/', self.png, content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET='0',
+        )
+        self.assertEqual(response.status_code, 200)
+        session.refresh_from_db()
+        self.assertEqual(session.received_bytes, len(self.png))
+        self.assertGreater(session.updated_at, before)
+
+    def test_purge_removes_abandoned_sessions_and_files(self):
+        stale = UploadSession.objects.create(filename='velha.png', total_size=10)
+        create_temp_file(stale)
+        old = timezone.now() - timedelta(hours=25)
+        UploadSession.objects.filter(id=stale.id).update(updated_at=old)
+        orphan = Path(self.session.temp_path.parent, f'{uuid.uuid4()}.part')
+        orphan.write_bytes(b'x')
+        os.utime(orphan, (old.timestamp(), old.timestamp()))
+
+        self.assertEqual(purge_expired_sessions(), (1, 2))
+        self.assertFalse(UploadSession.objects.filter(id=stale.id).exists())
+        self.assertFalse(stale.temp_path.exists())
+        self.assertFalse(orphan.exists())
+        self.assertTrue(self.session.temp_path.exists())
+
+
+class RelatedProductsTests(TestCase):
+    def related(self):
+        return sorted(RelatedProduct.objects.values_list('product_id', 'related_id', 'rank', 'score'))
+
+    def test_incremental_rebuild_matches_full_rebuild(self):
+        categories = [Category.objects.create(name=f'Categoria {i}') for i in range(4)]
+        products = [
+            Product.objects.create(name=f'Produto {i}', description='', price=Decimal('9.90'), stock=i % 3)
+            for i in range(12)
+        ]
+        for i, product in enumerate(products):
+            for category in categories[i % 4:i % 4 + 2]:
+                ProductCategory.objects.create(product=product, category=category)
+        rebuild_all()
+
+        ProductCategory.objects.create(product=products[0], category=categories[3])
+        mark_dirty([products[0].id], [categories[3].id])
+        rebuild_dirty()
+        incremental = self.related()
+
+        rebuild_all()
+        self.assertEqual(incremental, self.related())
+
+
+def expected_closure():
+    '''
+      Closure recalculada a partir dos parents, para comparar com a tabela.
+    '''
+    parents = dict(Category.objects.values_list('id', 'parent_id'))
+    rows = set()
+    for category_id in parents:
+        node, depth = category_id, 0
+        while node is not None:
+            rows.add((node, category_id, depth))
+            node, depth = parents[node], depth + 1
+    return rows
+
+
+class CategoryClosureTests(TestCase):
+    def setUp(self):
+        # raiz -> eletronicos -> celulares; raiz -> casa
+        self.root = Category.objects.create(name='Raiz')
+        self.electronics = Category.objects.create(name='Eletronicos', parent=self.root)
+        self.phones = Category.objects.create(name='Celulares', parent=self.electronics)
+        self.home = Category.objects.create(name='Casa', parent=self.root)
+
+    def closure(self):
+        return set(CategoryClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def test_insert_links_every_ancestor(self):
+        self.assertEqual(self.closure(), expected_closure())
+        self.assertIn((self.root.id, self.phones.id, 2), self.closure())
+        self.assertTrue(self.phones.is_descendant_of(self.root))
+        self.assertFalse(self.home.is_descendant_of(self.electronics))
+
+    def test_insert_nodes_in_bulk(self):
+        created = Category.objects.bulk_create(
+            [Category(name='Android', parent=self.phones), Category(name='Cozinha', parent=self.home)]
+        )
+        CategoryClosure.insert_nodes(created)
+        self.assertEqual(self.closure(), expected_closure())
+
+    def test_move_carries_the_subtree(self):
+        self.electronics.parent = self.home
+        self.electronics.save()
+        self.assertEqual(self.closure(), expected_closure())
+        self.assertIn((self.home.id, self.phones.id, 2), self.closure())
+
+        self.electronics.parent = None
+        self.electronics.save()
+        self.assertEqual(self.closure(), expected_closure())
+        self.assertFalse(self.phones.is_descendant_of(self.root))
+
+    def test_moving_under_a_descendant_is_rejected(self):
+        self.electronics.parent = self.phones
+        with self.assertRaises(DjangoValidationError):
+            self.electronics.clean()
+        with self.assertRaises(ValueError):
+            self.electronics.save()
+        self.assertEqual(self.closure(), expected_closure())
+
+
+class CategoryClosureMigrationTests(TransactionTestCase):
+    migrate_from = [('products', '0002_upload_session')]
+    migrate_to = [('products', '0003_category_tree')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_backfill_creates_the_self_links(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        OldCategory = executor.loader.project_state(self.migrate_from).apps.get_model('products', 'Category')
+        ids = {OldCategory.objects.create(name=f'Categoria {i}').id for i in range(3)}
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_to)
+        Closure = executor.loader.project_state(self.migrate_to).apps.get_model('products', 'CategoryClosure')
+        self.assertEqual(
+            set(Closure.objects.values_list('ancestor_id', 'descendant_id', 'depth')),
+            {(category_id, category_id, 0) for category_id in ids},
+        )
+
+
+class WriteBehindQueueTests(SimpleTestCase):
+    '''
+      Fila write-behind com um handler em memoria; o flush e sempre explicito
+      (flush_seconds alto), a thread de fundo so roda o recover() da subida.
+    '''
+    def setUp(self):
+        spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spool_dir.cleanup)
+        self.spool_dir = Path(spool_dir.name)
+        self.written = []
+        self.fail_ids = set()
+        self.outage = False
+        logger = logging.getLogger('standard.writebehind')
+        level = logger.level
+        logger.setLevel(logging.CRITICAL)
+        self.addCleanup(logger.setLevel, level)
+
+    def handler(self, records):
+        if self.outage:
+            raise OperationalError('banco fora do ar')
+        if any(record['id'] in self.fail_ids for record in records):
+            raise ValueError('registro invalido')
+        self.written.append([record['id'] for record in records])
+
+    def queue(self, **kwargs):
+        queue = WriteBehindQueue('test', self.handler, self.spool_dir, flush_seconds=3600, **kwargs)
+        self.addCleanup(queue.close)
+        return queue
+
+    def spooled(self):
+        return {
+            record['id']
+            for path in self.spool_dir.glob('*.spool')
+            for record in read_spool(path)
+        }
+
+    def expire_backoff(self, queue):
+        for entry in queue._pending:
+            entry.retry_at = 0
+
+    def test_records_are_spooled_then_written_in_one_batch(self):
+        queue = self.queue()
+        for n in range(3):
+            queue.put({'id': f'r{n}'})
+        self.assertEqual(self.spooled(), {'r0', 'r1', 'r2'})
+        self.assertEqual([r['id'] for r in queue.pending()], ['r0', 'r1', 'r2'])
+
+        self.assertEqual(queue.flush(), 3)
+        self.assertEqual(self.written, [['r0', 'r1', 'r2']])
+        self.assertEqual(self.spooled(), set())
+        self.assertEqual(queue.pending(), [])
+
+    def test_bad_record_is_isolated_and_dead_lettered(self):
+        queue = self.queue(max_attempts=2)
+        self.fail_ids = {'bad'}
+        for record_id in ('ok1', 'bad', 'ok2'):
+            queue.put({'id': record_id})
+
+        self.assertEqual(queue.flush(), 2)
+        self.assertEqual(self.written[-2:], [['ok1'], ['ok2']])
+        self.assertEqual([r['id'] for r in queue.pending()], ['bad'])
+        self.assertEqual(self.spooled(), {'bad'})
+        self.assertEqual(queue.flush(), 0)  # ainda em backoff
+
+        queue.put({'id': 'ok3'})
+        self.expire_backoff(queue)
+        self.assertEqual(queue.flush(), 1)
+        self.assertEqual(queue.pending(), [])
+        self.assertEqual(self.spooled(), set())
+        dead = [json.loads(line) for line in queue.dead_letter_path.read_bytes().splitlines()]
+        self.assertEqual([d['record']['id'] for d in dead], ['bad'])
+        self.assertIn('ValueError', dead[0]['error'])
+
+    def test_failed_flushes_do_not_pile_up_segments(self):
+        queue = self.queue(max_attempts=100)
+        self.fail_ids = {'bad'}
+        queue.put({'id': 'bad'})
+        for _ in range(10):
+            self.expire_backoff(queue)
+            queue.flush()
+        self.assertEqual(len(list(self.spool_dir.glob('*.spool'))), 1)
+        self.assertEqual(self.spooled(), {'bad'})
+
+    def test_outage_does_not_count_attempts(self):
+        queue = self.queue(max_attempts=1)
+        self.outage = True
+        queue.put({'id': 'r0'})
+        for _ in range(3):
+            self.expire_backoff(queue)
+            self.assertEqual(queue.flush(), 0)
+        self.assertFalse(queue.dead_letter_path.exists())
+
+        self.outage = False
+        self.expire_backoff(queue)
+        self.assertEqual(queue.flush(), 1)
+
+    def test_recover_replays_orphan_segments(self):
+        lines = [json.dumps({'id': f'r{n}'}) + '\n' for n in range(3)]
+        (self.spool_dir / 'test.999.dead0000.1.spool').write_text(''.join(lines) + '{"id": "parc')
+        (self.spool_dir / 'other.999.dead0000.1.spool').write_text(lines[0])
+        self.fail_ids = {'r1'}
+
+        queue = WriteBehindQueue('test', self.handler, self.spool_dir, max_batch=2)
+        self.assertEqual(queue.recover(), 2)
+        self.assertEqual(sorted(sum(self.written, [])), ['r0', 'r2'])
+        self.assertFalse((self.spool_dir / 'test.999.dead0000.1.spool').exists())
+        self.assertTrue((self.spool_dir / 'other.999.dead0000.1.spool').exists())
+        self.assertIn(b'"r1"', queue.dead_letter_path.read_bytes())
+
+    def test_recover_keeps_the_segment_during_an_outage(self):
+        path = self.spool_dir / 'test.999.dead0000.1.spool'
+        path.write_text(json.dumps({'id': 'r0'}) + '\n')
+        self.outage = True
+        queue = WriteBehindQueue('test', self.handler, self.spool_dir)
+        with self.assertRaises(OperationalError):
+            queue.recover()
+        self.assertTrue(path.exists())
+
+    def test_put_after_close_restarts_a_single_thread(self):
+        queue = self.queue()
+        queue.put({'id': 'r0'})
+        first = queue._thread
+        queue.close()
+        self.assertFalse(first.is_alive())
+        self.assertEqual(self.written, [['r0']])
+        self.assertEqual(list(self.spool_dir.glob('*.spool')), [])
+
+        queue.put({'id': 'r1'})
+        self.assertIsNot(queue._thread, first)
+        self.assertTrue(queue._thread.is_alive())
+
+
+class OrderQueueTests(TransactionTestCase):
+    def setUp(self):
+        spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spool_dir.cleanup)
+        self.enterContext(override_settings(ORDER_QUEUE_SPOOL_DIR=spool_dir.name, ORDER_QUEUE_FLUSH_SECONDS=3600))
+        get_order_queue.cache_clear()
+        self.addCleanup(get_order_queue.cache_clear)
+        self.addCleanup(lambda: get_order_queue().close())
+
+        self.product = Product.objects.create(name='Produto', description='', price=Decimal('9.90'), stock=5)
+        self.client = APIClient()
+
+    def record(self, product_id=None):
+        item = {'product_id': str(product_id or self.product.id), 'name': 'Produto',
+                'unit_price': '9.90', 'qty': 2, 'subtotal': '19.80'}
+        return build_order_record('Cliente', '', '19.80', [item])
+
+    def test_order_is_served_from_the_queue_then_from_the_database(self):
+        response = self.client.post(
+            '/api/v1/checkout/validate/',
+            {'items': [{'product_id': str(self.product.id), 'qty': 2}], 'customer_name': 'Cliente'},
+            format='json',
+        )
+        order_id = response.json()['order_id']
+        url = f'/api/v1/orders/{order_id}/'
+
+        pending = self.client.get(url)
+        self.assertEqual(pending.status_code, 200)
+        self.assertEqual(pending.json()['total_value'], '19.80')
+        self.assertFalse(Order.objects.filter(id=order_id).exists())
+
+        self.assertEqual(get_order_queue().flush(), 1)
+        stored = self.client.get(url)
+        self.assertEqual(stored.status_code, 200)
+        self.assertEqual(stored.json()['items'][0]['qty'], 2)
+        self.assertEqual(self.client.get('/api/v1/orders/00000000-0000-0000-0000-000000000000/').status_code, 404)
+
+    def test_customer_name_longer_than_the_column_is_rejected(self):
+        response = self.client.post(
+            '/api/v1/checkout/validate/',
+            {'items': [{'product_id': str(self.product.id), 'qty': 1}], 'customer_name': 'x' * 256},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('customer_name', response.json())
+
+    def test_save_orders_does_not_drop_invalid_items(self):
+        with self.assertRaises(IntegrityError):
+            save_orders([self.record(product_id='00000000-0000-0000-0000-000000000000')])
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_replay_skips_orders_already_written(self):
+        first, second = self.record(), self.record()
+        save_orders([first])
+        replay_orders([first, second])
+        self.assertEqual(set(Order.objects.values_list('id', flat=True)), {uuid.UUID(first['id']), uuid.UUID(second['id'])})
+
+
+class AdminSoftDeleteTests(TestCase):
+    '''
+      Deletar pelo admin e logico, para virar tombstone no feed de alteracoes.
+    '''
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'senha'))
+        self.product = Product.objects.create(name='Produto', description='', price=Decimal('9.90'), stock=1)
+        self.image = ProductImage.objects.create(product=self.product, image='product_images/produto.jpg')
+
+    def test_delete_view_soft_deletes_the_product_and_its_images(self):
+        response = self.client.post(f'/admin/products/product/{self.product.id}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.product.refresh_from_db()
+        self.image.refresh_from_db()
+        self.assertIsNotNone(self.product.deleted_at)
+        self.assertIsNotNone(self.image.deleted_at)
+
+    def test_delete_selected_action_soft_deletes(self):
+        other = Product.objects.create(name='Outro', description='', price=Decimal('1.00'), stock=1)
+        response = self.client.post('/admin/products/product/', {
+            'action': 'delete_selected', '_selected_action': [self.product.id, other.id], 'post': 'yes',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Product.objects.alive().count(), 0)
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_category_with_live_children_is_protected(self):
+        parent = Category.objects.create(name='Pai')
+        Category.objects.create(name='Filha', parent=parent)
+        response = self.client.post(f'/admin/products/category/{parent.id}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Filha')
+        parent.refresh_from_db()
+        self.assertIsNone(parent.deleted_at)
+
+
+class ChangeFeedCheckTests(SimpleTestCase):
+    def test_settle_window_must_exceed_the_write_bound(self):
+        with override_settings(CHANGE_FEED_SETTLE_SECONDS=10, WRITE_TRANSACTION_MAX_SECONDS=10):
+            self.assertEqual([e.id for e in check_change_feed_settle_window(None)], ['products.E001'])
+        with override_settings(CHANGE_FEED_SETTLE_SECONDS=30, WRITE_TRANSACTION_MAX_SECONDS=20):
+            self.assertEqual(check_change_feed_settle_window(None), [])
@@ -0,0 +1,127 @@
+'''
+  Utilitarios do upload em partes (resumable) de imagens.
+
+  Fluxo:
+    1. POST /api/v1/uploads/                 -> cria a sessao (filename, total_size)
+    2. PUT  /api/v1/uploads/<id>/            -> envia um chunk (body bruto) a partir do offset
+    3. POST /api/v1/uploads/<id>/finalize/   -> valida a imagem e anexa ao produto
+                                                ou libera o file_key "upload:<id>"
+
+  Sessoes abandonadas (sem atividade ha UPLOAD_SESSION_EXPIRE_HOURS) sao
+  removidas, com o arquivo temporario, pelo comando purge_upload_sessions.
+'''
+import os
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import F
+from django.utils import timezone
+
+from .models import UploadSession
+
+UPLOAD_FILE_KEY_PREFIX = 'upload:'
+CHUNK_READ_SIZE = 64 * 1024
+
+
+class SessionFile(File):
+    '''
+      File apontando para o arquivo temporario da sessao.
+      Expor temporary_file_path() faz o FileSystemStorage mover o arquivo
+      (rename) em vez de copiar, e o ImageField do Django validar a imagem
+      lendo do disco em vez de carregar tudo em memoria.
+    '''
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def create_temp_file(session: UploadSession):
+    path = session.temp_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb'):
+        pass
+
+
+def write_chunk(session: UploadSession, stream, offset: int, length: int) -> int:
+    '''
+      Grava ate `length` bytes do stream no arquivo temporario a partir de `offset`,
+      lendo em blocos de CHUNK_READ_SIZE. Retorna quantos bytes foram gravados;
+      se o cliente cair no meio do chunk, o que chegou fica valendo e o upload
+      pode ser retomado a partir do novo offset.
+    '''
+    written = 0
+    with open(session.temp_path, 'r+b') as fh:
+        fh.seek(offset)
+        while written < length:
+            data = stream.read(min(CHUNK_READ_SIZE, length - written))
+            if not data:
+                break
+            fh.write(data)
+            written += len(data)
+        fh.truncate(offset + written)
+    return written
+
+
+def advance_offset(session: UploadSession, offset: int, written: int) -> bool:
+    '''
+      Avanca received_bytes somente se ninguem avancou antes (controle otimista),
+      evitando manter transacao aberta enquanto o chunk trafega pela rede.
+    '''
+    updated = UploadSession.objects.filter(
+        id=session.id,
+        status=UploadSession.STATUS_OPEN,
+        received_bytes=offset,
+    ).update(received_bytes=F('received_bytes') + written, updated_at=timezone.now())
+    if updated:
+        session.received_bytes = offset + written
+    return bool(updated)
+
+
+def open_session_file(session: UploadSession, move: bool = True) -> File:
+    '''
+      move=False devolve um File comum: o storage copia o conteudo e o arquivo
+      temporario continua no lugar (para quem so pode descarta-lo no commit).
+    '''
+    fh = open(session.temp_path, 'rb')
+    file_class = SessionFile if move else File
+    return file_class(fh, name=os.path.basename(session.filename))
+
+
+def purge_expired_sessions():
+    '''
+      Remove as sessoes sem atividade ha mais de UPLOAD_SESSION_EXPIRE_HOURS
+      e seus arquivos temporarios, e tambem arquivos .part antigos sem sessao.
+      Retorna (sessoes, arquivos) removidos.
+    '''
+    cutoff = timezone.now() - timedelta(hours=settings.UPLOAD_SESSION_EXPIRE_HOURS)
+    sessions = files = 0
+    for session in UploadSession.objects.filter(updated_at__lt=cutoff).only('id').iterator():
+        # condicao repetida no delete: um chunk ou finalize concorrente mantem a sessao
+        deleted, _ = UploadSession.objects.filter(id=session.id, updated_at__lt=cutoff).delete()
+        if deleted:
+            sessions += 1
+            if session.temp_path.exists():
+                session.discard_temp_file()
+                files += 1
+
+    directory = Path(settings.UPLOAD_SESSIONS_DIR)
+    if directory.is_dir():
+        for path in directory.glob('*.part'):
+            if path.stat().st_mtime >= cutoff.timestamp():
+                continue
+            try:
+                session_id = uuid.UUID(path.stem)
+            except ValueError:
+                session_id = None
+            if session_id is None or not UploadSession.objects.filter(id=session_id).exists():
+                path.unlink(missing_ok=True)
+                files += 1
+    return sessions, files
+
+
+def parse_file_key(file_key: str):
+    if file_key and file_key.startswith(UPLOAD_FILE_KEY_PREFIX):
+        return file_key[len(UPLOAD_FILE_KEY_PREFIX):]
+    return None
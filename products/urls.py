@@ -2,14 +2,22 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
 from .views import ProductViewSet, CategoryViewSet, ProductImageViewSet
+from .views_batch import BatchAPIView
+from .views_changes import ChangesAPIView
 from .views_checkout import CheckoutValidateAPIView
+from .views_orders import OrderViewSet
+from .views_uploads import UploadSessionViewSet
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet, basename='products')
 router.register(r'categories', CategoryViewSet, basename='categories')
 router.register(r'product-images', ProductImageViewSet, basename='product-images')
+router.register(r'uploads', UploadSessionViewSet, basename='uploads')
+router.register(r'orders', OrderViewSet, basename='orders')
 
 urlpatterns = [
     path('api/v1/', include(router.urls)),
     path('api/v1/checkout/validate/', CheckoutValidateAPIView.as_view(), name='checkout-validate'),
+    path('api/v1/changes/', ChangesAPIView.as_view(), name='changes'),
+    path('api/v1/batch/', BatchAPIView.as_view(), name='batch'),
 ]
\ No newline at end of file
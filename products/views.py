@@ -1,41 +1,187 @@
+import uuid
+
+from django.db.models import Count, Q
+from rest_framework import serializers
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 
-from .models import Product, Category, ProductImage
+from standard.idempotency import IdempotentViewMixin
+from standard.throttling import LoadSheddingMixin
+
+from .models import Product, Category, ProductCategory, ProductImage
+from .related import mark_dirty
 from .serializers import (
     ProductReadSerializer,
     ProductWriteSerializer,
     CategorySerializer,
+    CategoryTreeSerializer,
     ProductImageSerializer,
 )
 
 
 class CategoryViewSet(ModelViewSet):
-    queryset = Category.objects.all().order_by("name")
+    queryset = Category.objects.alive().order_by("name")
     serializer_class = CategorySerializer
     lookup_field = "id"
     lookup_url_kwarg = "pk"
 
+    def perform_destroy(self, instance):
+        if instance.children.alive().exists():
+            raise serializers.ValidationError("A categoria possui subcategorias; mova ou remova-as antes.")
+        instance.soft_delete()
+        mark_dirty(category_ids=[instance.id])
+
+    @action(detail=False, methods=["get"])
+    def tree(self, request):
+        '''
+        GET /api/v1/categories/tree/
+
+        Hierarquia completa com a contagem de produtos de cada categoria
+        (incluindo as descendentes) em uma única query sobre a closure table.
+        '''
+        rows = (
+            Category.objects.alive()
+            .annotate(product_count=Count(
+                "descendant_links__descendant__products__product",
+                filter=Q(
+                    descendant_links__descendant__deleted_at__isnull=True,
+                    descendant_links__descendant__products__product__deleted_at__isnull=True,
+                ),
+                distinct=True,
+            ))
+            .order_by("name")
+            .values("id", "name", "description", "parent_id", "product_count")
+        )
+
+        nodes = {}
+        for row in rows:
+            row["children"] = []
+            nodes[row["id"]] = row
 
-class ProductViewSet(ModelViewSet):
-    queryset = Product.objects.all().prefetch_related(
-      "images",
-      "categories__category").order_by("name")
+        roots = []
+        for row in nodes.values():
+            parent = nodes.get(row["parent_id"])
+            (parent["children"] if parent else roots).append(row)
+
+        return Response(CategoryTreeSerializer(roots, many=True).data)
+
+
+class ProductViewSet(LoadSheddingMixin, IdempotentViewMixin, ModelViewSet):
+    '''
+    Filtros (list):
+    - ?category=<uuid>: produtos da categoria e de todas as suas descendentes
+
+    Campos (list/retrieve):
+    - ?fields= e ?expand= (ver ProductReadSerializer); colunas e prefetches
+      acompanham os campos pedidos
+
+    Relacionados: /api/v1/products/<id>/related/
+
+    A listagem tem limite por cliente (escopo "product_list") e descarte de
+    carga (503) quando há requisições demais em andamento (standard/throttling.py).
+
+    Escrita aceita o header Idempotency-Key (ver standard/idempotency.py).
+    '''
+    queryset = Product.objects.alive().order_by("name")
     parser_classes = (JSONParser, MultiPartParser, FormParser)
     lookup_field = "id"
     lookup_url_kwarg = "pk"
 
+    throttle_scope = "product_list"
+    load_shedding_actions = ("list",)
+
+    RELATED_DEFAULT_FIELDS = ("id", "name", "price", "is_in_stock")
+
+    def get_throttles(self):
+        return super().get_throttles() if self.action == "list" else []
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        if self.action in ("list", "retrieve"):
+            queryset = ProductReadSerializer.optimize_queryset(queryset, self.get_requested_fields())
+
+        category_id = self.request.query_params.get("category")
+        if self.action == "list" and category_id:
+            try:
+                category_id = serializers.UUIDField().to_internal_value(category_id)
+            except serializers.ValidationError:
+                raise serializers.ValidationError({"category": "Precisa ser um UUID válido."})
+            queryset = queryset.filter(
+                id__in=ProductCategory.objects.filter(
+                    category__ancestor_links__ancestor_id=category_id,
+                ).values("product_id"),
+            )
+
+        return queryset
+
+    def perform_destroy(self, instance):
+        instance.soft_delete()
+        # quem tinha este produto na lista de relacionados é recalculado
+        mark_dirty(category_ids=instance.categories.values_list("category_id", flat=True))
+
+    @action(detail=True, methods=["get"])
+    def related(self, request, pk=None):
+        '''
+        GET /api/v1/products/<id>/related/
+
+        Produtos com mais categorias em comum, já ordenados (tabela
+        RelatedProduct, mantida por build_related_products). Uma query pelo
+        índice (product, rank). Sem ?fields devolve id, name, price e
+        is_in_stock; ?fields= e ?expand= funcionam como no retrieve.
+        '''
+        try:
+            product_id = uuid.UUID(str(pk))
+        except ValueError:
+            raise NotFound()
+
+        fields = self.get_requested_fields()
+        if fields is None:
+            fields = set(self.RELATED_DEFAULT_FIELDS)
+
+        queryset = ProductReadSerializer.optimize_queryset(
+            Product.objects.alive()
+            .filter(related_from__product_id=product_id, related_from__product__deleted_at__isnull=True)
+            .order_by("related_from__rank"),
+            fields,
+        )
+        products = list(queryset)
+        if not products:
+            # lista vazia: distingue produto sem relacionados de produto inexistente
+            self.get_object()
+
+        context = {**self.get_serializer_context(), "fields": fields}
+        return Response(ProductReadSerializer(products, many=True, context=context).data)
+
+    def get_requested_fields(self):
+        if not hasattr(self, "_requested_fields"):
+            params = self.request.query_params
+            self._requested_fields = ProductReadSerializer.resolve_fields(params.get("fields"), params.get("expand"))
+        return self._requested_fields
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in ("list", "retrieve"):
+            context["fields"] = self.get_requested_fields()
+        return context
+
     def get_serializer_class(self):
         if self.action in ("list", "retrieve"):
             return ProductReadSerializer
         return ProductWriteSerializer
 
 
-class ProductImageViewSet(ModelViewSet):
+class ProductImageViewSet(IdempotentViewMixin, ModelViewSet):
     '''
     Opcional: endpoint direto para gerenciar imagens (CRUD).
     Útil se você quiser editar imagem/alt_text sem passar pelo Product.
     '''
-    queryset = ProductImage.objects.select_related('product').all()
+    queryset = ProductImage.objects.alive().filter(product__deleted_at__isnull=True).select_related('product')
     serializer_class = ProductImageSerializer
-    parser_classes = (JSONParser, MultiPartParser, FormParser)
\ No newline at end of file
+    parser_classes = (JSONParser, MultiPartParser, FormParser)
+
+    def perform_destroy(self, instance):
+        instance.soft_delete()
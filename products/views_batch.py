@@ -0,0 +1,52 @@
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from standard.idempotency import idempotent
+
+from .batch import run_batch
+from .serializers_batch import BatchRequestSerializer
+
+
+class BatchAPIView(APIView):
+    '''
+    POST /api/v1/batch/
+
+    Body:
+    {
+      'atomic': true,
+      'operations': [
+        {'op': 'create', 'resource': 'category', 'data': {'name': 'Bebidas'}},
+        {'op': 'update', 'resource': 'product', 'id': '<uuid>', 'data': {'price': '9.90', 'category_ids': ['<uuid>']}},
+        {'op': 'delete', 'resource': 'product', 'id': '<uuid>'}
+      ]
+    }
+
+    Response 200 (400 se atomic e algum item falhar; nada é aplicado):
+    {
+      'ok': true/false,
+      'results': [
+        {'index': 0, 'status': 201, 'id': '<uuid>'},
+        {'index': 1, 'status': 400, 'errors': {...}}
+      ]
+    }
+
+    Aceita o header Idempotency-Key (ver standard/idempotency.py).
+    '''
+
+    @idempotent
+    def post(self, request):
+        serializer = BatchRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        atomic = serializer.validated_data['atomic']
+        ok, results = run_batch(
+            serializer.validated_data['operations'],
+            atomic=atomic,
+            context={'request': request},
+        )
+
+        return Response(
+            {'ok': ok, 'results': results},
+            status=status.HTTP_400_BAD_REQUEST if atomic and not ok else status.HTTP_200_OK,
+        )
@@ -0,0 +1,53 @@
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .changes import InvalidCursor, SOURCE_TYPES, fetch_changes
+
+
+class ChangesQuerySerializer(serializers.Serializer):
+    cursor = serializers.CharField(required=False, allow_blank=True)
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=1000, default=100)
+    types = serializers.CharField(required=False, allow_blank=True)
+
+    def validate_types(self, value):
+        types = [t.strip() for t in value.split(',') if t.strip()]
+        invalid = [t for t in types if t not in SOURCE_TYPES]
+        if invalid:
+            raise serializers.ValidationError(f'Tipos inválidos: {invalid}')
+        return tuple(types) or SOURCE_TYPES
+
+
+class ChangesAPIView(APIView):
+    '''
+    GET /api/v1/changes/?cursor=<opaco>&limit=100&types=product,category,product_image
+
+    Sem cursor, começa do início do catálogo. Guarde o next_cursor e
+    repita enquanto has_more for true.
+
+    Response 200:
+    {
+      'results': [
+        {'type': 'product', 'id': '<uuid>', 'updated_at': '...', 'deleted': false, 'data': {...}},
+        {'type': 'category', 'id': '<uuid>', 'updated_at': '...', 'deleted': true, 'data': null}
+      ],
+      'next_cursor': '...',
+      'has_more': false
+    }
+    '''
+
+    def get(self, request):
+        query = ChangesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        try:
+            entries, next_cursor, has_more = fetch_changes(
+                cursor=query.validated_data.get('cursor', ''),
+                limit=query.validated_data['limit'],
+                types=query.validated_data.get('types', SOURCE_TYPES),
+                context={'request': request},
+            )
+        except InvalidCursor as exc:
+            raise serializers.ValidationError({'cursor': str(exc)})
+
+        return Response({'results': entries, 'next_cursor': next_cursor, 'has_more': has_more})
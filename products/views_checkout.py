@@ -6,7 +6,11 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 
+from standard.idempotency import idempotent
+from standard.throttling import LoadSheddingMixin
+
 from .models import Product
+from .orders import build_order_record, enqueue_order
 from .serializers_checkout import CheckoutValidateSerializer
 
 
@@ -46,7 +50,7 @@ def _build_whatsapp_url(phone: str, message: str) -> str:
     return f'https://wa.me/{phone_digits}?text={text}'
 
 
-class CheckoutValidateAPIView(APIView):
+class CheckoutValidateAPIView(LoadSheddingMixin, APIView):
     '''
     POST /api/v1/checkout/validate/
 
@@ -63,10 +67,21 @@ class CheckoutValidateAPIView(APIView):
       'items': [...],
       'total_value': '159.80',
       'message': '...',
-      'whatsapp_url': 'https://wa.me/55....?text=...'
+      'whatsapp_url': 'https://wa.me/55....?text=...',
+      'order_id': '<uuid>' | null
     }
+
+    Com todos os itens em estoque (ok=true) o pedido é registrado (Order),
+    de forma assíncrona, pela fila write-behind de products/orders.py;
+    consulta em GET /api/v1/orders/<order_id>/.
+
+    Aceita o header Idempotency-Key (ver standard/idempotency.py).
+    Limite por cliente no escopo "checkout" e descarte de carga (503) em
+    standard/throttling.py.
     '''
+    throttle_scope = 'checkout'
 
+    @idempotent
     def post(self, request):
         serializer = CheckoutValidateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -77,7 +92,7 @@ class CheckoutValidateAPIView(APIView):
 
         product_ids = [it['product_id'] for it in items]
 
-        products = Product.objects.filter(id__in=product_ids).only('id', 'name', 'price', 'stock')
+        products = Product.objects.alive().filter(id__in=product_ids).only('id', 'name', 'price', 'stock')
         products_map = {p.id: p for p in products}
 
         missing = [str(pid) for pid in product_ids if pid not in products_map]
@@ -136,6 +151,24 @@ class CheckoutValidateAPIView(APIView):
         phone = getattr(settings, 'WHATSAPP_PHONE_NUMBER', '') or ''
         whatsapp_url = _build_whatsapp_url(phone, message) if phone else ''
 
+        order_id = None
+        if ok:
+            order_id = enqueue_order(build_order_record(
+                customer_name,
+                notes,
+                f'{_money(total):.2f}',
+                [
+                    {
+                        'product_id': r['product_id'],
+                        'name': r['name'],
+                        'unit_price': r['unit_price'],
+                        'qty': r['requested_qty'],
+                        'subtotal': r['subtotal'],
+                    }
+                    for r in response_items
+                ],
+            ))
+
         return Response(
             {
                 'ok': ok,
@@ -143,6 +176,7 @@ class CheckoutValidateAPIView(APIView):
                 'total_value': f'{_money(total):.2f}',
                 'message': message,
                 'whatsapp_url': whatsapp_url,
+                'order_id': order_id,
             },
             status=status.HTTP_200_OK,
         )
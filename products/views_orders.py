@@ -0,0 +1,30 @@
+from django.http import Http404
+from rest_framework import mixins
+from rest_framework.response import Response
+from rest_framework.viewsets import GenericViewSet
+
+from .models import Order
+from .orders import find_pending_order
+from .serializers_orders import OrderSerializer
+
+
+class OrderViewSet(mixins.RetrieveModelMixin, GenericViewSet):
+    '''
+    GET /api/v1/orders/<id>/
+
+    O id vem na resposta do checkout (order_id). Logo após o checkout o
+    pedido pode ainda estar na fila write-behind: se estiver na fila deste
+    processo é servido de lá; em outro worker, a consulta devolve 404 até o
+    próximo flush (ORDER_QUEUE_FLUSH_SECONDS).
+    '''
+    queryset = Order.objects.alive().prefetch_related('items')
+    serializer_class = OrderSerializer
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            record = find_pending_order(kwargs['pk'])
+            if record is None:
+                raise
+            return Response(self.get_serializer(record).data)
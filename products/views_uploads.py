@@ -0,0 +1,161 @@
+import re
+
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import mixins, serializers, status
+from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
+from rest_framework.response import Response
+from rest_framework.viewsets import GenericViewSet
+
+from standard.transactions import bounded_atomic
+
+from .models import ProductImage, UploadSession
+from .serializers import ProductImageSerializer
+from .serializers_uploads import UploadSessionSerializer, UploadSessionFinalizeSerializer, UploadedImageSerializer
+from .uploads import advance_offset, create_temp_file, open_session_file, write_chunk
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class UploadSessionViewSet(mixins.CreateModelMixin,
+                           mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin,
+                           GenericViewSet):
+    '''
+    POST   /api/v1/uploads/                 {'filename': 'foto.jpg', 'total_size': 5242880}
+    GET    /api/v1/uploads/<id>/            -> estado da sessão (offset atual para retomar)
+    PUT    /api/v1/uploads/<id>/            -> chunk no body bruto (application/octet-stream)
+                                               headers: Content-Range: bytes 0-1048575/5242880
+                                               ou Upload-Offset: 0
+    POST   /api/v1/uploads/<id>/finalize/   {'product_id': '<uuid>', 'alt_text': '...'} (opcional)
+    DELETE /api/v1/uploads/<id>/            -> descarta a sessão e o arquivo temporário
+    '''
+    queryset = UploadSession.objects.all()
+    serializer_class = UploadSessionSerializer
+    parser_classes = (JSONParser,)
+    lookup_field = 'id'
+    lookup_url_kwarg = 'pk'
+
+    def perform_create(self, serializer):
+        session = serializer.save()
+        create_temp_file(session)
+
+    def perform_destroy(self, instance):
+        instance.discard_temp_file()
+        instance.delete()
+
+    def _parse_chunk_headers(self, request, session):
+        try:
+            length = int(request.headers.get('Content-Length') or 0)
+        except ValueError:
+            raise serializers.ValidationError('Content-Length inválido.')
+
+        content_range = request.headers.get('Content-Range')
+        if content_range:
+            match = CONTENT_RANGE_RE.match(content_range.strip())
+            if not match:
+                raise serializers.ValidationError('Content-Range inválido. Use "bytes <início>-<fim>/<total>".')
+            start, end, total = (int(g) for g in match.groups())
+            if total != session.total_size:
+                raise serializers.ValidationError('O total do Content-Range não confere com total_size da sessão.')
+            if end < start or end - start + 1 != length:
+                raise serializers.ValidationError('Content-Range não confere com o Content-Length.')
+            offset = start
+        else:
+            raw_offset = request.headers.get('Upload-Offset')
+            if raw_offset is None or not raw_offset.isdigit():
+                raise serializers.ValidationError('Informe Content-Range ou Upload-Offset.')
+            offset = int(raw_offset)
+
+        if offset + length > session.total_size:
+            raise serializers.ValidationError('O chunk ultrapassa total_size da sessão.')
+        return offset, length
+
+    def update(self, request, *args, **kwargs):
+        '''
+        Recebe um chunk e grava direto no arquivo temporário (sem bufferizar o body).
+        Se o offset não for o esperado, responde 409 com o offset atual para o cliente retomar.
+        '''
+        session = self.get_object()
+        if session.status != UploadSession.STATUS_OPEN:
+            return Response({'detail': 'Sessão de upload já finalizada.'}, status=status.HTTP_409_CONFLICT)
+
+        offset, length = self._parse_chunk_headers(request, session)
+        if offset != session.received_bytes:
+            return Response(
+                {'detail': 'Offset fora de ordem.', 'offset': session.received_bytes},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        if length:
+            if not session.temp_path.exists():
+                return Response({'detail': 'Arquivo temporário da sessão não existe mais.'}, status=status.HTTP_410_GONE)
+
+            written = write_chunk(session, request.stream, offset, length)
+            if not advance_offset(session, offset, written):
+                session.refresh_from_db()
+                return Response(
+                    {'detail': 'Outro chunk foi gravado em paralelo.', 'offset': session.received_bytes},
+                    status=status.HTTP_409_CONFLICT,
+                )
+
+        return Response(self.get_serializer(session).data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, *args, **kwargs):
+        session = self.get_object()
+        serializer = UploadSessionFinalizeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        if session.status == UploadSession.STATUS_CONSUMED:
+            return Response({'detail': 'Upload já utilizado.'}, status=status.HTTP_409_CONFLICT)
+        if not session.is_complete():
+            return Response(
+                {'detail': 'Upload incompleto.', 'offset': session.received_bytes},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        try:
+            # copia em vez de mover: o arquivo temporario so e descartado no
+            # commit, entao uma falha aqui deixa a sessao pronta para nova tentativa
+            file_obj = open_session_file(session, move=False)
+        except FileNotFoundError:
+            return Response({'detail': 'Arquivo temporário da sessão não existe mais.'}, status=status.HTTP_410_GONE)
+        image = None
+        try:
+            UploadedImageSerializer(data={'file': file_obj}).is_valid(raise_exception=True)
+
+            product_id = serializer.validated_data.get('product_id')
+            if not product_id:
+                UploadSession.objects.filter(id=session.id, status=UploadSession.STATUS_OPEN).update(
+                    status=UploadSession.STATUS_COMPLETED, updated_at=timezone.now(),
+                )
+                session.refresh_from_db()
+                return Response(self.get_serializer(session).data, status=status.HTTP_200_OK)
+
+            with bounded_atomic():
+                locked = UploadSession.objects.select_for_update().get(id=session.id)
+                if locked.status == UploadSession.STATUS_CONSUMED:
+                    return Response({'detail': 'Upload já utilizado.'}, status=status.HTTP_409_CONFLICT)
+
+                image = ProductImage.objects.create(
+                    product_id=product_id,
+                    image=file_obj,
+                    alt_text=serializer.validated_data.get('alt_text', ''),
+                )
+                locked.status = UploadSession.STATUS_CONSUMED
+                locked.save(update_fields=['status', 'updated_at'])
+                transaction.on_commit(session.discard_temp_file)
+        except Exception:
+            # transacao desfeita depois da copia: o arquivo ficaria sem linha no banco
+            if image is not None:
+                image.image.delete(save=False)
+            raise
+        finally:
+            file_obj.close()
+
+        return Response(
+            ProductImageSerializer(image, context=self.get_serializer_context()).data,
+            status=status.HTTP_201_CREATED,
+        )
@@ -1,3 +1,309 @@
+'''
+  Pecas reutilizaveis para o admin de tabelas grandes.
+
+  - EstimatedCountPaginator: evita o COUNT(*) exato da changelist sem filtros,
+    usando a estimativa das estatisticas da tabela quando ela passa de
+    ADMIN_ESTIMATED_COUNT_THRESHOLD linhas.
+  - DateHierarchyListFilter: navegacao ano -> mes por intervalos (__gte/__lt)
+    sobre a coluna indexada; substitui o date_hierarchy, cujo drill-down faz
+    DISTINCT sobre a data truncada de todas as linhas.
+  - BatchedListEditableMixin: os saves de list_editable viram um bulk_update
+    e um bulk_create de LogEntry, em vez de um UPDATE e um INSERT por linha
+    (e de um SELECT por linha para validar o pk oculto de cada form).
+  - BoundedTransactionAdminMixin: os POSTs do admin rodam em bounded_atomic
+    (standard/transactions.py), com a mesma duracao maxima da API.
+  - SoftDeleteAdminMixin / SoftDeleteInlineFormSet: deletar pelo admin vira
+    delecao logica, que aparece como tombstone no feed de alteracoes.
+'''
+import datetime
+import json
+
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.models import CHANGE, LogEntry
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, Paginator
+from django.forms import BaseModelFormSet, ModelChoiceField
+from django.forms.models import BaseInlineFormSet
+from django.db import connections, models, router
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.functional import cached_property
+
+from .transactions import bounded_atomic
+
+
+def estimated_row_count(model):
+    '''
+      Linhas estimadas pelas estatisticas do banco, ou None se o backend
+      nao oferece estimativa (ex.: sqlite).
+    '''
+    connection = connections[router.db_for_read(model)]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT TABLE_ROWS FROM information_schema.TABLES '
+                'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+                [table],
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    # postgres devolve -1 para tabelas que ainda nao passaram por ANALYZE
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    '''
+      Paginator que usa a contagem estimada quando a queryset nao tem filtros
+      e a tabela e grande; com filtros (busca, list_filter, date_hierarchy) o
+      COUNT exato continua, ja que e limitado pelos indices.
+
+      A estimativa erra para os dois lados. Quando a pagina pedida cai fora
+      dela (ou sai vazia), a contagem passa a ser exata e a pagina e limitada a
+      ultima, em vez de EmptyPage (que o admin transforma em ?e=1).
+    '''
+    estimated = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if hasattr(queryset, 'query') and not queryset.query.where:
+            estimate = estimated_row_count(queryset.model)
+            if estimate is not None and estimate >= settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                self.estimated = True
+                return estimate
+        return super().count
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            if not self.estimated:
+                raise
+        self._use_exact_count()
+        return super().validate_number(min(int(number), self.num_pages))
+
+    def page(self, number):
+        page = super().page(number)
+        if self.estimated and page.number > 1 and not page.object_list:
+            self._use_exact_count()
+            page = super().page(min(page.number, self.num_pages))
+        return page
+
+    def _use_exact_count(self):
+        self.estimated = False
+        self.__dict__.pop('num_pages', None)
+        self.__dict__['count'] = super().count
+
+
+class DateHierarchyListFilter(admin.DateFieldListFilter):
+    '''
+      Os atalhos do DateFieldListFilter (hoje, 7 dias, ...) mais um link por
+      ano entre o menor e o maior valor da coluna e, com um ano selecionado,
+      um link por mes. Uso: list_filter = (('created_at', DateHierarchyListFilter),)
+    '''
+    max_years = 20
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        # MIN/MAX de coluna indexada: leitura das pontas do indice
+        bounds = model._default_manager.aggregate(first=models.Min(field_path), last=models.Max(field_path))
+        if bounds['first'] is None:
+            return
+
+        first, last = self._local(bounds['first']), self._local(bounds['last'])
+        years = range(last.year, max(first.year, last.year - self.max_years + 1) - 1, -1)
+        self.links += tuple((str(year), self._range(year, 1, 12)) for year in years)
+
+        selected = self._selected_since()
+        if selected is not None:
+            self.links += tuple(
+                (f'{selected.year}-{month:02d}', self._range(selected.year, month, 1))
+                for month in range(1, 13)
+            )
+
+    def _local(self, value):
+        if isinstance(value, datetime.datetime) and timezone.is_aware(value):
+            return timezone.localtime(value)
+        return value
+
+    def _start(self, year, month):
+        if isinstance(self.field, models.DateTimeField):
+            start = datetime.datetime(year, month, 1)
+            return timezone.make_aware(start) if settings.USE_TZ else start
+        return datetime.date(year, month, 1)
+
+    def _range(self, year, month, months):
+        end_month = month + months
+        return {
+            self.lookup_kwarg_since: self._start(year, month),
+            self.lookup_kwarg_until: self._start(year + (end_month - 1) // 12, (end_month - 1) % 12 + 1),
+        }
+
+    def _selected_since(self):
+        value = self.date_params.get(self.lookup_kwarg_since)
+        if not value:
+            return None
+        try:
+            return parse_datetime(value) or parse_date(value)
+        except ValueError:
+            return None
+
+
+class LoadedObjectChoiceField(ModelChoiceField):
+    '''
+      Campo do pk oculto que resolve o valor entre os objetos ja carregados
+      pelo formset, em vez de um queryset.get() por form.
+    '''
+    def __init__(self, lookup, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lookup = lookup
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        obj = self.lookup(value)
+        if obj is None:
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+        return obj
+
+
+class PreloadedModelFormSet(BaseModelFormSet):
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        pk_name = self._pk_field.name
+        field = form.fields.get(pk_name)
+        if isinstance(field, ModelChoiceField) and not isinstance(field, LoadedObjectChoiceField):
+            form.fields[pk_name] = LoadedObjectChoiceField(
+                self._lookup_loaded, field.queryset, initial=field.initial, required=False, widget=field.widget,
+            )
+
+    def _lookup_loaded(self, value):
+        try:
+            return self._existing_object(self._pk_field.to_python(value))
+        except ValidationError:
+            return None
+
+
+class BatchedListEditableMixin:
+    '''
+      Adia save_model/log_change das submissoes de list_editable e grava
+      tudo de uma vez no fim da changelist_view, na mesma transacao.
+      Como bulk_update nao dispara save() nem signals, so use em models cujo
+      save() nao tenha efeitos colaterais para os campos de list_editable.
+    '''
+    def get_changelist_formset(self, request, **kwargs):
+        kwargs.setdefault('formset', PreloadedModelFormSet)
+        return super().get_changelist_formset(request, **kwargs)
+
+    def changelist_view(self, request, extra_context=None):
+        if not (request.method == 'POST' and self.list_editable and '_save' in request.POST):
+            return super().changelist_view(request, extra_context)
+
+        request._batched_edits = {'objects': [], 'fields': set(), 'logs': []}
+        with bounded_atomic(using=router.db_for_write(self.model)):
+            response = super().changelist_view(request, extra_context)
+            self._flush_batched_edits(request)
+        return response
+
+    def save_model(self, request, obj, form, change):
+        pending = getattr(request, '_batched_edits', None)
+        if pending is None or not change:
+            return super().save_model(request, obj, form, change)
+        pending['objects'].append(obj)
+        pending['fields'].update(form.changed_data)
+
+    def log_change(self, request, obj, message):
+        pending = getattr(request, '_batched_edits', None)
+        if pending is None:
+            return super().log_change(request, obj, message)
+        pending['logs'].append((obj, message))
+
+    def _flush_batched_edits(self, request):
+        pending = request._batched_edits
+        objects = pending['objects']
+        if not objects:
+            return
+
+        fields = set(pending['fields'])
+        opts = self.model._meta
+        for field in opts.concrete_fields:
+            # auto_now (updated_at) nao e aplicado pelo bulk_update
+            if getattr(field, 'auto_now', False):
+                fields.add(field.name)
+                for obj in objects:
+                    field.pre_save(obj, add=False)
+        self.model._default_manager.bulk_update(objects, sorted(fields), batch_size=500)
+
+        content_type = ContentType.objects.get_for_model(self.model, for_concrete_model=False)
+        LogEntry.objects.bulk_create([
+            LogEntry(
+                user_id=request.user.pk,
+                content_type_id=content_type.pk,
+                object_id=str(obj.pk),
+                object_repr=str(obj)[:200],
+                action_flag=CHANGE,
+                change_message=json.dumps(message) if isinstance(message, list) else message,
+            )
+            for obj, message in pending['logs']
+        ])
+
+
+class BoundedTransactionAdminMixin:
+    '''
+      Envolve os POSTs de changeform, changelist (list_editable e actions) e
+      delete em bounded_atomic: o transaction.atomic que o admin abre por
+      dentro vira savepoint e a transacao inteira respeita
+      WRITE_TRANSACTION_MAX_SECONDS. GETs nao abrem transacao.
+    '''
+    def _bounded(self, request, view, *args, **kwargs):
+        if request.method != 'POST':
+            return view(request, *args, **kwargs)
+        with bounded_atomic(using=router.db_for_write(self.model)):
+            return view(request, *args, **kwargs)
+
+    def changeform_view(self, request, *args, **kwargs):
+        return self._bounded(request, super().changeform_view, *args, **kwargs)
+
+    def changelist_view(self, request, *args, **kwargs):
+        return self._bounded(request, super().changelist_view, *args, **kwargs)
+
+    def delete_view(self, request, *args, **kwargs):
+        return self._bounded(request, super().delete_view, *args, **kwargs)
+
+
+class SoftDeleteAdminMixin:
+    '''
+      delete_model/delete_queryset chamam soft_delete() (StandardModel) em vez
+      de apagar a linha; as linhas deletadas continuam visiveis no admin
+      (filtro por deleted_at).
+    '''
+    def delete_model(self, request, obj):
+        obj.soft_delete()
+
+    def delete_queryset(self, request, queryset):
+        # um por um: soft_delete() do model pode levar dependentes junto
+        for obj in queryset.alive():
+            obj.soft_delete()
+
+    def get_deleted_objects(self, objs, request):
+        # a confirmacao lista so os proprios objetos: nada e apagado em cascata
+        objs = list(objs)
+        return [str(obj) for obj in objs], {self.opts.verbose_name_plural: len(objs)}, set(), []
+
+
+class SoftDeleteInlineFormSet(BaseInlineFormSet):
+    '''
+      Inline que deleta logicamente e so lista os registros vivos.
+    '''
+    def get_queryset(self):
+        return super().get_queryset().alive()
 
-# Register your models here.
+    def delete_existing(self, obj, commit=True):
+        if commit:
+            obj.soft_delete()
@@ -0,0 +1,86 @@
+'''
+  Compressao de respostas negociada pelo Accept-Encoding.
+
+  CompressionMiddleware estende o GZipMiddleware do Django com brotli ("br"),
+  quando o pacote brotli esta instalado e o cliente o aceita; caso contrario
+  o comportamento e exatamente o do GZipMiddleware (gzip com a mitigacao de
+  BREACH do Django). Respostas em streaming (StreamingHttpResponse,
+  FileResponse) sao comprimidas pedaco a pedaco, sem juntar o corpo em memoria.
+  Respostas com Accept-Ranges (arquivos de media) passam sem compressao.
+
+  Brotli nao tem a mitigacao de BREACH do gzip, entao HTML (onde aparecem
+  tokens de CSRF) continua em gzip; as APIs JSON/MessagePack usam brotli.
+'''
+import re
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # dependencia opcional
+    brotli = None
+
+re_accepts_brotli = re.compile(r'\bbr\b')
+
+MIN_LENGTH = 200  # o mesmo corte do GZipMiddleware
+
+
+def brotli_compress_sequence(sequence, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for item in sequence:
+        data = compressor.process(item)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    def process_response(self, request, response):
+        if response.has_header('Accept-Ranges') or response.status_code == 206:
+            # arquivos enderecaveis por byte (standard.views.serve_media): os
+            # offsets do Range valem para o conteudo original
+            return response
+        if not self._use_brotli(request, response):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        quality = settings.COMPRESSION_BROTLI_QUALITY
+        if response.streaming:
+            if response.is_async:
+                original_iterator = response.streaming_content
+
+                async def brotli_wrapper():
+                    compressor = brotli.Compressor(quality=quality)
+                    async for chunk in original_iterator:
+                        data = compressor.process(chunk)
+                        if data:
+                            yield data
+                    yield compressor.finish()
+
+                response.streaming_content = brotli_wrapper()
+            else:
+                response.streaming_content = brotli_compress_sequence(response.streaming_content, quality)
+            del response.headers['Content-Length']
+        else:
+            compressed_content = brotli.compress(response.content, quality=quality)
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers['Content-Length'] = str(len(response.content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
+
+    def _use_brotli(self, request, response):
+        if brotli is None or response.has_header('Content-Encoding'):
+            return False
+        if not response.streaming and len(response.content) < MIN_LENGTH:
+            return False
+        if response.get('Content-Type', '').startswith('text/html'):
+            return False
+        return bool(re_accepts_brotli.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
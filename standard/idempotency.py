@@ -0,0 +1,232 @@
+'''
+  Suporte ao header Idempotency-Key nas views de escrita.
+
+  A primeira requisicao com uma chave "reserva" a chave no store, executa a
+  view e guarda status + body da resposta por IDEMPOTENCY_TTL_SECONDS.
+  Repeticoes com a mesma chave (e o mesmo conteudo) recebem a resposta
+  guardada sem executar a view de novo; repeticoes concorrentes esperam a
+  primeira terminar (ate IDEMPOTENCY_WAIT_SECONDS).
+
+  O store e plugavel via IDEMPOTENCY_STORE:
+    - standard.idempotency.DatabaseIdempotencyStore (padrao, tabela IdempotencyRecord)
+    - standard.idempotency.CacheIdempotencyStore (cache do Django, ex.: Redis)
+'''
+import hashlib
+import json
+import time
+from datetime import timedelta
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyRecord
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.05
+
+IN_PROGRESS = IdempotencyRecord.STATE_IN_PROGRESS
+COMPLETED = IdempotencyRecord.STATE_COMPLETED
+
+# respostas que não devem ser guardadas: o cliente pode repetir e ter outro resultado
+NOT_STORED_STATUSES = {status.HTTP_409_CONFLICT, status.HTTP_429_TOO_MANY_REQUESTS}
+
+
+class CacheIdempotencyStore:
+    '''
+      Usa cache.add() como reserva atômica; adequado para backends
+      compartilhados entre processos (Redis/Memcached).
+    '''
+    def __init__(self):
+        self.cache = caches[settings.IDEMPOTENCY_CACHE_ALIAS]
+
+    def claim(self, key, request_hash):
+        entry = {'request_hash': request_hash, 'state': IN_PROGRESS}
+        if self.cache.add(key, entry, timeout=settings.IDEMPOTENCY_LOCK_SECONDS):
+            return None
+        return self.cache.get(key) or self.claim(key, request_hash)
+
+    def complete(self, key, request_hash, response_status, response_body):
+        self.cache.set(
+            key,
+            {
+                'request_hash': request_hash,
+                'state': COMPLETED,
+                'response_status': response_status,
+                'response_body': response_body,
+            },
+            timeout=settings.IDEMPOTENCY_TTL_SECONDS,
+        )
+
+    def release(self, key):
+        self.cache.delete(key)
+
+
+class DatabaseIdempotencyStore:
+    '''
+      Usa a unicidade de IdempotencyRecord.key como reserva atômica.
+    '''
+    def claim(self, key, request_hash):
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                IdempotencyRecord.objects.create(
+                    key=key,
+                    request_hash=request_hash,
+                    expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS),
+                )
+            return None
+        except IntegrityError:
+            pass
+
+        record = IdempotencyRecord.objects.filter(key=key).first()
+        if record is None or record.expires_at <= now:
+            # expirou (ou a reserva de um worker que caiu venceu): libera e tenta de novo
+            IdempotencyRecord.objects.filter(key=key, expires_at__lte=now).delete()
+            return self.claim(key, request_hash)
+
+        return {
+            'request_hash': record.request_hash,
+            'state': record.state,
+            'response_status': record.response_status,
+            'response_body': record.response_body,
+        }
+
+    def complete(self, key, request_hash, response_status, response_body):
+        IdempotencyRecord.objects.filter(key=key, request_hash=request_hash).update(
+            state=COMPLETED,
+            response_status=response_status,
+            response_body=response_body,
+            expires_at=timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS),
+        )
+
+    def release(self, key):
+        IdempotencyRecord.objects.filter(key=key, state=IN_PROGRESS).delete()
+
+    def purge_expired(self):
+        return IdempotencyRecord.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+
+@lru_cache(maxsize=None)
+def get_store():
+    return import_string(settings.IDEMPOTENCY_STORE)()
+
+
+def _scoped_key(request, raw_key):
+    # a mesma chave de clientes/rotas diferentes não colide
+    user = getattr(request, 'user', None)
+    owner = str(user.pk) if user is not None and user.is_authenticated else 'anon'
+    scope = '\0'.join((owner, request.method, request.path, raw_key))
+    return hashlib.sha256(scope.encode()).hexdigest()
+
+
+def _request_hash(request):
+    digest = hashlib.sha256()
+    data = request.data
+    if hasattr(data, 'lists'):
+        # multipart/form: o DRF mistura os arquivos em request.data
+        payload = sorted((k, v) for k, v in data.lists() if k not in request.FILES)
+    else:
+        payload = data
+    digest.update(json.dumps(payload, sort_keys=True, cls=JSONEncoder).encode())
+
+    for name in sorted(request.FILES):
+        for uploaded in request.FILES.getlist(name):
+            digest.update(f'\0{name}\0{uploaded.name}\0{uploaded.size}\0'.encode())
+            for chunk in uploaded.chunks():
+                digest.update(chunk)
+            uploaded.seek(0)
+    return digest.hexdigest()
+
+
+def _jsonable(data):
+    return json.loads(json.dumps(data, cls=JSONEncoder)) if data is not None else None
+
+
+def run_idempotent(request, handler):
+    '''
+      Executa handler() respeitando o header Idempotency-Key, se presente.
+    '''
+    raw_key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not raw_key:
+        return handler()
+    if len(raw_key) > MAX_KEY_LENGTH:
+        return Response(
+            {'detail': f'{IDEMPOTENCY_HEADER} deve ter no máximo {MAX_KEY_LENGTH} caracteres.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    store = get_store()
+    key = _scoped_key(request, raw_key)
+    request_hash = _request_hash(request)
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+
+    while True:
+        entry = store.claim(key, request_hash)
+        if entry is None:
+            break
+        if entry['request_hash'] != request_hash:
+            return Response(
+                {'detail': f'{IDEMPOTENCY_HEADER} já utilizada com outro conteúdo.'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        if entry['state'] == COMPLETED:
+            return Response(
+                entry['response_body'],
+                status=entry['response_status'],
+                headers={REPLAYED_HEADER: 'true'},
+            )
+        if time.monotonic() >= deadline:
+            return Response(
+                {'detail': f'Requisição com esta {IDEMPOTENCY_HEADER} ainda em processamento.'},
+                status=status.HTTP_409_CONFLICT,
+                headers={'Retry-After': '1'},
+            )
+        time.sleep(POLL_INTERVAL)
+
+    try:
+        response = handler()
+    except Exception:
+        store.release(key)
+        raise
+
+    if response.status_code >= 500 or response.status_code in NOT_STORED_STATUSES:
+        store.release(key)
+    else:
+        store.complete(key, request_hash, response.status_code, _jsonable(response.data))
+    return response
+
+
+def idempotent(view_method):
+    '''
+      Decorator para métodos de APIView (post/put/patch/delete).
+    '''
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        return run_idempotent(request, lambda: view_method(self, request, *args, **kwargs))
+    return wrapper
+
+
+class IdempotentViewMixin:
+    '''
+      Aplica Idempotency-Key às ações de escrita de um ModelViewSet.
+    '''
+    def create(self, request, *args, **kwargs):
+        handler = super().create
+        return run_idempotent(request, lambda: handler(request, *args, **kwargs))
+
+    def update(self, request, *args, **kwargs):
+        handler = super().update
+        return run_idempotent(request, lambda: handler(request, *args, **kwargs))
+
+    def destroy(self, request, *args, **kwargs):
+        handler = super().destroy
+        return run_idempotent(request, lambda: handler(request, *args, **kwargs))
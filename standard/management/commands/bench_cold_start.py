@@ -0,0 +1,63 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# roda em um processo novo: mede o import do core.wsgi (com ou sem warm-up)
+# e a latência das duas primeiras requisições servidas pela aplicação WSGI
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+from core.wsgi import application
+imported = time.perf_counter()
+
+def request(path, host):
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SERVER_NAME': host,
+        'SERVER_PORT': '80', 'HTTP_HOST': host, 'wsgi.url_scheme': 'http', 'wsgi.input': sys.stdin.buffer,
+        'wsgi.errors': sys.stderr,
+    }
+    t = time.perf_counter()
+    status = []
+    body = b''.join(application(environ, lambda s, h, *a: status.append(s)))
+    return time.perf_counter() - t, status[0]
+
+first, status = request(sys.argv[1], sys.argv[2])
+second, _ = request(sys.argv[1], sys.argv[2])
+print(json.dumps({'import': imported - started, 'first': first, 'second': second, 'status': status}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Mede import do core.wsgi e latência da primeira requisição com e sem o warm-up (core/warmup.py).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/v1/categories/')
+        parser.add_argument('--runs', type=int, default=5)
+
+    def handle(self, *args, **options):
+        hosts = [h for h in settings.ALLOWED_HOSTS if h not in ('*',) and not h.startswith('.')]
+        host = hosts[0] if hosts else 'localhost'
+
+        self.stdout.write(f'{"warm-up":<10}{"import ms":>12}{"1st req ms":>12}{"2nd req ms":>12}  status')
+        for label, flag in (('off', '0'), ('on', '1')):
+            samples = []
+            for _ in range(options['runs']):
+                env = {**os.environ, 'DJANGO_WARMUP': flag, 'DJANGO_WARMUP_DB': flag}
+                output = subprocess.run(
+                    [sys.executable, '-c', PROBE, options['path'], host],
+                    env=env, cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+                ).stdout
+                samples.append(json.loads(output.strip().splitlines()[-1]))
+
+            def median(key):
+                return statistics.median(s[key] for s in samples) * 1000
+
+            self.stdout.write(
+                f'{label:<10}{median("import"):>12.1f}{median("first"):>12.1f}{median("second"):>12.1f}'
+                f'  {samples[-1]["status"]}'
+            )
@@ -0,0 +1,64 @@
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from django.views.static import serve
+
+from standard.views import serve_media
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara o static() do Django (django.views.static.serve) com standard.views.serve_media '
+        'em arquivos temporarios: download completo (MB/s no processo), Range do final do arquivo, '
+        'revalidacao com If-None-Match e o modo X-Accel-Redirect. Com gunicorn os dois downloads '
+        'completos viram sendfile(); a diferenca esta no que deixa de ser transferido.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='256K,20M', help='tamanhos dos arquivos (K/M)')
+        parser.add_argument('--range-bytes', type=int, default=64 * 1024)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        with tempfile.TemporaryDirectory(prefix='bench-media-') as root, override_settings(MEDIA_ROOT=root):
+            self.stdout.write(f'{"file":<8}{"scenario":<22}{"view":<13}{"status":>7}{"bytes":>12}{"p50 ms":>9}{"MB/s":>9}')
+            for label in options['sizes'].split(','):
+                size = int(label[:-1]) * {'K': 1024, 'M': 1024 * 1024}[label[-1].upper()]
+                name = f'bench-{label}.bin'
+                with open(os.path.join(root, name), 'wb') as file:
+                    file.write(os.urandom(size))
+
+                etag = serve_media(factory.get('/'), name)['ETag']
+                scenarios = (
+                    ('full', {}),
+                    (f'range last {options["range_bytes"] // 1024}K', {'HTTP_RANGE': f'bytes=-{options["range_bytes"]}'}),
+                    ('if-none-match', {'HTTP_IF_NONE_MATCH': etag}),
+                )
+                for scenario, headers in scenarios:
+                    for view_label, view in (('static()', lambda r: serve(r, name, document_root=root)),
+                                             ('serve_media', lambda r: serve_media(r, name))):
+                        self.report(label, scenario, view_label, lambda: view(factory.get('/', **headers)), options)
+
+                with override_settings(MEDIA_SENDFILE_BACKEND='nginx'):
+                    self.report(label, 'full (x-accel)', 'serve_media',
+                                lambda: serve_media(factory.get('/'), name), options)
+
+    def report(self, label, scenario, view_label, call, options):
+        samples = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            response = call()
+            sent = sum(len(chunk) for chunk in response)
+            response.close()
+            samples.append(time.perf_counter() - started)
+        p50 = statistics.median(samples)
+        throughput = sent / p50 / (1024 * 1024) if sent else 0
+        self.stdout.write(
+            f'{label:<8}{scenario:<22}{view_label:<13}{response.status_code:>7}{sent:>12}'
+            f'{p50 * 1000:>9.2f}{throughput:>9.0f}'
+        )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from standard.idempotency import DatabaseIdempotencyStore
+
+
+class Command(BaseCommand):
+    help = 'Remove os registros de Idempotency-Key expirados (DatabaseIdempotencyStore).'
+
+    def handle(self, *args, **options):
+        deleted = DatabaseIdempotencyStore().purge_expired()
+        self.stdout.write(f'{deleted} registro(s) removido(s).')
@@ -0,0 +1,84 @@
+'''
+  Entrega de arquivos de MEDIA_ROOT (imagens de produtos) pela view
+  standard.views.serve_media, no lugar do static() do Django.
+
+  - ETag forte = sha256 do conteudo, calculado uma vez por (arquivo, mtime,
+    tamanho) e guardado em memoria; If-None-Match/If-Modified-Since geram 304
+    (django.utils.cache.get_conditional_response).
+  - Range de um intervalo ("bytes=0-1023", "bytes=1024-", "bytes=-512") gera
+    206; If-Range com ETag diferente ignora o Range. Varios intervalos numa
+    so requisicao recebem o arquivo inteiro (permitido pela RFC 9110).
+  - MEDIA_SENDFILE_BACKEND='nginx' (X-Accel-Redirect para
+    MEDIA_SENDFILE_NGINX_PREFIX) ou 'xsendfile' (X-Sendfile com o caminho
+    absoluto) entregam a transferencia ao proxy, que tambem trata o Range.
+  - Sem proxy, o corpo sai num FileResponse sobre o arquivo aberto: no
+    gunicorn ele vira os.sendfile() (wsgi.file_wrapper), inclusive nos
+    intervalos, ja que RangeFile expoe o fileno() com o offset posicionado.
+'''
+import hashlib
+import re
+from functools import lru_cache
+
+re_range = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+SENDFILE_BACKENDS = ('nginx', 'xsendfile')
+
+
+@lru_cache(maxsize=4096)
+def _digest(path, mtime_ns, size):
+    with open(path, 'rb') as file:
+        return hashlib.file_digest(file, 'sha256').hexdigest()
+
+
+def file_etag(path, stat):
+    '''
+      ETag forte do arquivo; o cache e invalidado quando mtime ou tamanho mudam.
+    '''
+    return f'"{_digest(str(path), stat.st_mtime_ns, stat.st_size)[:32]}"'
+
+
+def parse_range(header, size):
+    '''
+      (inicio, fim) inclusivos do header Range, None se o header nao for um
+      intervalo unico de bytes (responde com o arquivo inteiro) ou False se o
+      intervalo nao puder ser atendido (416).
+    '''
+    match = re_range.match(header.replace(' ', ''))
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0 or size == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+class RangeFile:
+    '''
+      Arquivo limitado a um intervalo: read() para no fim do intervalo e
+      fileno() permite o sendfile do servidor WSGI (que usa o offset atual e o
+      Content-Length da resposta).
+    '''
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
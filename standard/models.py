@@ -10,9 +10,22 @@
 import uuid
 from django.db import models
 from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import User
 
 
+class StandardQuerySet(models.QuerySet):
+    '''
+      QuerySet com suporte a delecao logica (deleted_at).
+    '''
+    def alive(self):
+        return self.filter(deleted_at__isnull=True)
+
+    def soft_delete(self):
+        now = timezone.now()
+        return self.filter(deleted_at__isnull=True).update(deleted_at=now, updated_at=now)
+
+
 class TimeStampedModel(models.Model):
     '''
       Adiciona campos de data de criacao, data de modificacao e delecao logica.
@@ -21,9 +34,19 @@ class TimeStampedModel(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     deleted_at = models.DateTimeField(null=True, blank=True)
 
+    objects = StandardQuerySet.as_manager()
+
     class Meta:
         abstract = True
 
+    def soft_delete(self):
+        '''
+          Marca o registro como deletado; o updated_at tambem muda para que
+          a delecao apareca como tombstone no feed de alteracoes.
+        '''
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['deleted_at', 'updated_at'])
+
 
 class UUIDModel(models.Model):
     '''
@@ -65,3 +88,32 @@ class StandardModel(TimeStampedModel, UUIDModel, UserStampedModel):
     '''
     class Meta:
         abstract = True
+
+
+class IdempotencyRecord(models.Model):
+    '''
+      Resultado armazenado de uma requisicao com Idempotency-Key
+      (usado pelo DatabaseIdempotencyStore em standard/idempotency.py).
+    '''
+    STATE_IN_PROGRESS = 'in_progress'
+    STATE_COMPLETED = 'completed'
+    STATE_CHOICES = (
+        (STATE_IN_PROGRESS, _("In progress")),
+        (STATE_COMPLETED, _("Completed")),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    key = models.CharField(max_length=64, unique=True)
+    request_hash = models.CharField(max_length=64)
+    state = models.CharField(max_length=16, choices=STATE_CHOICES, default=STATE_IN_PROGRESS)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = _("Idempotency Record")
+        verbose_name_plural = _("Idempotency Records")
+
+    def __str__(self):
+        return f'{self.key} ({self.state})'
@@ -0,0 +1,201 @@
+'''
+  Profiling sob demanda de requisicoes individuais.
+
+  Com PROFILING_ENABLED=False o middleware levanta MiddlewareNotUsed e o
+  Django o remove da cadeia: custo zero. Quando habilitado, uma requisicao e
+  perfilada se:
+    - vier de um usuario staff com o header X-Profile: 1, ou
+    - for sorteada pela PROFILING_SAMPLE_RATE (0.0 a 1.0).
+
+  Modos (PROFILING_MODE):
+    - 'sample':   amostrador de pilha em thread separada (baixo overhead);
+                  gera <nome>.collapsed (formato do flamegraph.pl / speedscope)
+    - 'cprofile': cProfile deterministico; gera <nome>.prof (pstats)
+
+  Em ambos os modos as queries SQL sao registradas em <nome>.sql.json; no
+  modo 'sample' elas tambem entram no .collapsed sob a raiz "[sql]".
+  Os arquivos ficam em PROFILING_DIR, mantendo os PROFILING_MAX_FILES mais novos.
+'''
+import cProfile
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+PROFILE_SUFFIXES = ('.collapsed', '.prof')
+SQL_SUFFIX = '.sql.json'
+
+
+def profiles_dir():
+    return Path(settings.PROFILING_DIR)
+
+
+def list_profiles():
+    '''
+      Perfis gravados, do mais novo para o mais antigo.
+    '''
+    directory = profiles_dir()
+    if not directory.is_dir():
+        return []
+    files = [p for p in directory.iterdir() if p.suffix in PROFILE_SUFFIXES]
+    return sorted(files, key=lambda p: p.stat().st_mtime, reverse=True)
+
+
+def rotate_profiles(keep):
+    for path in list_profiles()[keep:]:
+        for candidate in (path, path.with_suffix(SQL_SUFFIX)):
+            try:
+                candidate.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class StackSampler:
+    '''
+      Amostra a pilha de uma thread a cada `interval` segundos e acumula
+      as pilhas no formato "collapsed" (frame;frame;frame -> contagem).
+    '''
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+
+class QueryRecorder:
+    '''
+      execute_wrapper que registra SQL e duração de cada query.
+    '''
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+                'many': many,
+            })
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.header = settings.PROFILING_HEADER
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.mode = settings.PROFILING_MODE
+        self.interval = settings.PROFILING_INTERVAL_MS / 1000
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        if not self._should_profile(request):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        wrappers = [connections[alias].execute_wrapper(recorder) for alias in connections]
+        for wrapper in wrappers:
+            wrapper.__enter__()
+
+        started = time.perf_counter()
+        if self.mode == 'cprofile':
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # outro profiler já ativo no processo: segue sem perfilar
+                for wrapper in reversed(wrappers):
+                    wrapper.__exit__(None, None, None)
+                return self.get_response(request)
+        else:
+            profiler = StackSampler(threading.get_ident(), self.interval)
+            profiler.start()
+
+        try:
+            response = self.get_response(request)
+        finally:
+            if self.mode == 'cprofile':
+                profiler.disable()
+            else:
+                profiler.stop()
+            for wrapper in reversed(wrappers):
+                wrapper.__exit__(None, None, None)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        name = self._write(request, profiler, recorder, elapsed_ms)
+        if getattr(request, 'user', None) is not None and request.user.is_staff:
+            response['X-Profile-Id'] = name
+        return response
+
+    def _should_profile(self, request):
+        if request.headers.get(self.header) == '1':
+            user = getattr(request, 'user', None)
+            return user is not None and user.is_staff
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _write(self, request, profiler, recorder, elapsed_ms):
+        directory = profiles_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-')[:80] or 'root'
+        stamp = timezone.now().strftime('%Y%m%dT%H%M%S%f')
+        name = f'{stamp}-{request.method}-{slug}-{elapsed_ms:.0f}ms'
+
+        if self.mode == 'cprofile':
+            profiler.dump_stats(directory / f'{name}.prof')
+            suffix = '.prof'
+        else:
+            counts = Counter(profiler.counts)
+            for query in recorder.queries:
+                # queries entram como frames sinteticos, com peso em amostras equivalentes
+                sql = ' '.join(query['sql'].split())[:200].replace(';', ',')
+                weight = max(1, round(query['duration_ms'] / settings.PROFILING_INTERVAL_MS))
+                counts[f'[sql];{sql}'] += weight
+            lines = [f'{stack} {count}' for stack, count in counts.most_common()]
+            (directory / f'{name}.collapsed').write_text('\n'.join(lines) + '\n')
+            suffix = '.collapsed'
+
+        (directory / f'{name}{SQL_SUFFIX}').write_text(json.dumps({
+            'method': request.method,
+            'path': request.get_full_path(),
+            'elapsed_ms': round(elapsed_ms, 3),
+            'sql_ms': round(sum(q['duration_ms'] for q in recorder.queries), 3),
+            'queries': recorder.queries,
+        }, indent=2))
+
+        with self.lock:
+            rotate_profiles(settings.PROFILING_MAX_FILES)
+        return name + suffix
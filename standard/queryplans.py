@@ -0,0 +1,190 @@
+'''
+  EXPLAIN por banco e deteccao de planos ruins, usado por audit_queries.
+
+  explain(connection, sql) devolve os achados do plano de uma query:
+    - full_scan:  leitura da tabela inteira (sqlite "SCAN t", MySQL type=ALL,
+                  PostgreSQL "Seq Scan");
+    - filesort:   ordenacao fora de indice (sqlite "USE TEMP B-TREE FOR ORDER BY",
+                  MySQL "Using filesort", PostgreSQL "Sort");
+    - temp_table: tabela temporaria/materializacao (GROUP BY/DISTINCT sem
+                  indice, MySQL "Using temporary", PostgreSQL HashAggregate/Materialize).
+
+  suggest_index() transforma um achado em um models.Index candidato a partir
+  das colunas do WHERE (igualdade/intervalo) e do ORDER BY da query. E uma
+  heuristica: a sugestao precisa ser revisada antes de virar migration.
+'''
+import json
+import re
+
+from django.db import models
+
+FULL_SCAN = 'full_scan'
+FILESORT = 'filesort'
+TEMP_TABLE = 'temp_table'
+FLAGS = (FULL_SCAN, FILESORT, TEMP_TABLE)
+
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE')
+
+_quote = r'[`"]'
+re_alias = re.compile(rf'{_quote}(\w+){_quote}\s+(?:AS\s+)?([A-Z]\d+)\b')
+re_sqlite_scan = re.compile(r'^SCAN (?:TABLE )?(\w+)(.*)$')
+re_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+re_in_lists = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+re_where = re.compile(r'\bWHERE\b(.*?)(?:\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|$)', re.S)
+re_order_by = re.compile(r'\bORDER BY\b(.*?)(?:\bLIMIT\b|\bOFFSET\b|\bFOR UPDATE\b|$)', re.S)
+
+
+def is_explainable(sql):
+    return sql.lstrip().split(None, 1)[0].upper() in EXPLAINABLE
+
+
+def fingerprint(sql):
+    '''
+      SQL sem literais (e com listas IN colapsadas), para comparar execucoes
+      com dados semeados diferentes.
+    '''
+    sql = re_literals.sub('?', sql)
+    return re_in_lists.sub('(...)', sql)
+
+
+def table_aliases(sql):
+    return {alias: table for table, alias in re_alias.findall(sql)}
+
+
+def explain(connection, sql):
+    '''
+      [{'flag', 'table', 'detail'}] do plano de sql na conexao informada.
+    '''
+    vendor = connection.vendor
+    aliases = table_aliases(sql)
+    with connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            findings = _sqlite_findings(row[3] for row in cursor.fetchall())
+        elif vendor == 'mysql':
+            cursor.execute('EXPLAIN ' + sql)
+            columns = [col[0].lower() for col in cursor.description]
+            findings = _mysql_findings(dict(zip(columns, row)) for row in cursor.fetchall())
+        elif vendor == 'postgresql':
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            findings = list(_postgresql_findings(plan[0]['Plan']))
+        else:
+            raise NotImplementedError(f'EXPLAIN não suportado para o banco {vendor}.')
+
+    for finding in findings:
+        table = finding['table']
+        finding['table'] = aliases.get(table, table)
+    return findings
+
+
+def _sqlite_findings(details):
+    findings = []
+    for detail in details:
+        match = re_sqlite_scan.match(detail)
+        if match and 'USING' not in match.group(2):
+            findings.append({'flag': FULL_SCAN, 'table': match.group(1), 'detail': detail})
+        elif detail.startswith('USE TEMP B-TREE FOR') and 'ORDER BY' in detail:
+            findings.append({'flag': FILESORT, 'table': None, 'detail': detail})
+        elif detail.startswith(('USE TEMP B-TREE FOR', 'MATERIALIZE')):
+            findings.append({'flag': TEMP_TABLE, 'table': None, 'detail': detail})
+    return findings
+
+
+def _mysql_findings(rows):
+    findings = []
+    for row in rows:
+        table = row.get('table')
+        extra = row.get('extra') or ''
+        if row.get('type') == 'ALL':
+            findings.append({'flag': FULL_SCAN, 'table': table, 'detail': f'type=ALL rows={row.get("rows")}'})
+        if 'Using filesort' in extra:
+            findings.append({'flag': FILESORT, 'table': table, 'detail': extra})
+        if 'Using temporary' in extra:
+            findings.append({'flag': TEMP_TABLE, 'table': table, 'detail': extra})
+    return findings
+
+
+def _postgresql_findings(node):
+    node_type = node['Node Type']
+    if node_type == 'Seq Scan':
+        yield {'flag': FULL_SCAN, 'table': node.get('Relation Name'), 'detail': node.get('Filter', node_type)}
+    elif node_type in ('Sort', 'Incremental Sort'):
+        yield {'flag': FILESORT, 'table': None, 'detail': ', '.join(node.get('Sort Key', []))}
+    elif node_type in ('HashAggregate', 'Materialize', 'CTE Scan'):
+        yield {'flag': TEMP_TABLE, 'table': None, 'detail': node_type}
+    for child in node.get('Plans', []):
+        yield from _postgresql_findings(child)
+
+
+def _columns(clause, table, aliases, pattern):
+    '''
+      [(coluna, operador/direcao)] das colunas da tabela citadas no trecho.
+    '''
+    names = {table} | {alias for alias, name in aliases.items() if name == table}
+    found = {}
+    for name, column, tail in re.findall(rf'{_quote}?(\w+){_quote}?\.{_quote}(\w+){_quote}\s*({pattern})', clause):
+        if name in names:
+            found.setdefault(column, tail.upper())
+    return list(found.items())
+
+
+def suggest_index(model, sql, flag):
+    '''
+      models.Index candidato para o achado, ou None se nao houver colunas
+      indexaveis ou se um indice existente ja comeca por elas. Segue a regra
+      igualdade -> ordenacao -> intervalo: colunas comparadas por igualdade
+      primeiro; depois as do ORDER BY (se o achado for filesort) ou, se
+      houver, a primeira coluna filtrada por intervalo.
+    '''
+    opts = model._meta
+    table = opts.db_table
+    aliases = table_aliases(sql)
+    where = re_where.search(sql)
+    compared = _columns(where.group(1), table, aliases, r'<=|>=|<|>|=|IN\b|IS\b|BETWEEN\b') if where else []
+    equality = [column for column, op in compared if op in ('=', 'IN', 'IS')]
+    ranges = [column for column, op in compared if column not in equality]
+    if opts.pk.column in equality:
+        return None  # busca por chave primaria: poucas linhas, ordenar e barato
+
+    columns = list(equality)
+    order_by = re_order_by.search(sql) if flag == FILESORT else None
+    if order_by and not ranges:
+        ordering = [(c, d) for c, d in _columns(order_by.group(1), table, aliases, r'ASC|DESC|') if c not in columns]
+        # tudo DESC: o indice ascendente e lido de tras para frente
+        all_desc = all(direction == 'DESC' for _, direction in ordering)
+        columns += [column if all_desc or direction != 'DESC' else '-' + column for column, direction in ordering]
+    elif ranges:
+        columns.append(ranges[0])
+
+    by_column = {field.column: field.name for field in opts.concrete_fields}
+    fields = [
+        ('-' if column.startswith('-') else '') + by_column[column.lstrip('-')]
+        for column in columns if column.lstrip('-') in by_column
+    ]
+    if not fields or fields == [opts.pk.name]:
+        return None
+
+    for existing in _existing_indexes(model):
+        if existing[:len(fields)] == fields:
+            return None
+    index = models.Index(fields=fields, name='')
+    index.set_name_with_model(model)
+    return index
+
+
+def _existing_indexes(model):
+    opts = model._meta
+    yield [opts.pk.name]
+    for index in opts.indexes:
+        yield list(index.fields)
+    for fields in opts.unique_together:
+        yield list(fields)
+    for constraint in opts.constraints:
+        if isinstance(constraint, models.UniqueConstraint) and constraint.fields:
+            yield list(constraint.fields)
+    for field in opts.concrete_fields:
+        if field.db_index or field.unique:
+            yield [field.name]
@@ -0,0 +1,52 @@
+'''
+  Renderers do DRF para as APIs de catalogo.
+
+  ORJSONRenderer: mesmo JSON do JSONRenderer padrao (compacto, UTF-8, com
+  \\u2028/\\u2029 escapados), gerado pelo orjson quando o pacote esta
+  instalado. Tipos que o orjson nao conhece ou formataria diferente (datas,
+  Decimal, lazy strings) passam pelo encoder do DRF, entao o formato da
+  resposta nao muda. Sem orjson, ou com ?indent (API navegavel), usa o
+  JSONRenderer padrao.
+
+  MessagePackRenderer: o mesmo documento em MessagePack
+  (Accept: application/msgpack ou ?format=msgpack). So e registrado em
+  REST_FRAMEWORK quando o pacote msgpack esta instalado.
+'''
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # dependencia opcional
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # dependencia opcional
+    msgpack = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    if orjson is not None:
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=JSONEncoder().default, use_bin_type=True)
@@ -1,3 +1,470 @@
-from django.test import TestCase
+import gzip
+import importlib
+import json
+import os
+import pstats
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.paginator import EmptyPage
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import get_resolver
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+
+from core import warmup
+
+from . import compression, idempotency, renderers
+from .profiling import ProfilingMiddleware, list_profiles
+from .admin import EstimatedCountPaginator
+from .media import parse_range
+from .models import IdempotencyRecord
+from .transactions import TransactionTooLong, bounded_atomic
+from .views import serve_media
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-500', 100), (0, 99))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 100))
+        self.assertFalse(parse_range('bytes=100-', 100))
+
+    def test_empty_file_is_not_satisfiable(self):
+        self.assertIs(parse_range('bytes=-10', 0), False)
+        self.assertIs(parse_range('bytes=0-', 0), False)
+
+
+class ServeMediaSendfileTests(SimpleTestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name, MEDIA_SENDFILE_NGINX_PREFIX='/protected/'))
+        self.media_root = Path(media_root.name)
+        (self.media_root / 'foto nova?%.jpg').write_bytes(b'jpg')
+
+    def test_sendfile_headers_are_percent_encoded(self):
+        request = RequestFactory().get('/')
+        with override_settings(MEDIA_SENDFILE_BACKEND='nginx'):
+            response = serve_media(request, 'foto nova?%.jpg')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/foto%20nova%3F%25.jpg')
+        with override_settings(MEDIA_SENDFILE_BACKEND='xsendfile'):
+            response = serve_media(request, 'foto nova?%.jpg')
+        self.assertTrue(response['X-Sendfile'].endswith('/foto%20nova%3F%25.jpg'))
+
+
+@override_settings(WRITE_TRANSACTION_MAX_SECONDS=0.05)
+class BoundedAtomicTests(TestCase):
+    def record(self, key):
+        return IdempotencyRecord.objects.create(key=key, request_hash='', expires_at=timezone.now())
+
+    def test_long_transaction_is_rolled_back(self):
+        with self.assertRaises(TransactionTooLong):
+            with bounded_atomic():
+                self.record('longa')
+                time.sleep(0.06)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+    def test_nested_block_is_measured_from_the_outermost(self):
+        with self.assertRaises(TransactionTooLong):
+            with bounded_atomic():
+                self.record('externa')
+                time.sleep(0.06)
+                with bounded_atomic():
+                    self.record('interna')
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+    def test_outermost_checks_again_on_exit(self):
+        with self.assertRaises(TransactionTooLong):
+            with bounded_atomic():
+                with bounded_atomic():
+                    self.record('interna')
+                time.sleep(0.06)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+    def test_short_transaction_commits(self):
+        with bounded_atomic():
+            self.record('curta')
+        self.assertTrue(IdempotencyRecord.objects.exists())
+
+
+class IdempotentView(APIView):
+    authentication_classes = ()
+    permission_classes = ()
+    calls = 0
+
+    @idempotency.idempotent
+    def post(self, request):
+        IdempotentView.calls += 1
+        return Response({'call': IdempotentView.calls, 'data': request.data}, status=201)
+
+
+class IdempotencyTestsMixin:
+    store_path = None
+
+    def setUp(self):
+        IdempotentView.calls = 0
+        self.enterContext(override_settings(IDEMPOTENCY_STORE=self.store_path))
+        idempotency.get_store.cache_clear()
+        self.addCleanup(idempotency.get_store.cache_clear)
+        self.view = IdempotentView.as_view()
+
+    def post(self, data, key='chave-1'):
+        request = APIRequestFactory().post('/pedidos/', data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+        return self.view(request)
+
+    def key_for(self, raw_key):
+        request = APIRequestFactory().post('/pedidos/')
+        request.user = None
+        return idempotency._scoped_key(request, raw_key)
+
+    def hash_of(self, data):
+        request = APIRequestFactory().post('/pedidos/', data, format='json')
+        return idempotency._request_hash(Request(request, parsers=[JSONParser()]))
+
+    def test_replays_stored_response(self):
+        first = self.post({'sku': 'A'})
+        second = self.post({'sku': 'A'})
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second[idempotency.REPLAYED_HEADER], 'true')
+        self.assertEqual(IdempotentView.calls, 1)
+
+    def test_key_reused_with_other_payload_is_rejected(self):
+        self.post({'sku': 'A'})
+        response = self.post({'sku': 'B'})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(IdempotentView.calls, 1)
+
+    def test_other_key_runs_again(self):
+        self.post({'sku': 'A'})
+        self.post({'sku': 'A'}, key='chave-2')
+        self.assertEqual(IdempotentView.calls, 2)
+
+    def test_waits_for_concurrent_request(self):
+        store = idempotency.get_store()
+        key, request_hash = self.key_for('chave-1'), self.hash_of({'sku': 'A'})
+        self.assertIsNone(store.claim(key, request_hash))
+
+        def finish_concurrent(seconds):
+            # a requisicao que reservou a chave termina enquanto esta espera
+            store.complete(key, request_hash, 201, {'call': 'concorrente'})
+
+        with mock.patch.object(idempotency.time, 'sleep', side_effect=finish_concurrent) as sleep:
+            response = self.post({'sku': 'A'})
+        sleep.assert_called_once()
+        self.assertEqual(response.data, {'call': 'concorrente'})
+        self.assertEqual(IdempotentView.calls, 0)
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=0)
+    def test_gives_up_while_concurrent_request_holds_key(self):
+        idempotency.get_store().claim(self.key_for('chave-1'), self.hash_of({'sku': 'A'}))
+        response = self.post({'sku': 'A'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(IdempotentView.calls, 0)
+
+    def test_expired_key_runs_again(self):
+        self.post({'sku': 'A'})
+        with self.expired():
+            response = self.post({'sku': 'B'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['call'], 2)
+
+
+class DatabaseIdempotencyTests(IdempotencyTestsMixin, TestCase):
+    store_path = 'standard.idempotency.DatabaseIdempotencyStore'
+
+    @contextmanager
+    def expired(self):
+        IdempotencyRecord.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        yield
+
+    def test_purge_expired(self):
+        self.post({'sku': 'A'})
+        store = idempotency.get_store()
+        self.assertEqual(store.purge_expired(), 0)
+        with self.expired():
+            self.assertEqual(store.purge_expired(), 1)
+
+
+class CacheIdempotencyTests(IdempotencyTestsMixin, TestCase):
+    store_path = 'standard.idempotency.CacheIdempotencyStore'
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(caches[settings.IDEMPOTENCY_CACHE_ALIAS].clear)
+
+    @contextmanager
+    def expired(self):
+        later = time.time() + settings.IDEMPOTENCY_TTL_SECONDS + 1
+        with mock.patch('time.time', return_value=later):
+            yield
+
+
+@override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1)
+class EstimatedCountPaginatorTests(TestCase):
+    def setUp(self):
+        for key in 'abcde':
+            IdempotencyRecord.objects.create(key=key, request_hash='', expires_at=timezone.now())
+        self.queryset = IdempotencyRecord.objects.order_by('key')
+
+    def paginator(self, estimate, queryset=None):
+        self.enterContext(mock.patch('standard.admin.estimated_row_count', return_value=estimate))
+        return EstimatedCountPaginator(self.queryset if queryset is None else queryset, 2)
+
+    def test_uses_estimate_without_filters(self):
+        paginator = self.paginator(20)
+        self.assertEqual(paginator.count, 20)
+        self.assertEqual([r.key for r in paginator.page(2).object_list], ['c', 'd'])
+        self.assertEqual(paginator.count, 20)
+
+    def test_page_past_the_real_end_is_clamped(self):
+        paginator = self.paginator(20)
+        page = paginator.page(10)
+        self.assertEqual(page.number, 3)
+        self.assertEqual([r.key for r in page.object_list], ['e'])
+        self.assertEqual(paginator.count, 5)
+        self.assertEqual(paginator.num_pages, 3)
+
+    def test_page_past_a_low_estimate_is_served(self):
+        paginator = self.paginator(2)
+        page = paginator.page(3)
+        self.assertEqual([r.key for r in page.object_list], ['e'])
+        self.assertEqual(paginator.count, 5)
+
+    def test_filtered_or_small_tables_count_exactly(self):
+        paginator = self.paginator(20, self.queryset.filter(key__in='abc'))
+        self.assertEqual(paginator.count, 3)
+        with self.assertRaises(EmptyPage):
+            paginator.page(3)
+        with override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=100):
+            self.assertEqual(self.paginator(20).count, 5)
+
+    def test_invalid_pages_still_raise(self):
+        paginator = self.paginator(20)
+        with self.assertRaises(EmptyPage):
+            paginator.page(0)
+
+
+class WarmUpTests(SimpleTestCase):
+    def test_warms_url_resolver_and_model_meta(self):
+        opts = IdempotencyRecord._meta
+        opts._expire_cache()
+        with mock.patch.dict(os.environ, {'DJANGO_WARMUP': '1'}):
+            warmup.warm_up(connect_db=False)
+        self.assertTrue(get_resolver()._populated)
+        for cache in ('_get_fields_cache', '_forward_fields_map', 'fields_map', 'related_objects'):
+            self.assertIn(cache, opts.__dict__)
+
+    def test_database_only_with_flag(self):
+        with mock.patch.object(warmup, 'warm_database') as warm_database:
+            with mock.patch.dict(os.environ, {'DJANGO_WARMUP': '1', 'DJANGO_WARMUP_DB': '0'}):
+                warmup.warm_up()
+            with mock.patch.dict(os.environ, {'DJANGO_WARMUP': '1', 'DJANGO_WARMUP_DB': '1'}):
+                warmup.warm_up(connect_db=False)
+            warm_database.assert_not_called()
+            with mock.patch.dict(os.environ, {'DJANGO_WARMUP': '1', 'DJANGO_WARMUP_DB': '1'}):
+                warmup.warm_up()
+            warm_database.assert_called_once()
+
+    def test_disabled(self):
+        with mock.patch.object(warmup, 'warm_urls') as warm_urls:
+            with mock.patch.dict(os.environ, {'DJANGO_WARMUP': '0'}):
+                warmup.warm_up()
+        warm_urls.assert_not_called()
+
+    def test_asgi_disables_persistent_connections(self):
+        project_settings = importlib.import_module('core.settings')
+        for flag, conn_max_age in (('1', 0), ('0', 60)):
+            with mock.patch.dict(os.environ, {'DJANGO_ASGI': flag, 'DB_CONN_MAX_AGE': '60'}):
+                importlib.reload(project_settings)
+            self.assertEqual(project_settings.DATABASES['default']['CONN_MAX_AGE'], conn_max_age)
+
+
+class ContentView(APIView):
+    authentication_classes = ()
+    permission_classes = ()
+
+    def get(self, request):
+        return Response({'items': [{'name': f'produto {i}', 'price': '9.90'} for i in range(20)]})
+
+
+class RendererTests(SimpleTestCase):
+    data = {
+        'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'price': Decimal('9.90'),
+        'created_at': datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=dt_timezone.utc),
+        'name': 'linha\u2028nova ção',
+        1: 'chave inteira',
+    }
+
+    def test_orjson_matches_the_default_renderer(self):
+        self.assertEqual(renderers.ORJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+
+    def test_falls_back_without_orjson(self):
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(renderers.ORJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+
+    def test_indent_uses_the_default_renderer(self):
+        rendered = renderers.ORJSONRenderer().render(self.data, 'application/json; indent=2')
+        self.assertEqual(rendered, JSONRenderer().render(self.data, 'application/json; indent=2'))
+
+    @skipUnless(renderers.msgpack, 'msgpack nao instalado')
+    def test_msgpack_carries_the_json_document(self):
+        packed = renderers.MessagePackRenderer().render(self.data)
+        self.assertEqual(
+            renderers.msgpack.unpackb(packed, strict_map_key=False),
+            {int(k) if k == '1' else k: v for k, v in json.loads(JSONRenderer().render(self.data)).items()},
+        )
+
+    @skipUnless(renderers.msgpack, 'msgpack nao instalado')
+    def test_content_negotiation(self):
+        view = ContentView.as_view()
+        response = view(APIRequestFactory().get('/', HTTP_ACCEPT='application/msgpack'))
+        response.render()
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(renderers.msgpack.unpackb(response.content)['items'][0]['price'], '9.90')
+
+        response = view(APIRequestFactory().get('/', {'format': 'msgpack'}))
+        self.assertEqual(response.accepted_media_type, 'application/msgpack')
+
+        response = view(APIRequestFactory().get('/', HTTP_ACCEPT='application/json'))
+        response.render()
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(response.content)['items'][0]['price'], '9.90')
+
+    def test_msgpack_is_registered_only_when_installed(self):
+        project_settings = importlib.import_module('core.settings')
+        msgpack_renderer = 'standard.renderers.MessagePackRenderer'
+        try:
+            with mock.patch('importlib.util.find_spec', return_value=None):
+                importlib.reload(project_settings)
+            self.assertNotIn(msgpack_renderer, project_settings.REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'])
+        finally:
+            importlib.reload(project_settings)
+        if renderers.msgpack is not None:
+            self.assertIn(msgpack_renderer, project_settings.REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'])
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+    body = json.dumps([{'name': f'produto {i}'} for i in range(50)]).encode()
+
+    def process(self, response, accept_encoding='gzip, deflate, br'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return compression.CompressionMiddleware(lambda request: response)(request)
+
+    def json_response(self):
+        return HttpResponse(self.body, content_type='application/json')
+
+    @skipUnless(compression.brotli, 'brotli nao instalado')
+    def test_brotli_when_accepted(self):
+        response = self.process(self.json_response())
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(compression.brotli.decompress(response.content), self.body)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+
+    @skipUnless(compression.brotli, 'brotli nao instalado')
+    def test_brotli_streaming(self):
+        response = self.process(StreamingHttpResponse(
+            iter([self.body[:100], self.body[100:]]), content_type='application/json',
+        ))
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(b''.join(response.streaming_content)), self.body)
+
+    def test_gzip_when_brotli_is_not_accepted(self):
+        response = self.process(self.json_response(), accept_encoding='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.body)
+
+    def test_html_stays_on_gzip(self):
+        response = self.process(HttpResponse(self.body, content_type='text/html'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_falls_back_to_gzip_without_brotli(self):
+        with mock.patch.object(compression, 'brotli', None):
+            response = self.process(self.json_response())
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_ranged_and_small_responses_pass_through(self):
+        ranged = self.json_response()
+        ranged['Accept-Ranges'] = 'bytes'
+        self.assertFalse(self.process(ranged).has_header('Content-Encoding'))
+        small = HttpResponse(b'{}', content_type='application/json')
+        self.assertFalse(self.process(small).has_header('Content-Encoding'))
+
+
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        profiles = tempfile.TemporaryDirectory()
+        self.addCleanup(profiles.cleanup)
+        self.enterContext(override_settings(
+            PROFILING_ENABLED=True, PROFILING_DIR=profiles.name, PROFILING_SAMPLE_RATE=0.0, PROFILING_INTERVAL_MS=1,
+        ))
+
+    def get_response(self, request):
+        IdempotencyRecord.objects.count()
+        time.sleep(0.03)
+        return HttpResponse('ok')
+
+    def request(self, is_staff=True, header='1'):
+        request = RequestFactory().get('/api/v1/products/', HTTP_X_PROFILE=header)
+        request.user = SimpleNamespace(is_staff=is_staff)
+        return ProfilingMiddleware(self.get_response)(request)
+
+    def test_disabled_middleware_is_removed(self):
+        with override_settings(PROFILING_ENABLED=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(self.get_response)
+
+    def test_records_timings_and_queries(self):
+        response = self.request()
+        [profile] = list_profiles()
+        self.assertEqual(response['X-Profile-Id'], profile.name)
+        self.assertEqual(profile.suffix, '.collapsed')
+        self.assertIn('[sql];SELECT COUNT', profile.read_text())
+
+        timings = json.loads(profile.with_suffix('.sql.json').read_text())
+        self.assertEqual(timings['path'], '/api/v1/products/')
+        self.assertGreaterEqual(timings['elapsed_ms'], 30)
+        self.assertEqual(len(timings['queries']), 1)
+        self.assertIn('COUNT', timings['queries'][0]['sql'])
+
+    @override_settings(PROFILING_MODE='cprofile')
+    def test_cprofile_mode(self):
+        self.request()
+        [profile] = list_profiles()
+        self.assertEqual(profile.suffix, '.prof')
+        self.assertTrue(pstats.Stats(str(profile)).total_tt > 0)
+
+    def test_header_only_for_staff(self):
+        response = self.request(is_staff=False)
+        self.assertFalse(response.has_header('X-Profile-Id'))
+        self.assertEqual(list_profiles(), [])
+
+    @override_settings(PROFILING_MAX_FILES=1)
+    def test_keeps_only_the_newest_profiles(self):
+        self.request()
+        self.request()
+        self.assertEqual(len(list_profiles()), 1)
+        self.assertEqual(len(list(Path(settings.PROFILING_DIR).iterdir())), 2)
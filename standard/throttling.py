@@ -0,0 +1,213 @@
+'''
+  Limite de requisicoes por cliente (token bucket) e descarte de carga.
+
+  TokenBucketThrottle: throttle do DRF por escopo (throttle_scope da view,
+  taxas em REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], formato "30/min").
+  Cada cliente tem um balde com capacidade = numero de requisicoes da taxa,
+  reabastecido continuamente (30/min -> 0.5 ficha/s): rajadas curtas passam,
+  abuso sustentado recebe 429 com Retry-After. O cliente e identificado por:
+    1. usuario autenticado, 2. credencial aceita por uma authentication class
+       do DRF (request.auth, ex.: token/API key), 3. IP.
+  Headers nao autenticados (ex.: um X-API-Key qualquer) nunca viram
+  identidade: trocando o valor a cada requisicao o cliente ganharia um balde
+  cheio por requisicao.
+  Com o cache THROTTLE_CACHE_ALIAS em Redis, o balde fica no Redis e e
+  atualizado atomicamente por um script Lua (compartilhado entre workers);
+  com outro backend, ou se o Redis falhar, cai para um balde em memoria
+  local do processo.
+
+  LoadSheddingMixin: limita as requisicoes simultaneas (por processo) das
+  views pesadas em banco; acima de LOAD_SHEDDING_LIMITS[escopo] a requisicao
+  recebe 503 com Retry-After na hora, em vez de entrar na fila do pool.
+  Com workers de thread unica o limite nunca e atingido; ele vale para
+  workers com threads (gunicorn gthread, runserver).
+'''
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import SimpleRateThrottle
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] = balde; ARGV = capacidade, fichas/s. Retorna {permitido, espera}.
+TOKEN_BUCKET_LUA = '''
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or capacity
+local ts = tonumber(data[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+else
+  wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(wait)}
+'''
+
+
+class LocalTokenBuckets:
+    '''
+      Baldes em memoria do processo (fallback sem Redis).
+    '''
+    MAX_KEYS = 100_000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def take(self, key, capacity, rate):
+        now = time.monotonic()
+        with self.lock:
+            tokens, ts = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - ts) * rate)
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now)
+                allowed, wait = True, 0.0
+            else:
+                self.buckets[key] = (tokens, now)
+                allowed, wait = False, (1 - tokens) / rate
+            if len(self.buckets) > self.MAX_KEYS:
+                self._prune(now)
+        return allowed, wait
+
+    def _prune(self, now):
+        # baldes parados ha mais de 1h ja estariam cheios: podem ser esquecidos
+        self.buckets = {k: v for k, v in self.buckets.items() if now - v[1] < 3600}
+
+
+class RedisTokenBuckets:
+    def __init__(self, cache):
+        self.cache = cache
+        self.script = None
+
+    def take(self, key, capacity, rate):
+        client = self.cache._cache.get_client(key, write=True)
+        if self.script is None:
+            self.script = client.register_script(TOKEN_BUCKET_LUA)
+        allowed, wait = self.script(keys=[self.cache.make_key(key)], args=[capacity, rate], client=client)
+        return bool(int(allowed)), float(wait)
+
+
+_local_buckets = LocalTokenBuckets()
+_shared_buckets = None
+
+
+def get_buckets():
+    global _shared_buckets
+    if _shared_buckets is None:
+        cache = caches[settings.THROTTLE_CACHE_ALIAS]
+        _shared_buckets = RedisTokenBuckets(cache) if isinstance(cache, RedisCache) else _local_buckets
+    return _shared_buckets
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    '''
+      Views sem throttle_scope (ou com escopo sem taxa configurada) nao sao limitadas.
+    '''
+    scope_attr = 'throttle_scope'
+
+    def __init__(self):
+        # a taxa depende da view; e resolvida em allow_request
+        pass
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = f'user:{request.user.pk}'
+        elif request.auth is not None:
+            ident = 'auth:' + hashlib.sha256(str(request.auth).encode()).hexdigest()[:32]
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+        return f'throttle:{self.scope}:{ident}'
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, self.scope_attr, None)
+        if not self.scope or self.scope not in self.THROTTLE_RATES:
+            return True
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+        key = self.get_cache_key(request, view)
+        capacity, refill = self.num_requests, self.num_requests / self.duration
+        buckets = get_buckets()
+        try:
+            allowed, self._wait = buckets.take(key, capacity, refill)
+        except Exception:
+            if buckets is _local_buckets:
+                raise
+            logger.warning('Throttle: Redis indisponível, usando o balde local.', exc_info=True)
+            allowed, self._wait = _local_buckets.take(key, capacity, refill)
+        return allowed
+
+    def wait(self):
+        return self._wait
+
+
+class ServiceOverloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _('Servidor sobrecarregado, tente novamente em instantes.')
+    default_code = 'service_overloaded'
+
+    def __init__(self, wait, detail=None, code=None):
+        # o exception_handler do DRF converte `wait` no header Retry-After
+        self.wait = wait
+        super().__init__(detail, code)
+
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+def get_semaphore(scope):
+    with _semaphores_lock:
+        if scope not in _semaphores:
+            _semaphores[scope] = threading.BoundedSemaphore(settings.LOAD_SHEDDING_LIMITS[scope])
+        return _semaphores[scope]
+
+
+class LoadSheddingMixin:
+    '''
+      Para APIView/ViewSet. load_shedding_scope=None desliga; em ViewSets,
+      load_shedding_actions restringe as actions afetadas.
+    '''
+    load_shedding_scope = 'db'
+    load_shedding_actions = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        scope = self.load_shedding_scope
+        if not scope or scope not in settings.LOAD_SHEDDING_LIMITS:
+            return
+        if self.load_shedding_actions is not None and getattr(self, 'action', None) not in self.load_shedding_actions:
+            return
+        semaphore = get_semaphore(scope)
+        if not semaphore.acquire(blocking=False):
+            raise ServiceOverloaded(wait=settings.LOAD_SHEDDING_RETRY_AFTER)
+        self._load_shedding_semaphore = semaphore
+
+    def dispatch(self, request, *args, **kwargs):
+        # libera a vaga mesmo quando a exceção escapa do handle_exception (500)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            semaphore = getattr(self, '_load_shedding_semaphore', None)
+            if semaphore is not None:
+                self._load_shedding_semaphore = None
+                semaphore.release()
@@ -0,0 +1,46 @@
+'''
+  transaction.atomic com duracao maxima.
+
+  O feed de alteracoes (products/changes.py) ordena por updated_at, que e
+  carimbado pelo relogio da aplicacao quando o statement roda, nao quando a
+  transacao confirma. Ele so e correto se nenhuma escrita no catalogo demorar
+  mais que CHANGE_FEED_SETTLE_SECONDS entre carimbar e confirmar. bounded_atomic
+  garante isso: se a transacao passar de WRITE_TRANSACTION_MAX_SECONDS ela e
+  desfeita (503) em vez de confirmar linhas com carimbo antigo.
+
+  O limite vale para a transacao inteira: um bounded_atomic aninhado mede a
+  partir do inicio do bounded_atomic mais externo, e o externo confere de novo
+  na saida. Toda escrita no catalogo precisa estar dentro de um (API, lote e
+  admin via standard.admin.BoundedTransactionAdminMixin); um transaction.atomic
+  comum por fora nao e medido.
+'''
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class TransactionTooLong(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _('A operação demorou demais e foi desfeita; tente novamente (em lotes menores).')
+    default_code = 'transaction_too_long'
+
+
+@contextmanager
+def bounded_atomic(using=None):
+    connection = transaction.get_connection(using)
+    outermost = getattr(connection, 'bounded_atomic_started', None) is None
+    if outermost:
+        connection.bounded_atomic_started = time.monotonic()
+    try:
+        with transaction.atomic(using=using):
+            yield
+            if time.monotonic() - connection.bounded_atomic_started > settings.WRITE_TRANSACTION_MAX_SECONDS:
+                raise TransactionTooLong()
+    finally:
+        if outermost:
+            connection.bounded_atomic_started = None
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from .views import profile_list, profile_download
+
+urlpatterns = [
+    path('', profile_list, name='profile-list'),
+    path('<str:name>/', profile_download, name='profile-download'),
+]
@@ -1,3 +1,118 @@
+import mimetypes
+import os
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import ImproperlyConfigured, SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import render
+from django.utils import timezone
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from .media import SENDFILE_BACKENDS, RangeFile, file_etag, parse_range
+from .profiling import SQL_SUFFIX, list_profiles
+
+
+@staff_member_required
+def profile_list(request):
+    '''
+      Lista os perfis gravados pelo ProfilingMiddleware (standard/profiling.py).
+    '''
+    profiles = []
+    for path in list_profiles():
+        stat = path.stat()
+        profiles.append({
+            'name': path.name,
+            'sql_name': path.with_suffix(SQL_SUFFIX).name,
+            'size': stat.st_size,
+            'modified': datetime.fromtimestamp(stat.st_mtime, tz=timezone.get_current_timezone()),
+        })
+
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Request profiles',
+        'profiles': profiles,
+    }
+    return render(request, 'standard/profiles.html', context)
+
+
+@staff_member_required
+def profile_download(request, name):
+    # só serve arquivos que estão na listagem (evita path traversal)
+    for path in list_profiles():
+        for candidate in (path, path.with_suffix(SQL_SUFFIX)):
+            if candidate.name == name:
+                return FileResponse(open(candidate, 'rb'), as_attachment=True, filename=candidate.name)
+    raise Http404(name)
+
+
+@require_safe
+def serve_media(request, path):
+    '''
+      Arquivos de MEDIA_ROOT com ETag, 304, Range e sendfile (ver standard/media.py).
+    '''
+    try:
+        fullpath = Path(safe_join(settings.MEDIA_ROOT, path))
+        stat = fullpath.stat()
+    except (SuspiciousFileOperation, OSError):
+        raise Http404(path)
+    if not fullpath.is_file():
+        raise Http404(path)
+
+    headers = HttpResponse()
+    headers['ETag'] = file_etag(fullpath, stat)
+    headers['Last-Modified'] = http_date(stat.st_mtime)
+    headers['Accept-Ranges'] = 'bytes'
+    patch_cache_control(headers, public=True, max_age=settings.MEDIA_CACHE_MAX_AGE)
+    conditional = get_conditional_response(
+        request, etag=headers['ETag'], last_modified=int(stat.st_mtime), response=headers,
+    )
+    if conditional is not headers:
+        return conditional
+
+    content_type, encoding = mimetypes.guess_type(fullpath.name)
+    content_type = content_type or 'application/octet-stream'
+
+    backend = settings.MEDIA_SENDFILE_BACKEND
+    if backend and backend not in SENDFILE_BACKENDS:
+        raise ImproperlyConfigured(f'MEDIA_SENDFILE_BACKEND deve ser um de {SENDFILE_BACKENDS}.')
+    if backend:
+        # o proxy entrega o corpo (e trata o Range); aqui so vao os headers,
+        # com o caminho percent-encoded (espacos, acentos, "?" e "%" no nome)
+        response = HttpResponse(content_type=content_type)
+        if backend == 'nginx':
+            relative = fullpath.relative_to(os.path.abspath(settings.MEDIA_ROOT)).as_posix()
+            response['X-Accel-Redirect'] = settings.MEDIA_SENDFILE_NGINX_PREFIX + quote(relative)
+        else:
+            response['X-Sendfile'] = quote(str(fullpath))
+    else:
+        status, start, length = 200, 0, stat.st_size
+        byte_range = request.headers.get('Range')
+        if_range = request.headers.get('If-Range')
+        if byte_range and (not if_range or if_range == headers['ETag']):
+            byte_range = parse_range(byte_range, stat.st_size)
+            if byte_range is False:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{stat.st_size}'
+                return response
+            if byte_range:
+                start, end = byte_range
+                status, length = 206, end - start + 1
+
+        response = FileResponse(RangeFile(open(fullpath, 'rb'), start, length), status=status, content_type=content_type)
+        response['Content-Length'] = str(length)
+        if status == 206:
+            response['Content-Range'] = f'bytes {start}-{start + length - 1}/{stat.st_size}'
 
-# Create your views here.
+    if encoding:
+        response['Content-Encoding'] = encoding
+    for header in ('ETag', 'Last-Modified', 'Accept-Ranges', 'Cache-Control'):
+        response[header] = headers[header]
+    return response
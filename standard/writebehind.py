@@ -0,0 +1,309 @@
+'''
+  Fila write-behind em processo: a requisicao so enfileira o registro e uma
+  thread de fundo grava em bulk quando a fila atinge max_batch itens ou a
+  cada flush_seconds, o que vier primeiro.
+
+  Durabilidade: antes de ser aceito, cada registro (dict serializavel em
+  JSON) e anexado a um spool local append-only, um arquivo por segmento:
+
+      <spool_dir>/<name>.<pid>.<token>.<seq>.spool
+
+  O processo dono mantem um flock exclusivo no segmento atual ate gravar seus
+  registros no banco e apagar o arquivo. Cada flush troca de segmento e libera
+  o anterior: o que nao foi gravado volta a ser anexado ao segmento novo, entao
+  ha sempre um unico arquivo aberto por fila. Segmentos sem dono (worker que
+  caiu ou foi reiniciado) sao reenviados ao replay_handler por recover(),
+  chamado no inicio de cada fila e pelos comandos de manutencao (ex.:
+  recover_order_spool). O replay precisa ser idempotente (ids gerados antes de
+  enfileirar), ja que o segmento pode ter sido gravado antes da queda.
+
+  Falhas: um lote que falha e regravado registro a registro, para que um
+  registro ruim nao segure os demais. O registro que falhou volta para a fila
+  com backoff exponencial e, depois de max_attempts falhas, vai para o
+  dead-letter <spool_dir>/<name>.dead (uma linha JSON por registro, com o
+  erro). Erros de conexao (OperationalError/InterfaceError: banco fora do ar,
+  deadlock) tambem usam backoff, mas nao contam tentativas nem dividem o lote.
+'''
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.db import InterfaceError, OperationalError, close_old_connections, connections
+
+logger = logging.getLogger(__name__)
+
+SPOOL_SUFFIX = '.spool'
+DEAD_LETTER_SUFFIX = '.dead'
+MAX_BACKOFF_SECONDS = 300
+
+
+def _encode(record):
+    return (json.dumps(record, separators=(',', ':')) + '\n').encode()
+
+
+def _is_outage(exc):
+    return isinstance(exc, (OperationalError, InterfaceError))
+
+
+class SpoolSegment:
+    def __init__(self, path):
+        # trava antes de o arquivo aparecer com o nome final, para o recover()
+        # de outro processo nunca pegar um segmento recem-criado
+        temp_path = path.with_suffix('.new')
+        self.path = path
+        self.file = open(temp_path, 'ab')
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        os.replace(temp_path, path)
+
+    def append(self, data, fsync):
+        self.file.write(data)
+        self.file.flush()
+        if fsync:
+            os.fsync(self.file.fileno())
+
+    def discard(self):
+        self.path.unlink(missing_ok=True)
+        self.file.close()
+
+    def release(self):
+        # mantem o arquivo para o recover(), so solta o flock
+        self.file.close()
+
+
+def read_spool(path):
+    '''
+      Registros de um segmento; uma ultima linha incompleta (queda no meio
+      da escrita) e ignorada.
+    '''
+    records = []
+    with open(path, 'rb') as spool:
+        for line in spool:
+            if not line.endswith(b'\n'):
+                break
+            records.append(json.loads(line))
+    return records
+
+
+class PendingRecord:
+    __slots__ = ('record', 'attempts', 'failures', 'retry_at')
+
+    def __init__(self, record):
+        self.record = record
+        self.attempts = 0   # falhas do proprio registro (levam ao dead-letter)
+        self.failures = 0   # todas as falhas, inclusive de conexao (backoff)
+        self.retry_at = 0.0
+
+
+class WriteBehindQueue:
+    def __init__(self, name, handler, spool_dir, max_batch=200, flush_seconds=1.0, fsync=True,
+                 max_attempts=5, replay_handler=None):
+        self.name = name
+        self.handler = handler
+        self.replay_handler = replay_handler or handler
+        self.spool_dir = Path(spool_dir)
+        self.max_batch = max_batch
+        self.flush_seconds = flush_seconds
+        self.fsync = fsync
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        self._thread = None
+        self._atexit = False
+
+    @property
+    def dead_letter_path(self):
+        return self.spool_dir / f'{self.name}{DEAD_LETTER_SUFFIX}'
+
+    def _start(self):
+        # preguicoso e por pid: depois de um fork (gunicorn --preload) a
+        # thread e o spool do processo pai nao existem no filho
+        self._pid = os.getpid()
+        self._token = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._pending = []
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self._segment = self._new_segment()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(self._stop,), name=f'write-behind-{self.name}', daemon=True,
+        )
+        self._thread.start()
+        if not self._atexit:
+            atexit.register(self.close)
+            self._atexit = True
+
+    def _new_segment(self):
+        self._seq += 1
+        return SpoolSegment(self.spool_dir / f'{self.name}.{self._pid}.{self._token}.{self._seq}{SPOOL_SUFFIX}')
+
+    def put(self, record):
+        line = _encode(record)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start()
+            self._segment.append(line, self.fsync)
+            self._pending.append(PendingRecord(record))
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return [entry.record for entry in self._pending] if self._pid == os.getpid() else []
+
+    def flush(self):
+        '''
+          Grava os registros pendentes cujo backoff ja venceu. Retorna quantos
+          foram gravados; os que falharam voltam para a fila (ou vao para o
+          dead-letter) e o segmento anterior e liberado.
+        '''
+        with self._flush_lock:
+            now = time.monotonic()
+            with self._lock:
+                if self._pid != os.getpid() or not any(e.retry_at <= now for e in self._pending):
+                    return 0
+                segment = self._new_segment()
+                entries, self._pending = self._pending, []
+                previous, self._segment = self._segment, segment
+
+            due = [entry for entry in entries if entry.retry_at <= now]
+            retry = [entry for entry in entries if entry.retry_at > now]
+            written, failed = self._write(self.handler, due)
+            for entry, exc in failed:
+                entry.failures += 1
+                if not _is_outage(exc):
+                    entry.attempts += 1
+                if entry.attempts >= self.max_attempts:
+                    self._dead_letter(entry.record, exc)
+                else:
+                    entry.retry_at = now + min(self.flush_seconds * 2 ** entry.failures, MAX_BACKOFF_SECONDS)
+                    retry.append(entry)
+
+            if retry:
+                with self._lock:
+                    self._segment.append(b''.join(_encode(entry.record) for entry in retry), self.fsync)
+                    self._pending[:0] = retry
+            previous.discard()
+            return written
+
+    def _write(self, handler, entries):
+        '''
+          (gravados, [(entrada, excecao)]): se o lote falhar por outro motivo
+          que nao conexao, cada registro e tentado sozinho.
+        '''
+        if not entries:
+            return 0, []
+        try:
+            handler([entry.record for entry in entries])
+            return len(entries), []
+        except Exception as exc:
+            if len(entries) == 1 or _is_outage(exc):
+                logger.exception('Falha ao gravar %d registro(s) da fila %s.', len(entries), self.name)
+                return 0, [(entry, exc) for entry in entries]
+            logger.warning('Lote de %d registro(s) da fila %s falhou; gravando um a um.', len(entries), self.name)
+
+        written, failed = 0, []
+        for entry in entries:
+            try:
+                handler([entry.record])
+                written += 1
+            except Exception as exc:
+                logger.exception('Falha ao gravar o registro %s da fila %s.', entry.record.get('id'), self.name)
+                failed.append((entry, exc))
+        return written, failed
+
+    def _dead_letter(self, record, exc):
+        line = _encode({'record': record, 'error': f'{type(exc).__name__}: {exc}'})
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.dead_letter_path, 'ab') as dead:
+            fcntl.flock(dead, fcntl.LOCK_EX)
+            dead.write(line)
+            dead.flush()
+            os.fsync(dead.fileno())
+        logger.error('Registro %s da fila %s movido para %s.', record.get('id'), self.name, self.dead_letter_path)
+
+    def close(self):
+        '''
+          Para a thread e faz o flush final (encerramento normal do worker).
+          Sem pendencias o segmento e removido; com pendencias ele fica no
+          disco para o recover(). Um put() depois disso reinicia a fila.
+        '''
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            thread = self._thread
+        self._stop.set()
+        self._wake.set()
+        if thread is not threading.current_thread():
+            thread.join(timeout=max(5.0, self.flush_seconds * 2))
+
+        self.flush()
+        with self._lock:
+            if self._pending:
+                self._segment.release()
+            else:
+                self._segment.discard()
+            self._pending = []
+            self._pid = None
+
+    def _run(self, stop):
+        try:
+            self.recover()
+        except Exception:
+            logger.exception('Falha ao recuperar o spool da fila %s.', self.name)
+        try:
+            while not stop.is_set():
+                self._wake.wait(self.flush_seconds)
+                self._wake.clear()
+                if stop.is_set():
+                    break
+                try:
+                    # a thread nao passa pelo ciclo de requisicao que recicla a conexao
+                    close_old_connections()
+                    self.flush()
+                except Exception:
+                    logger.exception('Falha no flush da fila %s.', self.name)
+        finally:
+            connections.close_all()
+
+    def recover(self):
+        '''
+          Reenvia ao replay_handler os segmentos orfaos desta fila. Registros
+          que falham sozinhos vao para o dead-letter; com o banco fora do ar o
+          segmento fica para a proxima recuperacao. Retorna o numero de
+          registros recuperados.
+        '''
+        recovered = 0
+        for path in sorted(self.spool_dir.glob(f'{self.name}.*{SPOOL_SUFFIX}')):
+            try:
+                spool = open(path, 'rb')
+            except FileNotFoundError:
+                continue
+            with spool:
+                try:
+                    fcntl.flock(spool, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # dono vivo (ou outro processo ja recuperando)
+                if not path.exists():
+                    continue
+                records = read_spool(path)
+                for start in range(0, len(records), self.max_batch):
+                    chunk = [PendingRecord(record) for record in records[start:start + self.max_batch]]
+                    written, failed = self._write(self.replay_handler, chunk)
+                    for entry, exc in failed:
+                        if _is_outage(exc):
+                            raise exc
+                        self._dead_letter(entry.record, exc)
+                    recovered += written
+                path.unlink()
+        if recovered:
+            logger.warning('Fila %s: %d registro(s) recuperado(s) do spool.', self.name, recovered)
+        return recovered